@@ -1,9 +1,37 @@
 import pandas as pd
 import json
 import os
+import sys
+
+from mapviewer.id_registry import IdRegistry, registry_path, row_hash
+
+# Usage: python csv-json.py [--stable-ids[=ids.json]] [--key-column=NAME] [framework.csv] [output.json]
+# Each regional catalogue is built from its own CSV into its own JSON file.
+#
+# By default IDs are numbered by position ("01-02-03-land-cover"). With
+# --stable-ids they come from a registry (default <output>.ids.json, commit it
+# with the output) and do not change when rows are inserted, removed or
+# reordered; see mapviewer/id_registry.py. --key-column names a column with a
+# unique key per indicator to match rows by instead of their names.
+options = {}
+args = []
+for arg in sys.argv[1:]:
+    if arg.startswith("--"):
+        name, _, value = arg[2:].partition("=")
+        options[name] = value
+    else:
+        args.append(arg)
+csv_path = args[0] if len(args) > 0 else "/Users/niallbell/Desktop/EcoScapes_Indicator_Framework_CURRENT-IMPORT.csv"
+output_path = args[1] if len(args) > 1 else "ecoscapes_framework.json"
+key_column = options.get("key-column") or None
+
+registry = None
+if "stable-ids" in options:
+    ids_path = options["stable-ids"] or registry_path(output_path)
+    # A first run seeds the registry from the previous output, keeping its IDs
+    registry = IdRegistry.load(ids_path, previous_output=output_path)
 
 # Load CSV and preserve order
-csv_path = "/Users/niallbell/Desktop/EcoScapes_Indicator_Framework_CURRENT-IMPORT.csv"
 df = pd.read_csv(csv_path, encoding='utf-8')
 
 # Ensure clean column names
@@ -78,6 +106,16 @@ for i, theme in enumerate(df['Theme'].drop_duplicates()):
     if pd.notna(theme):
         theme_order[theme] = i + 1
 
+if registry is not None:
+    registry.expect(
+        registry.indicator_key(
+            slugify(row['Theme']), slugify(row['Subtheme']), slugify(clean_text(row.get('Indicator', ''))),
+            clean_text(row.get(key_column, "")) if key_column else None,
+        )
+        for _, row in df.iterrows()
+        if pd.notna(row['Theme']) and pd.notna(row['Subtheme']) and clean_text(row.get('Indicator', ''))
+    )
+
 # Process themes in order of appearance
 themes = []
 for theme_name, theme_group in df.groupby('Theme', sort=False):
@@ -89,8 +127,13 @@ for theme_name, theme_group in df.groupby('Theme', sort=False):
         theme_group['ThemeInfo'].iloc[0]) if 'ThemeInfo' in theme_group.columns else f"Description for {theme_name}"
     theme_icon = clean_text(theme_group['Theme Icon'].iloc[0]) if 'Theme Icon' in theme_group.columns else "fa-seedling"
 
+    if registry is not None:
+        theme_id = registry.theme_id(theme_id)
+    else:
+        theme_id = f"{theme_order[theme_name]:02d}-{theme_id}"
+
     theme_obj = {
-        "id": f"{theme_order[theme_name]:02d}-{theme_id}",
+        "id": theme_id,
         "name": f"{theme_order[theme_name]}.0 {theme_name}",
         "description": theme_info,
         "icon": theme_icon,
@@ -103,14 +146,18 @@ for theme_name, theme_group in df.groupby('Theme', sort=False):
         if pd.isna(subtheme_name):
             continue
 
-        subtheme_id = slugify(subtheme_name)
+        subtheme_slug = slugify(subtheme_name)
+        if registry is not None:
+            subtheme_id = registry.subtheme_id(slugify(theme_name), subtheme_slug)
+        else:
+            subtheme_id = f"{theme_order[theme_name]:02d}-{subtheme_counter:02d}-{subtheme_slug}"
         subtheme_info = clean_text(subtheme_group['SubthemeInfo'].iloc[
                                        0]) if 'SubthemeInfo' in subtheme_group.columns else f"Description for {subtheme_name}"
         subtheme_icon = clean_text(
             subtheme_group['SubThemeIcon'].iloc[0]) if 'SubThemeIcon' in subtheme_group.columns else "fa-leaf"
 
         subtheme_obj = {
-            "id": f"{theme_order[theme_name]:02d}-{subtheme_counter:02d}-{subtheme_id}",
+            "id": subtheme_id,
             "name": f"{theme_order[theme_name]}.{subtheme_counter} {subtheme_name}",
             "description": subtheme_info,
             "icon": subtheme_icon,
@@ -126,7 +173,25 @@ for theme_name, theme_group in df.groupby('Theme', sort=False):
 
             # Generate the base indicator ID with full index path
             indicator_base_id = slugify(indicator_name)
-            indicator_id = f"{theme_order[theme_name]:02d}-{subtheme_counter:02d}-{indicator_counter:02d}-{indicator_base_id}"
+            if registry is not None:
+                key_value = clean_text(row.get(key_column, "")) if key_column else None
+                indicator_id = registry.indicator_id(slugify(theme_name), subtheme_slug, indicator_base_id, key_value)
+            else:
+                indicator_id = f"{theme_order[theme_name]:02d}-{subtheme_counter:02d}-{indicator_counter:02d}-{indicator_base_id}"
+
+            # Add indicator to subtheme's indicators list
+            subtheme_obj["indicators"].append(indicator_id)
+            title = f"{theme_order[theme_name]}.{subtheme_counter}.{indicator_counter} {indicator_name}"
+            indicator_counter += 1
+
+            # An unchanged row keeps the fields built from it last time; only
+            # its numbered title depends on where it is
+            if registry is not None:
+                digest = row_hash(row.to_dict())
+                fields = registry.cached_fields(indicator_id, digest)
+                if fields is not None:
+                    indicators[indicator_id] = {"title": title, **fields}
+                    continue
             
             # Keep the original ID for reference in the title
             original_id = indicator_base_id
@@ -141,9 +206,6 @@ for theme_name, theme_group in df.groupby('Theme', sort=False):
             clean_unit = clean_text(row.get("UnitOfMeasure", ""))
             clean_posts = clean_text(row.get("posttag", ""))
 
-            # Add indicator to subtheme's indicators list
-            subtheme_obj["indicators"].append(indicator_id)
-
             # Initialize map URLs as empty strings
             map1_url = ""
             map2_url = ""
@@ -180,8 +242,7 @@ for theme_name, theme_group in df.groupby('Theme', sort=False):
                         map2_url = map2_value  # Use the value directly if it's not an iframe
             
             # Add indicator details to indicators dictionary
-            indicators[indicator_id] = {
-                "title": f"{theme_order[theme_name]}.{subtheme_counter}.{indicator_counter} {indicator_name}",
+            fields = {
                 "description": clean_description,
                 "source": format_source(row),
                 "unit_of_measure": clean_unit,
@@ -189,8 +250,9 @@ for theme_name, theme_group in df.groupby('Theme', sort=False):
                 "map1_url": map1_url,
                 "map2_url": map2_url
             }
-
-            indicator_counter += 1
+            indicators[indicator_id] = {"title": title, **fields}
+            if registry is not None:
+                registry.remember(indicator_id, digest, fields)
 
         subtheme_counter += 1
         theme_obj["subthemes"].append(subtheme_obj)
@@ -217,7 +279,11 @@ def fix_quotes(obj):
 
 
 # Save to file with fixed quotes
-with open("ecoscapes_framework.json", "w") as f:
+with open(output_path, "w") as f:
     json.dump(fix_quotes(final_json), f, indent=2, ensure_ascii=False)
 
-print("✅ Conversion complete: ecoscapes_framework.json created.")
+if registry is not None:
+    registry.save(ids_path)
+    print(f"IDs: {registry.summary()} ({ids_path})")
+
+print(f"✅ Conversion complete: {output_path} created.")
@@ -1,11 +1,23 @@
 import os
 import json
+import hashlib
 import shutil
 import subprocess
+import sys
 from pathlib import Path
 
-def collect_static():
-    """Collect static files for GitHub Pages."""
+# Written to the root of the deploy branch; lists the git blob hash of every
+# deployed file so the next deploy only has to stage what changed
+MANIFEST_NAME = '.build-manifest.json'
+STAGE_BATCH = 500  # paths per `git add` call
+
+def collect_static(config_path='map_config.json', catalogues=None):
+    """
+    Collect static files for GitHub Pages.
+
+    ``catalogues`` maps the names of extra regional catalogues to their
+    config files; each is copied to ``docs/<name>/map_config.json``.
+    """
     if os.path.exists('docs'):
         shutil.rmtree('docs')
     os.makedirs('docs', exist_ok=True)
@@ -29,7 +41,7 @@ def collect_static():
         """)
         
     # Load the map config to get theme groups
-    with open('map_config.json') as f:
+    with open(config_path) as f:
         config = json.load(f)
     
     # Create a version of the site for each theme group
@@ -65,33 +77,10 @@ def collect_static():
     shutil.copy('templates/mapviewer/map.html', 'docs/all/index.html')
     
     # Copy map config
-    shutil.copy('map_config.json', 'docs/map_config.json')
-    
-    # Create a simple server for local testing
-    with open('docs/server.py', 'w') as f:
-        f.write("""
-        import http.server
-        import socketserver
-        import json
-        import os
-        
-        class Handler(http.server.SimpleHTTPRequestHandler):
-            def do_GET(self):
-                if self.path == '/map_config.json':
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    with open('map_config.json', 'rb') as f:
-                        self.wfile.write(f.read())
-                    return
-                return http.server.SimpleHTTPRequestHandler.do_GET(self)
-        
-        if __name__ == '__main__':
-            PORT = 8000
-            with socketserver.TCPServer(("", PORT), Handler) as httpd:
-                print(f"Serving at port {PORT}")
-                httpd.serve_forever()
-        """)
+    shutil.copy(config_path, 'docs/map_config.json')
+    for name, path in (catalogues or {}).items():
+        os.makedirs(os.path.join('docs', name), exist_ok=True)
+        shutil.copy(path, os.path.join('docs', name, 'map_config.json'))
 
 def deploy_to_github():
     """Deploy the static site to GitHub Pages."""
@@ -119,14 +108,138 @@ def deploy_to_github():
     print("\nYour site will be available at: https://niallxd.github.io/ecoscapes-maps/")
     print("Example map page: https://niallxd.github.io/ecoscapes-maps/sample/")
 
+def git(*args, cwd='.', capture=False, check=True, quiet=False):
+    """Run git with literal pathspecs (exported file names may contain glob characters)."""
+    result = subprocess.run(
+        ['git', '--literal-pathspecs', *args], cwd=cwd, check=check, text=True,
+        stdout=subprocess.PIPE if capture else None, stderr=subprocess.DEVNULL if quiet else None,
+    )
+    return result.stdout.strip() if capture else result.returncode
+
+def blob_hash(path):
+    """The hash git gives the file's contents, so manifests match `git ls-files -s`."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+def build_manifest(source):
+    """Map every file under ``source`` (posix relative path) to its blob hash."""
+    manifest = {}
+    for root, dirs, files in os.walk(source):
+        dirs[:] = [d for d in dirs if d != '.git']
+        for name in files:
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, source).replace(os.sep, '/')
+            if rel != MANIFEST_NAME:
+                manifest[rel] = blob_hash(path)
+    return manifest
+
+def previous_manifest(worktree):
+    """
+    The manifest committed by the last deploy, or the branch's index if it has none.
+
+    The working copy isn't trusted: a deploy whose commit failed has already
+    written its manifest there.
+    """
+    committed = git('show', f'HEAD:{MANIFEST_NAME}', cwd=worktree, capture=True, check=False, quiet=True)
+    if committed:
+        return json.loads(committed)
+    manifest = {}
+    for line in git('ls-files', '-s', '-z', cwd=worktree, capture=True).split('\0'):
+        if line:
+            info, path = line.split('\t', 1)
+            if path != MANIFEST_NAME:
+                manifest[path] = info.split()[1]
+    return manifest
+
+def diff_manifests(old, new):
+    """Return (changed or added paths, removed paths)."""
+    changed = sorted(path for path, digest in new.items() if old.get(path) != digest)
+    removed = sorted(path for path in old if path not in new)
+    return changed, removed
+
+def prepare_worktree(worktree, branch, remote, repo='.'):
+    """Check out ``branch`` (as on ``remote``) in a worktree separate from the source tree."""
+    remote_ref = None
+    if git('ls-remote', '--exit-code', '--heads', remote, branch, cwd=repo, capture=True, check=False):
+        git('fetch', '-q', remote, f'+refs/heads/{branch}:refs/remotes/{remote}/{branch}', cwd=repo)
+        remote_ref = f'{remote}/{branch}'
+
+    if os.path.exists(os.path.join(worktree, '.git')):
+        # Drop anything a deploy that failed before committing left staged
+        if remote_ref:
+            git('reset', '-q', '--hard', remote_ref, cwd=worktree)
+        elif git('rev-parse', '-q', '--verify', 'HEAD', cwd=worktree, capture=True, check=False):
+            git('reset', '-q', '--hard', cwd=worktree)
+        else:
+            git('rm', '-rfq', '--ignore-unmatch', '.', cwd=worktree)
+        return
+    git('worktree', 'prune', cwd=repo)
+    if remote_ref:
+        git('worktree', 'add', '-q', '-B', branch, os.path.abspath(worktree), remote_ref, cwd=repo)
+    else:
+        # First deploy: start the branch with no history
+        git('worktree', 'add', '-q', '--detach', os.path.abspath(worktree), cwd=repo)
+        git('checkout', '-q', '--orphan', branch, cwd=worktree)
+        git('rm', '-rfq', '--ignore-unmatch', '.', cwd=worktree)
+
+def deploy_incremental(source='docs', branch='gh-pages', remote='origin', worktree='.deploy',
+                       repo='.', message=None, push=True):
+    """
+    Deploy an export to ``branch`` staging only what changed since the last deploy.
+
+    The branch lives in its own worktree, so the source tree is never staged
+    or committed. Returns ``(changed, removed)`` or None if nothing changed.
+    """
+    prepare_worktree(worktree, branch, remote, repo)
+    manifest = build_manifest(source)
+    changed, removed = diff_manifests(previous_manifest(worktree), manifest)
+    if not changed and not removed:
+        print("Nothing to deploy: the export matches the last deploy.")
+        return None
+
+    for path in changed:
+        dest = os.path.join(worktree, path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copy2(os.path.join(source, path), dest)
+    for path in removed:
+        try:
+            os.remove(os.path.join(worktree, path))
+        except FileNotFoundError:
+            pass
+    with open(os.path.join(worktree, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+
+    # `git add -A -- <path>` stages edits and deletions alike
+    paths = changed + removed + [MANIFEST_NAME]
+    for start in range(0, len(paths), STAGE_BATCH):
+        git('add', '-A', '--', *paths[start:start + STAGE_BATCH], cwd=worktree)
+    message = message or f'Deploy: {len(changed)} changed, {len(removed)} removed'
+    git('commit', '-q', '-m', message, cwd=worktree)
+    if push:
+        git('push', '-q', remote, f'{branch}:{branch}', cwd=worktree)
+    print(f"Deployed {len(changed)} changed and {len(removed)} removed files to {branch}")
+    return changed, removed
+
 if __name__ == '__main__':
+    # Usage: python deploy.py [map_config.json] [name=catalogues/name.json ...]
+    #        python deploy.py --incremental [branch]
+    #            (deploys docs/ from `manage.py export_to_gh_pages` to the
+    #            gh-pages branch via the .deploy/ worktree)
+    args = sys.argv[1:]
+    if args and args[0] == '--incremental':
+        deploy_incremental(branch=args[1] if len(args) > 1 else 'gh-pages')
+        print("Set GitHub Pages to deploy from that branch's root folder.")
+        sys.exit(0)
+    config_path = args.pop(0) if args and '=' not in args[0] else 'map_config.json'
+    catalogues = dict(arg.split('=', 1) for arg in args)
+
     print("Preparing files for GitHub Pages...")
-    collect_static()
+    collect_static(config_path, catalogues)
     
     print("\nTo test locally:")
-    print("1. cd docs")
-    print("2. python3 -m http.server 8000")
-    print("3. Open one of these URLs in your browser:")
+    print("1. python manage.py serve_export")
+    print("2. Open one of these URLs in your browser:")
     print("   - http://localhost:8000/all/ (All themes)")
     for group in theme_groups:
         print(f"   - http://localhost:8000/{group['id']}/ ({group['name']} theme group)")
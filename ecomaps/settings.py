@@ -46,6 +46,9 @@ MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # Outside the HTML post-processing so ETags cover the final bytes
+    'django.middleware.http.ConditionalGetMiddleware',
+    'mapviewer.middleware.HtmlPostProcessMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -78,6 +81,8 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Wait for a concurrent editor's write instead of failing with "database is locked"
+        "OPTIONS": {"timeout": 20},
     }
 }
 
@@ -133,6 +138,73 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 os.makedirs(STATIC_ROOT, exist_ok=True)
 os.makedirs(MEDIA_ROOT, exist_ok=True)
 
+# Map configuration
+# The config file is watched in the background and reloaded when editors save it
+MAP_CONFIG_PATH = BASE_DIR / 'map_config.json'
+MAP_CONFIG_WATCH = True
+MAP_CONFIG_POLL_INTERVAL = 1.0  # seconds, used when inotify is unavailable
+
+# Further regional catalogues, served under /catalogues/<name>/ and exported to
+# docs/<name>/, e.g. {'kootenay': BASE_DIR / 'catalogues' / 'kootenay.json'}
+MAP_CATALOGUES = {}
+MAP_CATALOGUE_CACHE_SIZE = 4  # regional catalogues kept parsed in memory
+
+# Where map_view reads the catalogue from: 'json' (MAP_CONFIG_PATH) or 'db'
+# (the mapviewer models, filled with `manage.py import_catalogue`). 'db' still
+# loads MAP_CONFIG_PATH for the ID aliases and the embed hosts to prefetch
+MAP_CATALOGUE_BACKEND = 'json'
+
+# Encode every indicator's JSON when a catalogue loads rather than on first use
+MAP_PREENCODE_INDICATORS = False
+
+# Minify rendered pages (see mapviewer/htmlpost.py)
+HTML_POSTPROCESS = True
+
+# Keep rendered pages and JSON as ready-to-send identity/gzip/brotli bytes,
+# per catalogue snapshot (0 turns the cache off), and render the landing page
+# of every theme group as soon as a config is loaded
+MAP_RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+MAP_PREWARM_RESPONSES = True
+
+# For this many seconds after a reload, requests that would wait for a page
+# another request is already rendering get the previous config's copy instead
+# (0 = always wait for the new one)
+MAP_SERVE_STALE = 0
+
+# CDN caching (mapviewer/cache_policy.py): per-kind Cache-Control overrides,
+# e.g. {'page': {'s_maxage': 3600}}; the header carrying the surrogate keys
+# (plus an optional comma-separated copy such as 'Cache-Tag'); and a file to
+# append the keys to purge to whenever a config reload changes something
+MAP_CACHE_POLICY = {}
+MAP_SURROGATE_KEY_HEADER = 'Surrogate-Key'
+MAP_CACHE_TAG_HEADER = None
+MAP_PURGE_QUEUE = None
+
+# Record renamed/renumbered IDs in <config>.aliases.json when a reloaded config
+# replaces another, so old deep links get a 301 (mapviewer/aliases.py)
+MAP_RECORD_ALIASES = True
+
+# Client timings (map embed loads, indicator switches, WordPress lookups) sent
+# by map pages as beacons, kept as histograms in memory and written to the
+# database every MAP_TELEMETRY_FLUSH_INTERVAL seconds (0 = only at exit);
+# rows older than MAP_TELEMETRY_RETENTION_DAYS are deleted (0 = keep them);
+# see `manage.py perf_report` (mapviewer/telemetry.py). Off by default: the
+# beacon endpoint accepts unauthenticated writes
+MAP_TELEMETRY = False
+MAP_TELEMETRY_FLUSH_INTERVAL = 60
+MAP_TELEMETRY_RETENTION_DAYS = 90
+
+# Load the second (Analyze) map only when its view is first opened
+MAP_DEFER_SECOND_MAP = True
+
+# Screenshots (<indicator id>.png/.jpg/.webp) used for the map placeholders
+# by `manage.py build_thumbnails`; indicators without one get their icon
+MAP_SCREENSHOTS_DIR = BASE_DIR / 'screenshots'
+
+# Framework spreadsheet (CSV export) that `manage.py build` converts with
+# csv-json.py and merges into map_config.json; None skips that step
+MAP_FRAMEWORK_CSV = None
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
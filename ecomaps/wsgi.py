@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ecomaps.settings")
 
 application = get_wsgi_application()
+
+# Prefork servers importing the app once before forking (gunicorn --preload,
+# see gunicorn.conf.py) share what this loads with their workers
+if os.environ.get("MAP_PRELOAD"):
+    from mapviewer.preload import preload
+
+    preload()
@@ -1,12 +1,14 @@
 import json
+import sys
 
-def generate_all_urls():
+BASE_URL = "https://niallxd.github.io/ecoscapes-maps/"
+
+def generate_all_urls(config_path='map_config.json', base_url=BASE_URL):
     # Load the config
-    with open('map_config.json', 'r') as f:
+    with open(config_path, 'r') as f:
         config = json.load(f)
     
     urls = []
-    base_url = "https://niallxd.github.io/ecoscapes-maps/"
     
     # Generate URLs for each theme, subtheme, and indicator combination
     for theme in config.get('themes', []):
@@ -52,6 +54,12 @@ def save_urls_to_file(urls, filename='all_map_urls.txt'):
         f.write(f"\nTotal URLs generated: {len(urls)}\n")
 
 if __name__ == "__main__":
-    urls = generate_all_urls()
-    save_urls_to_file(urls)
-    print(f"Generated {len(urls)} URLs and saved to all_map_urls.txt")
+    # Usage: python generate_urls.py [config.json] [output.txt] [base url]
+    # e.g. python generate_urls.py catalogues/kootenay.json kootenay_urls.txt \
+    #          https://niallxd.github.io/ecoscapes-maps/kootenay/
+    config_path = sys.argv[1] if len(sys.argv) > 1 else 'map_config.json'
+    filename = sys.argv[2] if len(sys.argv) > 2 else 'all_map_urls.txt'
+    base_url = sys.argv[3] if len(sys.argv) > 3 else BASE_URL
+    urls = generate_all_urls(config_path, base_url)
+    save_urls_to_file(urls, filename)
+    print(f"Generated {len(urls)} URLs and saved to {filename}")
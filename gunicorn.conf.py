@@ -0,0 +1,26 @@
+"""
+gunicorn settings for serving the map viewer live:
+
+    gunicorn -c gunicorn.conf.py ecomaps.wsgi
+
+The app is preloaded in the master process (see mapviewer/preload.py), so
+the workers share one copy of the catalogues, templates and prewarmed pages.
+Check the result with ``python manage.py worker_memory $(cat gunicorn.pid)``.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+pidfile = os.environ.get('GUNICORN_PIDFILE', 'gunicorn.pid')
+preload_app = True
+
+# Read by ecomaps/wsgi.py. Set here rather than in a server hook: gunicorn
+# imports a preloaded app before on_starting runs
+os.environ.setdefault('MAP_PRELOAD', '1')
+
+
+def post_fork(server, worker):
+    from mapviewer.preload import after_fork
+
+    after_fork()
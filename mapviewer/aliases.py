@@ -0,0 +1,203 @@
+"""
+Old theme, subtheme and indicator IDs and the current IDs they became.
+
+Positional IDs (``05-02-03-...``) change whenever the framework is
+reorganised, which breaks old deep links. ``find_renames`` compares two
+configs and pairs each removed ID with the added ID it became: same slug
+(the ID without its number), or failing that the same name and map. The
+pairs are kept in an ``AliasTable`` saved next to the config
+(``map_config.aliases.json``). It is updated whenever a reloaded config
+replaces another (``record_on_publish``) or ``build`` merges a new
+framework, and ``build_aliases`` replays the config's git history.
+
+The table is flattened as it grows (a -> b then b -> c stores a -> c), so
+resolving an old ID is a single dict lookup. IDs that are current again are
+dropped from it.
+"""
+import json
+import logging
+import os
+import re
+
+from django.conf import settings
+
+from .id_registry import strip_number
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('themes', 'subthemes', 'indicators')
+
+# "1.2.3 Name" -> "Name"
+_DISPLAY_NUMBER = re.compile(r'^\d+(?:\.\d+)*\s+')
+
+
+def aliases_path(config_path):
+    root, _ = os.path.splitext(config_path)
+    return f'{root}.aliases.json'
+
+
+def _plain_name(name):
+    return _DISPLAY_NUMBER.sub('', name or '').strip().lower()
+
+
+class _Items:
+    """The themes, subthemes and indicators of a config by ID."""
+
+    def __init__(self, config):
+        self.themes = {}
+        self.subthemes = {}
+        self.indicators = {}
+        if 'themes' not in config:
+            return
+        records = config.get('indicators', {})
+        for theme in config.get('themes', []):
+            self.themes.setdefault(theme['id'], theme)
+            for subtheme in theme.get('subthemes', []):
+                self.subthemes.setdefault(subtheme['id'], (theme['id'], subtheme))
+                for indicator_id in subtheme.get('indicators', []):
+                    self.indicators.setdefault(indicator_id, (subtheme['id'], records.get(indicator_id) or {}))
+
+    def ids(self):
+        return {kind: set(getattr(self, kind)) for kind in KINDS}
+
+    def match_keys(self, kind):
+        """Functions giving an item's match keys, most specific first."""
+        if kind == 'themes':
+            return (strip_number, lambda item_id: _plain_name(self.themes[item_id].get('name')))
+        if kind == 'subthemes':
+            return (
+                lambda item_id: (strip_number(self.subthemes[item_id][0]), strip_number(item_id)),
+                strip_number,
+                lambda item_id: _plain_name(self.subthemes[item_id][1].get('name')),
+            )
+        return (
+            lambda item_id: (strip_number(self.indicators[item_id][0]), strip_number(item_id)),
+            strip_number,
+            lambda item_id: (_plain_name(self.indicators[item_id][1].get('title')),
+                             self.indicators[item_id][1].get('map1_url') or ''),
+        )
+
+
+def config_ids(config):
+    """``{kind: set of IDs}`` in use in a config."""
+    return _Items(config).ids()
+
+
+def _unique(ids, key):
+    """``{key value: id}`` for the key values that only one of ``ids`` has."""
+    found = {}
+    for item_id in ids:
+        value = key(item_id)
+        if value:
+            found[value] = None if value in found else item_id
+    return {value: item_id for value, item_id in found.items() if item_id is not None}
+
+
+def find_renames(old_config, new_config):
+    """``{kind: {old id: new id}}`` for the items that were renamed or renumbered."""
+    old, new = _Items(old_config), _Items(new_config)
+    renames = {}
+    for kind in KINDS:
+        old_ids, new_ids = set(getattr(old, kind)), set(getattr(new, kind))
+        removed, added = old_ids - new_ids, new_ids - old_ids
+        pairs = {}
+        for old_key, new_key in zip(old.match_keys(kind), new.match_keys(kind)):
+            if not removed or not added:
+                break
+            new_by_key = _unique(added, new_key)
+            for value, old_id in _unique(removed, old_key).items():
+                new_id = new_by_key.get(value)
+                if new_id is not None:
+                    pairs[old_id] = new_id
+            removed -= pairs.keys()
+            added -= set(pairs.values())
+        if pairs:
+            renames[kind] = pairs
+    return renames
+
+
+class AliasTable:
+    """Old ID -> current ID, per kind."""
+
+    def __init__(self, data=None):
+        data = data or {}
+        self.tables = {kind: dict(data.get(kind, {})) for kind in KINDS}
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            return cls()
+
+    def save(self, path):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=1, sort_keys=True, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def as_dict(self):
+        return {kind: table for kind, table in self.tables.items() if table}
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables.values())
+
+    def resolve(self, kind, item_id):
+        """The current ID for an old one, or None."""
+        return self.tables[kind].get(item_id)
+
+    def update(self, renames, current_ids):
+        """
+        Add ``{kind: {old: new}}`` renames, keeping the table flat.
+
+        ``current_ids`` (``{kind: set}``) are the IDs in use now; aliases
+        from them are dropped. Returns the number of aliases added.
+        """
+        added = 0
+        for kind in KINDS:
+            table = self.tables[kind]
+            pairs = renames.get(kind, {})
+            for old_id, new_id in table.items():
+                if new_id in pairs:
+                    table[old_id] = pairs[new_id]
+            for old_id, new_id in pairs.items():
+                added += table.get(old_id) != new_id
+                table[old_id] = new_id
+            current = current_ids.get(kind, ())
+            for old_id in [old_id for old_id, new_id in table.items() if old_id in current or old_id == new_id]:
+                del table[old_id]
+        return added
+
+
+def record_renames(path, old_config, new_config):
+    """Add the renames between two configs to the alias file at ``path``; returns the table."""
+    table = AliasTable.load(path)
+    renames = find_renames(old_config, new_config)
+    before = table.as_dict()
+    added = table.update(renames, config_ids(new_config))
+    if table.as_dict() != before:
+        table.save(path)
+        logger.info('Recorded %d new ID aliases in %s', added, path)
+    return table
+
+
+def catalogue_aliases(catalogue):
+    """The alias table of a catalogue snapshot, read from disk once per snapshot."""
+    table = catalogue.cache.get('aliases')
+    if table is None:
+        table = AliasTable.load(aliases_path(catalogue.path)) if catalogue.path else AliasTable()
+        table = catalogue.cache.setdefault('aliases', table)
+    return table
+
+
+def record_on_publish(sender, name, catalogue, previous=None, **kwargs):
+    """Record the IDs renamed by a reloaded config."""
+    if not getattr(settings, 'MAP_RECORD_ALIASES', True):
+        return
+    if previous is None or catalogue.path is None or previous.version == catalogue.version:
+        return
+    try:
+        catalogue.cache['aliases'] = record_renames(aliases_path(catalogue.path), previous.config, catalogue.config)
+    except Exception:
+        logger.exception('Could not record the renamed IDs of catalogue %s', name)
@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+def enable_wal(sender, connection, **kwargs):
+    """Let readers carry on while an import or editor write is in progress."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
 
 
 class MapviewerConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "mapviewer"
+
+    def ready(self):
+        from .aliases import record_on_publish
+        from .cache_policy import purge_on_publish
+        from .catalogue import catalogue_published
+        from .views import keep_stale_responses, prewarm_on_publish
+
+        connection_created.connect(enable_wal)
+        catalogue_published.connect(record_on_publish)
+        catalogue_published.connect(keep_stale_responses)
+        catalogue_published.connect(prewarm_on_publish)
+        catalogue_published.connect(purge_on_publish)
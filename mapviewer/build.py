@@ -0,0 +1,295 @@
+"""
+The publish pipeline as a dependency graph with content-hash caching.
+
+A ``Node`` names the files it reads (``inputs``) and writes (``outputs``) as
+paths relative to the project root: a file, a directory (everything under
+it) or a glob such as ``docs/**/*.gz``. Before running a node, ``run_graph``
+hashes its inputs. The node is skipped when that key and the hash of its
+outputs both match what was recorded after its last successful run. Nodes
+whose dependencies are done run in parallel on a thread pool. A node that
+fails stops everything downstream of it but not its siblings.
+
+File hashes are remembered in the cache file with the size and mtime they
+were computed at, so an unchanged tree is only ``stat``-ed, not re-read.
+"""
+import fnmatch
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # .gz only
+    brotli = None
+
+CACHE_NAME = '.build-cache.json'
+
+# Text files in an export that get precompressed .gz/.br siblings
+COMPRESS_SUFFIXES = ('.html', '.css', '.js', '.json', '.svg', '.txt', '.xml')
+COMPRESS_MIN_BYTES = 512
+
+BUILT = 'built'
+CACHED = 'cached'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+BLOCKED = 'blocked'
+
+
+class Skip(Exception):
+    """Raised by a node's ``run`` when there is nothing for it to do."""
+
+
+class Node:
+    """
+    One step of the build.
+
+    ``run`` is called with no arguments and may return a short summary
+    line. ``exclude`` holds file name patterns ignored in the node's inputs
+    and outputs. With ``verify_outputs`` False only missing outputs force a
+    rerun, for outputs that may also be edited by hand.
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), deps=(), params=None,
+                 exclude=(), verify_outputs=True, description=''):
+        self.name = name
+        self.run = run
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.deps = tuple(deps)
+        self.params = params or {}
+        self.exclude = tuple(exclude)
+        self.verify_outputs = verify_outputs
+        self.description = description
+
+
+class NodeResult:
+    __slots__ = ('name', 'status', 'seconds', 'summary', 'error')
+
+    def __init__(self, name, status, seconds=0.0, summary='', error=None):
+        self.name = name
+        self.status = status
+        self.seconds = seconds
+        self.summary = summary
+        self.error = error
+
+
+class FileHasher:
+    """Content hashes of files under ``root``, memoised on (size, mtime)."""
+
+    def __init__(self, root, known=None):
+        self.root = Path(root)
+        self.known = dict(known or {})
+        self._lock = threading.Lock()
+
+    def expand(self, spec, exclude=()):
+        """Sorted relative paths of the files a spec names."""
+        if any(char in spec for char in '*?['):
+            paths = self.root.glob(spec)
+        else:
+            path = self.root / spec
+            paths = path.rglob('*') if path.is_dir() else [path] if path.exists() else []
+        files = []
+        for path in paths:
+            if not path.is_file() or any(fnmatch.fnmatch(path.name, pattern) for pattern in exclude):
+                continue
+            files.append(path.relative_to(self.root).as_posix())
+        return sorted(files)
+
+    def file(self, relpath):
+        path = self.root / relpath
+        st = path.stat()
+        signature = [st.st_size, st.st_mtime_ns]
+        with self._lock:
+            known = self.known.get(relpath)
+        if known and known[:2] == signature:
+            return known[2]
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        value = digest.hexdigest()
+        with self._lock:
+            self.known[relpath] = signature + [value]
+        return value
+
+    def digest(self, specs, exclude=(), extra=None):
+        """One hash over every file the specs name (and ``extra``), or of their absence."""
+        digest = hashlib.md5(json.dumps(extra, sort_keys=True, default=str).encode('utf-8'))
+        for spec in specs:
+            files = self.expand(spec, exclude)
+            digest.update(f'{spec}:{len(files)}\n'.encode('utf-8'))
+            for relpath in files:
+                digest.update(f'{relpath}={self.file(relpath)}\n'.encode('utf-8'))
+        return digest.hexdigest()
+
+    def missing(self, specs, exclude=()):
+        return [spec for spec in specs if not self.expand(spec, exclude)]
+
+
+def select(nodes, targets):
+    """The named nodes plus everything they depend on, in definition order."""
+    by_name = {node.name: node for node in nodes}
+    unknown = [target for target in targets if target not in by_name]
+    if unknown:
+        raise KeyError(', '.join(unknown))
+    wanted = set()
+    stack = list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in wanted:
+            wanted.add(name)
+            stack.extend(dep for dep in by_name[name].deps if dep in by_name)
+    return [node for node in nodes if node.name in wanted]
+
+
+def load_cache(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_cache(path, cache):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def run_graph(nodes, root, force=(), workers=4, dry_run=False, on_result=None):
+    """
+    Run ``nodes`` (a list in dependency order) and return their NodeResults.
+
+    ``force`` names nodes to run even if cached (``True`` for all). With
+    ``dry_run`` nothing runs; nodes that would are reported as built.
+    ``on_result`` is called with each result as it finishes.
+    """
+    root = Path(root)
+    cache_path = root / CACHE_NAME
+    cache = load_cache(cache_path)
+    hasher = FileHasher(root, cache.get('files'))
+    records = cache.get('nodes', {})
+    names = {node.name for node in nodes}
+    results = {}
+    lock = threading.Lock()
+
+    def finish(result):
+        results[result.name] = result
+        if on_result:
+            on_result(result)
+
+    def process(node):
+        started = time.perf_counter()
+        key = hasher.digest(node.inputs, node.exclude, extra={'node': node.name, 'params': node.params})
+        record = records.get(node.name, {})
+        forced = force is True or node.name in force
+        if not forced and record.get('key') == key and not hasher.missing(node.outputs, node.exclude) and (
+            not node.verify_outputs or record.get('outputs') == hasher.digest(node.outputs, node.exclude)
+        ):
+            return NodeResult(node.name, CACHED, time.perf_counter() - started)
+        if dry_run:
+            return NodeResult(node.name, BUILT, 0.0, 'would run')
+        try:
+            summary = node.run() or ''
+        except Skip as e:
+            return NodeResult(node.name, SKIPPED, time.perf_counter() - started, str(e))
+        except Exception as e:
+            return NodeResult(node.name, FAILED, time.perf_counter() - started, str(e), e)
+        with lock:
+            records[node.name] = {
+                # Inputs may include earlier outputs of this node; key them as they are now
+                'key': hasher.digest(node.inputs, node.exclude, extra={'node': node.name, 'params': node.params}),
+                'outputs': hasher.digest(node.outputs, node.exclude),
+                'built_at': time.time(),
+            }
+        return NodeResult(node.name, BUILT, time.perf_counter() - started, summary)
+
+    pending = list(nodes)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        while pending or running:
+            for node in list(pending):
+                deps = [dep for dep in node.deps if dep in names]
+                if any(results.get(dep) and results[dep].status in (FAILED, BLOCKED) for dep in deps):
+                    pending.remove(node)
+                    finish(NodeResult(node.name, BLOCKED, summary='a dependency failed'))
+                elif all(dep in results for dep in deps):
+                    pending.remove(node)
+                    running[pool.submit(process, node)] = node
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.pop(future)
+                finish(future.result())
+
+    if not dry_run:
+        # Forget hashes of files that no longer exist
+        files = {path: value for path, value in hasher.known.items() if (root / path).exists()}
+        save_cache(cache_path, {'files': files, 'nodes': records})
+    return [results[node.name] for node in nodes]
+
+
+def merge_framework(framework_path, config_path, backup_path=None):
+    """
+    Write the themes and indicators of a framework JSON into a map config.
+
+    Everything else in the config (the ``themeGroups``) is kept; the
+    previous config is copied to ``backup_path`` first. The file is not
+    touched if it already matches. Returns the number of indicators.
+    """
+    with open(framework_path, 'r', encoding='utf-8') as f:
+        framework = json.load(f)
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = {}
+    if all(config.get(key) == value for key, value in framework.items()):
+        # Already merged; leave the file (and its formatting) alone
+        return len(config.get('indicators', {}))
+    if config and backup_path:
+        shutil.copy2(config_path, backup_path)
+    config.update(framework)
+    tmp_path = f'{config_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, config_path)
+    return len(config.get('indicators', {}))
+
+
+def _compress_file(path):
+    data = path.read_bytes()
+    written = 0
+    for suffix, compress in (('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0)),
+                             ('.br', lambda: brotli.compress(data, quality=11) if brotli else None)):
+        target = path.with_name(path.name + suffix)
+        if target.exists() and target.stat().st_mtime_ns >= path.stat().st_mtime_ns:
+            continue
+        body = compress()
+        if body is not None and len(body) < len(data):
+            target.write_bytes(body)
+            written += 1
+    return written
+
+
+def precompress(directory, suffixes=COMPRESS_SUFFIXES, min_bytes=COMPRESS_MIN_BYTES, workers=4):
+    """
+    Write .gz (and, with the brotli package, .br) siblings for the text files in a tree.
+
+    Siblings newer than their file are left alone. Returns the number of
+    files written.
+    """
+    paths = [
+        path for path in Path(directory).rglob('*')
+        if path.suffix in suffixes and path.is_file() and path.stat().st_size >= min_bytes
+    ]
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        return sum(pool.map(_compress_file, paths))
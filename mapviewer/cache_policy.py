@@ -0,0 +1,134 @@
+"""
+Cache headers for a CDN in front of the map viewer.
+
+Every response served from a catalogue gets a ``Cache-Control`` policy for
+its kind (page, catalogue JSON, indicator JSON or fragment) and surrogate
+keys naming the config objects it was built from, using the cache key names
+of ``diff.impact``:
+
+- a page: its scope (``group:<id>``, or ``all-themes`` without a theme
+  group) and ``indicator:<id>`` for the indicator it shows;
+- ``catalogue.json``: ``catalogue``;
+- an indicator's JSON: ``indicator:<id>``; its fragment also its
+  ``theme:<id>`` and ``subtheme:<id>`` (for the breadcrumb);
+- a redirect from an old ID (see ``aliases``): the key of the old ID, which
+  is purged if the ID is ever used again;
+- an indicator chunk (see ``chunks``): nothing but ``site``; its URL changes
+  with its content, so it is cached as immutable.
+
+Each response also carries ``site`` so a template or code deploy can purge
+everything. Keys of regional catalogues are prefixed with ``<name>/``.
+
+When a catalogue is reloaded, ``purge_on_publish`` diffs it against the
+previous snapshot and logs the keys to purge, and appends them as a JSON line
+to ``MAP_PURGE_QUEUE`` when that is set, for a purge job to pick up.
+"""
+import json
+import logging
+import time
+
+from django.conf import settings
+
+from .catalogue import DEFAULT_CATALOGUE
+from .diff import ALL_THEMES_KEY, impact
+
+logger = logging.getLogger(__name__)
+
+SITE_KEY = 'site'
+
+# Seconds; browsers revalidate pages (cheap with the ETag) while the CDN
+# keeps them until purged. Override per kind with MAP_CACHE_POLICY.
+DEFAULT_POLICIES = {
+    'page': {'max_age': 0, 's_maxage': 86400, 'stale_while_revalidate': 60},
+    'catalogue': {'max_age': 60, 's_maxage': 86400, 'stale_while_revalidate': 60},
+    'indicator': {'max_age': 300, 's_maxage': 86400, 'stale_while_revalidate': 300},
+    'fragment': {'max_age': 300, 's_maxage': 86400, 'stale_while_revalidate': 300},
+    'redirect': {'max_age': 3600, 's_maxage': 86400, 'stale_while_revalidate': 0},
+    'chunk': {'max_age': 31536000, 's_maxage': 31536000, 'immutable': True},
+}
+
+
+def policy(kind):
+    overrides = getattr(settings, 'MAP_CACHE_POLICY', {}).get(kind, {})
+    return dict(DEFAULT_POLICIES[kind], **overrides)
+
+
+def cache_control(kind):
+    """The Cache-Control value for a kind of response."""
+    values = policy(kind)
+    parts = ['public', f"max-age={values['max_age']}"]
+    if values.get('s_maxage') is not None:
+        parts.append(f"s-maxage={values['s_maxage']}")
+    if values.get('stale_while_revalidate'):
+        parts.append(f"stale-while-revalidate={values['stale_while_revalidate']}")
+    if values.get('immutable'):
+        parts.append('immutable')
+    return ', '.join(parts)
+
+
+def namespaced(keys, catalogue_name=None):
+    """Prefix keys with a regional catalogue's name."""
+    if not catalogue_name or catalogue_name == DEFAULT_CATALOGUE:
+        return list(keys)
+    return [f'{catalogue_name}/{key}' for key in keys]
+
+
+def page_keys(theme_group_id, indicator_id):
+    keys = [f'group:{theme_group_id}' if theme_group_id else ALL_THEMES_KEY]
+    if indicator_id:
+        keys.append(f'indicator:{indicator_id}')
+    return keys
+
+
+def fragment_keys(fragment):
+    keys = [f'indicator:{fragment["id"]}']
+    if fragment.get('theme'):
+        keys.append(f'theme:{fragment["theme"]}')
+    if fragment.get('subtheme'):
+        keys.append(f'subtheme:{fragment["subtheme"]}')
+    return keys
+
+
+def cache_headers(kind, keys, catalogue_name=None):
+    """
+    The headers for a response: ``Cache-Control`` and the surrogate keys.
+
+    Keys go in ``MAP_SURROGATE_KEY_HEADER`` (``Surrogate-Key``, space
+    separated, as Fastly reads it); ``MAP_CACHE_TAG_HEADER`` names an extra
+    comma-separated copy for CDNs that use one (``Cache-Tag``).
+    """
+    keys = namespaced(list(keys) + [SITE_KEY], catalogue_name)
+    headers = {'Cache-Control': cache_control(kind)}
+    key_header = getattr(settings, 'MAP_SURROGATE_KEY_HEADER', 'Surrogate-Key')
+    if key_header:
+        headers[key_header] = ' '.join(keys)
+    tag_header = getattr(settings, 'MAP_CACHE_TAG_HEADER', None)
+    if tag_header:
+        headers[tag_header] = ','.join(keys)
+    return headers
+
+
+def purge_keys(old_config, new_config, catalogue_name=None):
+    """The surrogate keys to purge after ``old_config`` was replaced by ``new_config``."""
+    result = impact(old_config, new_config)
+    return namespaced(result['cache_keys'], catalogue_name)
+
+
+def purge_on_publish(sender, name, catalogue, previous=None, **kwargs):
+    """Log (and queue) the keys to purge when a reloaded catalogue replaces another."""
+    if previous is None or previous.version == catalogue.version:
+        return
+    try:
+        keys = purge_keys(previous.config, catalogue.config, name)
+    except Exception:
+        logger.exception('Could not work out the cache keys to purge for catalogue %s', name)
+        keys = namespaced([SITE_KEY], name)
+    if not keys:
+        return
+    logger.info('Catalogue %s changed; purge %d cache keys: %s', name, len(keys), ' '.join(keys))
+    queue = getattr(settings, 'MAP_PURGE_QUEUE', None)
+    if queue:
+        with open(queue, 'a') as f:
+            f.write(json.dumps({
+                'time': time.time(), 'catalogue': name, 'version': catalogue.version, 'keys': keys,
+            }) + '\n')
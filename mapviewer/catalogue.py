@@ -0,0 +1,560 @@
+"""
+Loading, indexing and hot-reloading of the map configuration.
+
+The parsed ``map_config.json`` is held as an immutable ``Catalogue`` snapshot
+together with the lookup tables that ``map_view`` needs. A background
+``ConfigWatcher`` notices edits to the file, builds a new snapshot off the
+request path and publishes it with a single reference assignment, so request
+threads never wait on a reload and a broken file never replaces a good one.
+
+Besides the default catalogue, ``MAP_CATALOGUES`` can name further regional
+configs. Those are loaded on first use, each with its own snapshot, watcher
+and caches, and at most ``MAP_CATALOGUE_CACHE_SIZE`` of them stay in memory.
+"""
+import ctypes
+import ctypes.util
+import functools
+import hashlib
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from collections import Counter, OrderedDict, namedtuple
+from collections.abc import Mapping
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.dispatch import Signal
+
+from .compact import compact_config
+from .singleflight import SingleFlight
+from .validation import errors, parse_config, validate_config
+
+logger = logging.getLogger(__name__)
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+
+DEFAULT_CATALOGUE = 'default'
+
+# Sent with ``name``, ``catalogue`` and ``previous`` (the snapshot it
+# replaces, or None) whenever a snapshot is published
+catalogue_published = Signal()
+
+
+class ConfigError(ValueError):
+    """Raised when a configuration file cannot be used."""
+
+
+# The origins an indicator's two map embeds load from ('' when it has none)
+EmbedHints = namedtuple('EmbedHints', 'map1 map2')
+NO_EMBED_HINTS = EmbedHints('', '')
+
+# Indicator fields a page swaps in when switching indicator (see Catalogue.fragment)
+FRAGMENT_FIELDS = ('title', 'description', 'source', 'unit_of_measure', 'icon', 'map1_url', 'map2_url', 'posts')
+
+
+def embed_origin(url):
+    if not url or not isinstance(url, str):
+        return ''
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}' if parts.scheme and parts.netloc else ''
+
+
+def indicator_embed_hints(indicators):
+    """
+    Return ``{indicator id: EmbedHints}`` for an indicators dict.
+
+    Indicators embedding from the same hosts share one EmbedHints tuple.
+    """
+    origins = {}
+    shared = {}
+    hints = {}
+    for indicator_id, indicator in indicators.items():
+        if not isinstance(indicator, Mapping):
+            continue
+        pair = []
+        for key in ('map1_url', 'map2_url'):
+            origin = embed_origin(indicator.get(key))
+            pair.append(origins.setdefault(origin, origin))
+        pair = tuple(pair)
+        hints[indicator_id] = shared.setdefault(pair, EmbedHints(*pair))
+    return hints
+
+
+def embed_hosts(indicators, hints=None):
+    """Origins of the map embeds in an indicators dict, most used first."""
+    hosts = Counter()
+    for pair in (hints or indicator_embed_hints(indicators)).values():
+        for origin in pair:
+            if origin:
+                hosts[origin] += 1
+    return [host for host, _ in hosts.most_common()]
+
+
+class Catalogue:
+    """
+    An immutable snapshot of the map configuration plus derived lookups.
+
+    The config is held compacted (see ``compact.py``): strings are shared
+    and indicators are ``IndicatorRecord`` mappings. ``preencode`` builds
+    each indicator's JSON payload up front (default ``MAP_PREENCODE_INDICATORS``).
+    ``problems`` holds the validation errors the config was accepted with.
+    """
+
+    def __init__(self, config, version='', path=None, name=DEFAULT_CATALOGUE, preencode=None, problems=()):
+        if preencode is None:
+            preencode = getattr(settings, 'MAP_PREENCODE_INDICATORS', False)
+        config, self.strings = compact_config(config, preencode)
+        self.config = config
+        self.version = version
+        self.path = path
+        self.name = name
+        self.problems = frozenset(problems)
+        self.loaded_at = time.time()
+        # Per-snapshot memo for things derived from it (post-processors etc.)
+        self.cache = {}
+
+        # Old format configs are a flat mapping of page name -> map urls
+        self.has_themes = 'themes' in config
+        self.indicators = config.get('indicators', {}) if self.has_themes else config
+        self.themes = config.get('themes', []) if self.has_themes else []
+        self.default_indicator_id = next(iter(self.indicators), None) if self.has_themes else None
+
+        self.themes_by_id = {theme['id']: theme for theme in self.themes}
+        self.theme_groups = {group['id']: group for group in config.get('themeGroups', [])}
+
+        # indicator id -> id of the first theme that lists it
+        self.indicator_theme = {}
+        for theme in self.themes:
+            for subtheme in theme.get('subthemes', []):
+                for indicator_id in subtheme.get('indicators', []):
+                    self.indicator_theme.setdefault(indicator_id, theme['id'])
+
+        # Per-indicator embed origins for resource hints, worked out once here
+        # so a request only has to look them up
+        self.embed_hints = indicator_embed_hints(self.indicators) if self.has_themes else {}
+        self.embed_hosts = embed_hosts(self.indicators, self.embed_hints)
+        # The remaining hosts, to DNS-prefetch in case the visitor switches indicator
+        self._other_hosts = {
+            hints: tuple(host for host in self.embed_hosts if host not in hints)
+            for hints in set(self.embed_hints.values()) | {NO_EMBED_HINTS}
+        }
+
+        # Themes with their indicator data attached, ready for the template
+        self.prepared_themes = [self._prepare_theme(theme) for theme in self.themes]
+        self._group_themes = {}
+        for group_id, group in self.theme_groups.items():
+            theme_ids = set(group.get('themeIds', []))
+            self._group_themes[group_id] = [
+                theme for theme in self.prepared_themes if theme['id'] in theme_ids
+            ]
+
+    def fragment(self, indicator_id):
+        """
+        The per-indicator part of a map page, or None for unknown indicators.
+
+        Holds the indicator's ``FRAGMENT_FIELDS``, the theme and subtheme it
+        is listed under and a breadcrumb of ``{id, name}`` from the theme down.
+        """
+        indicator = self.indicators.get(indicator_id) if self.has_themes else None
+        if not isinstance(indicator, Mapping):
+            return None
+        fragment = {'id': indicator_id}
+        fragment.update((field, indicator[field]) for field in FRAGMENT_FIELDS if field in indicator)
+        breadcrumb = []
+        theme = self.themes_by_id.get(self.indicator_theme.get(indicator_id))
+        if theme:
+            breadcrumb.append({'id': theme['id'], 'name': theme.get('name', '')})
+            subtheme = next((subtheme for subtheme in theme.get('subthemes', [])
+                             if indicator_id in subtheme.get('indicators', [])), None)
+            if subtheme:
+                breadcrumb.append({'id': subtheme.get('id'), 'name': subtheme.get('name', '')})
+            fragment['theme'] = theme['id']
+            fragment['subtheme'] = subtheme.get('id') if subtheme else None
+        breadcrumb.append({'id': indicator_id, 'name': indicator.get('title', '')})
+        fragment['breadcrumb'] = breadcrumb
+        return fragment
+
+    def _prepare_theme(self, theme):
+        theme_data = theme.copy()
+        theme_data['subthemes'] = []
+        for subtheme in theme.get('subthemes', []):
+            subtheme_data = subtheme.copy()
+            subtheme_data['indicator_items'] = []
+            for indicator_id in subtheme.get('indicators', []):
+                if indicator_id in self.indicators:
+                    # The shared records carry their ID as ``.id``
+                    subtheme_data['indicator_items'].append(self.indicators[indicator_id])
+            theme_data['subthemes'].append(subtheme_data)
+        return theme_data
+
+    def hints_for(self, indicator_id):
+        """Return the EmbedHints for an indicator (empty if it's unknown)."""
+        return self.embed_hints.get(indicator_id, NO_EMBED_HINTS)
+
+    def other_hosts(self, hints):
+        """Embed hosts in the catalogue besides the ones in ``hints``."""
+        return self._other_hosts.get(hints, ())
+
+    def themes_for_group(self, group_id=None):
+        """Return the prepared themes for a theme group (all themes if unknown)."""
+        if group_id is None:
+            return self.prepared_themes
+        return self._group_themes.get(group_id, self.prepared_themes)
+
+    def theme_for_indicator(self, indicator_id, group_id=None):
+        """Return the prepared theme containing an indicator, if it is on the page."""
+        theme_id = self.indicator_theme.get(indicator_id)
+        if theme_id is None:
+            return None
+        for theme in self.themes_for_group(group_id):
+            if theme['id'] == theme_id:
+                return theme
+        return None
+
+
+def check_config(config):
+    """Raise ConfigError if the parsed config does not have the expected shape."""
+    if not isinstance(config, dict):
+        raise ConfigError('top level must be an object')
+    if 'themes' not in config:
+        return
+    if not isinstance(config['themes'], list):
+        raise ConfigError('"themes" must be a list')
+    if not isinstance(config.get('indicators', {}), dict):
+        raise ConfigError('"indicators" must be an object')
+    if not isinstance(config.get('themeGroups', []), list):
+        raise ConfigError('"themeGroups" must be a list')
+    for theme in config['themes']:
+        if not isinstance(theme, dict) or 'id' not in theme:
+            raise ConfigError('every theme needs an "id"')
+    for group in config.get('themeGroups', []):
+        if not isinstance(group, dict) or 'id' not in group:
+            raise ConfigError('every theme group needs an "id"')
+
+
+def load_catalogue(path, strict=False, name=DEFAULT_CATALOGUE, allowed=()):
+    """
+    Read, check and index a config file. Raises ConfigError on bad input.
+
+    With ``strict`` any validation error not in ``allowed`` rejects the file;
+    otherwise only a config too malformed to index is rejected and other
+    errors are logged.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        config, duplicates = parse_config(raw)
+    except ValueError as e:
+        raise ConfigError(f'{path}: invalid JSON ({e})')
+    try:
+        check_config(config)
+    except ConfigError as e:
+        raise ConfigError(f'{path}: {e}')
+    problems = errors(validate_config(config, duplicates))
+    if strict:
+        new = [problem for problem in problems if problem not in allowed]
+        if new:
+            raise ConfigError(f'{path}: {len(new)} new validation error(s), first: {new[0]}')
+        if problems:
+            logger.warning('%s: still has %d validation error(s)', path, len(problems))
+    else:
+        for problem in problems:
+            logger.error('%s: %s', path, problem)
+    version = hashlib.sha1(raw).hexdigest()[:12]
+    try:
+        return Catalogue(config, version=version, path=str(path), name=name, problems=problems)
+    except (AttributeError, KeyError, TypeError) as e:
+        # A nested entry of the wrong shape, already reported by the validator
+        raise ConfigError(f'{path}: cannot be indexed ({type(e).__name__}: {e})')
+
+
+def catalogue_paths():
+    """Return ``{name: config path}`` for every catalogue, the default first."""
+    paths = {DEFAULT_CATALOGUE: str(getattr(
+        settings, 'MAP_CONFIG_PATH', os.path.join(settings.BASE_DIR, 'map_config.json')))}
+    for name, path in getattr(settings, 'MAP_CATALOGUES', {}).items():
+        paths.setdefault(name, str(path))
+    return paths
+
+
+def config_path(name=None):
+    """Return the config file for a catalogue. Raises KeyError for unknown names."""
+    return catalogue_paths()[name or DEFAULT_CATALOGUE]
+
+
+def backup_path(path):
+    root, ext = os.path.splitext(path)
+    return f'{root}_backup{ext}'
+
+
+# The default catalogue is always kept; the others are loaded on first use
+# and the least recently used are dropped beyond MAP_CATALOGUE_CACHE_SIZE.
+_current = None
+_catalogues = OrderedDict()
+_lru_lock = threading.Lock()
+_load_lock = threading.Lock()
+_watchers = {}
+# First loads, one per catalogue; concurrent first requests share it
+catalogue_loads = SingleFlight()
+
+
+def get_catalogue(name=None):
+    """
+    Return the current snapshot of a catalogue, loading it on first use.
+
+    Raises KeyError if ``name`` isn't a configured catalogue.
+    """
+    if not name or name == DEFAULT_CATALOGUE:
+        catalogue = _current
+        if catalogue is None:
+            catalogue = _initial_load(DEFAULT_CATALOGUE)
+        return catalogue
+    with _lru_lock:
+        catalogue = _catalogues.get(name)
+        if catalogue is not None:
+            _catalogues.move_to_end(name)
+    if catalogue is None:
+        catalogue = _initial_load(name)
+    return catalogue
+
+
+def loaded_catalogues():
+    """Names of the catalogues currently held in memory."""
+    with _lru_lock:
+        return ([DEFAULT_CATALOGUE] if _current is not None else []) + list(_catalogues)
+
+
+def _publish(name, catalogue):
+    global _current
+    if name == DEFAULT_CATALOGUE:
+        previous, _current = _current, catalogue
+        catalogue_published.send(sender=Catalogue, name=name, catalogue=catalogue, previous=previous)
+        return
+    evicted = []
+    with _lru_lock:
+        previous = _catalogues.get(name)
+        _catalogues[name] = catalogue
+        _catalogues.move_to_end(name)
+        limit = max(getattr(settings, 'MAP_CATALOGUE_CACHE_SIZE', 4), 1)
+        while len(_catalogues) > limit:
+            evicted.append(_catalogues.popitem(last=False)[0])
+    catalogue_published.send(sender=Catalogue, name=name, catalogue=catalogue, previous=previous)
+    for old in evicted:
+        logger.info('Dropped catalogue %s from memory', old)
+        watcher = _watchers.pop(old, None)
+        if watcher is not None:
+            watcher.stop()
+
+
+def _published(name):
+    if name == DEFAULT_CATALOGUE:
+        return _current
+    with _lru_lock:
+        return _catalogues.get(name)
+
+
+def _initial_load(name):
+    catalogue = load_once(name)
+    if getattr(settings, 'MAP_CONFIG_WATCH', False):
+        start_watcher(name)
+    return catalogue
+
+
+def load_once(name=None):
+    """Load and publish a catalogue unless it already is, without starting its watcher."""
+    name = name or DEFAULT_CATALOGUE
+    path = config_path(name)
+    return catalogue_loads.do(name, lambda: _load_and_publish(name, path))
+
+
+def _load_and_publish(name, path):
+    catalogue = _published(name)
+    if catalogue is not None:
+        return catalogue
+    # Parse outside _load_lock so loading one catalogue doesn't hold up others
+    for candidate in (path, backup_path(path)):
+        try:
+            catalogue = load_catalogue(candidate, name=name)
+            break
+        except FileNotFoundError:
+            continue
+        except ConfigError as e:
+            logger.error('Ignoring broken config: %s', e)
+    if catalogue is None:
+        catalogue = Catalogue({}, path=path, name=name)
+    with _load_lock:
+        # A reload may have published a newer snapshot in the meantime
+        published = _published(name)
+        if published is not None:
+            return published
+        _publish(name, catalogue)
+    return catalogue
+
+
+def reload_catalogue(name=None):
+    """
+    Rebuild a catalogue from disk and publish it.
+
+    Returns the new catalogue, or None if the file was missing, broken,
+    unchanged or has validation errors the current snapshot doesn't, in
+    which case the previous snapshot stays in place.
+    """
+    name = name or DEFAULT_CATALOGUE
+    path = config_path(name)
+    # Refuse only errors the running config doesn't already have; with no
+    # config running, take anything a first load would
+    current = _published(name)
+    strict = bool(current and current.version)
+    # Parse outside _load_lock so first-time get_catalogue() callers don't wait on it
+    try:
+        catalogue = load_catalogue(path, strict=strict, name=name, allowed=current.problems if strict else ())
+    except FileNotFoundError:
+        logger.warning('Config %s disappeared; keeping version %s', path, current and current.version)
+        return None
+    except ConfigError as e:
+        logger.error('Rejected config reload: %s', e)
+        return None
+    with _load_lock:
+        current = _published(name)
+        if current is not None and current.version == catalogue.version:
+            return None
+        _publish(name, catalogue)
+    logger.info('Published config version %s from %s', catalogue.version, path)
+    return catalogue
+
+
+def set_catalogue(catalogue, name=None):
+    """Publish a catalogue directly (used by tests and preloading)."""
+    with _load_lock:
+        _publish(name or DEFAULT_CATALOGUE, catalogue)
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class ConfigWatcher(threading.Thread):
+    """
+    Background thread that reloads the catalogue when the config file changes.
+
+    Uses inotify on Linux and falls back to polling the file's mtime/size.
+    Atomic saves (a temporary file renamed over the config) arrive as
+    ``IN_MOVED_TO``; a deleted or renamed-away config only logs a warning and
+    keeps the current snapshot until a new file appears.
+    """
+
+    def __init__(self, path, interval=1.0, on_change=reload_catalogue):
+        super().__init__(name='map-config-watcher', daemon=True)
+        self.path = os.path.abspath(path)
+        self.interval = interval
+        self.on_change = on_change
+        self._stop_event = threading.Event()
+        self._inotify_fd = None
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        try:
+            self._inotify_fd = self._open_inotify()
+        except OSError as e:
+            logger.info('inotify unavailable (%s); polling %s every %ss', e, self.path, self.interval)
+        try:
+            if self._inotify_fd is not None:
+                self._run_inotify()
+            else:
+                self._run_polling()
+        finally:
+            if self._inotify_fd is not None:
+                os.close(self._inotify_fd)
+
+    def _changed(self):
+        # Give editors a moment to finish writing before we read the file
+        time.sleep(0.05)
+        try:
+            self.on_change()
+        except Exception:
+            logger.exception('Config reload failed')
+
+    def _run_polling(self):
+        signature = _file_signature(self.path)
+        while not self._stop_event.wait(self.interval):
+            current = _file_signature(self.path)
+            if current != signature:
+                signature = current
+                if current is not None:
+                    self._changed()
+
+    def _open_inotify(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError('not linux')
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        directory = os.fsencode(os.path.dirname(self.path))
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY | IN_DELETE | IN_MOVED_FROM
+        if libc.inotify_add_watch(fd, directory, mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, 'inotify_add_watch failed')
+        return fd
+
+    def _run_inotify(self):
+        name = os.fsencode(os.path.basename(self.path))
+        while not self._stop_event.is_set():
+            readable, _, _ = select.select([self._inotify_fd], [], [], self.interval)
+            if not readable:
+                continue
+            # Drain everything queued so a burst of writes triggers one reload
+            seen = False
+            while True:
+                try:
+                    data = os.read(self._inotify_fd, 64 * 1024)
+                except BlockingIOError:
+                    break
+                offset = 0
+                while offset < len(data):
+                    _, _, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+                    offset += _INOTIFY_EVENT.size
+                    event_name = data[offset:offset + length].rstrip(b'\0')
+                    offset += length
+                    if event_name == name:
+                        seen = True
+                if not select.select([self._inotify_fd], [], [], 0.05)[0]:
+                    break
+            if seen:
+                self._changed()
+
+
+def start_watcher(name=None):
+    """Start the config watcher for a catalogue if it is not already running."""
+    name = name or DEFAULT_CATALOGUE
+    with _load_lock:
+        watcher = _watchers.get(name)
+        if watcher is not None and watcher.is_alive():
+            return watcher
+        watcher = _watchers[name] = ConfigWatcher(
+            config_path(name),
+            interval=getattr(settings, 'MAP_CONFIG_POLL_INTERVAL', 1.0),
+            on_change=functools.partial(reload_catalogue, name),
+        )
+        watcher.start()
+    return watcher
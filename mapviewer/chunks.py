@@ -0,0 +1,93 @@
+"""
+The indicator menu data of a page, split into content-hashed chunks.
+
+A page inlines only the outline of its themes; the title, icon and
+thumbnail of each indicator its menus list come from small scripts that
+merge them into ``window.MAP_INDICATORS``. The indicators are grouped by the
+set of scopes that can show them (each theme group, and the all-themes pages
+of the site root, ``None``), one chunk per distinct set:
+
+- indicators only a single theme group reaches share one chunk with the
+  root pages;
+- indicators several theme groups reach go into a chunk those groups share.
+
+A page then loads exactly the chunks of its scope, so its payload grows with
+its theme group rather than the catalogue, and no indicator is sent twice.
+Chunks are named by a hash of their content and cached as immutable.
+"""
+import hashlib
+import json
+
+from .catalogue import DEFAULT_CATALOGUE
+from .templatetags.thumbnail_tags import thumbnail_manifest
+
+CHUNK_GLOBAL = 'MAP_INDICATORS'
+
+
+def menu_entry(indicator, thumb=None):
+    """What the menus need of an indicator."""
+    return {
+        'title': indicator.get('title', ''),
+        'icon': indicator.get('icon', ''),
+        'thumb': {
+            'avif': thumb.get('avif', ''),
+            'webp': thumb.get('webp', ''),
+            'preview': thumb.get('preview', ''),
+        } if thumb else None,
+    }
+
+
+class ChunkSet:
+    """The chunks of one catalogue snapshot: ``bodies`` by hash and the hashes each scope loads."""
+
+    def __init__(self, catalogue, thumbnails=None):
+        thumbnails = thumbnails or {}
+        self.bodies = {}
+        self.scope_chunks = {}
+        if not catalogue.has_themes:
+            return
+        theme_groups = {}
+        for group_id, group in catalogue.theme_groups.items():
+            for theme_id in group.get('themeIds', []):
+                theme_groups.setdefault(theme_id, []).append(group_id)
+
+        scopes = {}
+        for theme in catalogue.themes:
+            reach = {None, *theme_groups.get(theme['id'], ())}
+            for subtheme in theme.get('subthemes', []):
+                for indicator_id in subtheme.get('indicators', []):
+                    if indicator_id in catalogue.indicators:
+                        scopes.setdefault(indicator_id, set()).update(reach)
+
+        partitions = {}
+        for indicator_id, reach in scopes.items():
+            partitions.setdefault(frozenset(reach), []).append(indicator_id)
+        for reach, indicator_ids in partitions.items():
+            entries = {
+                indicator_id: menu_entry(catalogue.indicators[indicator_id], thumbnails.get(indicator_id))
+                for indicator_id in indicator_ids
+            }
+            data = json.dumps(entries, ensure_ascii=False, separators=(',', ':'))
+            body = f'window.{CHUNK_GLOBAL}=Object.assign(window.{CHUNK_GLOBAL}||{{}},{data});\n'.encode('utf-8')
+            chunk = hashlib.md5(body).hexdigest()[:12]
+            self.bodies[chunk] = body
+            for scope in reach:
+                self.scope_chunks.setdefault(scope, []).append(chunk)
+
+    def for_scope(self, theme_group_id=None):
+        """The chunk hashes a page of a theme group (or of the whole site) loads."""
+        return self.scope_chunks.get(theme_group_id, [])
+
+
+def chunk_set(catalogue):
+    """The ChunkSet of a catalogue snapshot, rebuilt when the thumbnails change."""
+    thumbnails = thumbnail_manifest(catalogue.name or DEFAULT_CATALOGUE)
+    cached = catalogue.cache.get('chunks')
+    # The manifest is re-read (a new dict) only when its file changes
+    if cached is None or (cached[0] is not thumbnails and (cached[0] or thumbnails)):
+        chunks = ChunkSet(catalogue, thumbnails)
+        if cached is not None:
+            # Pages already cached may still refer to the old chunks
+            chunks.bodies = dict(cached[1].bodies, **chunks.bodies)
+        cached = catalogue.cache['chunks'] = (thumbnails, chunks)
+    return cached[1]
@@ -0,0 +1,161 @@
+"""
+Compact in-memory form of a parsed config.
+
+``json.load`` gives every occurrence of a string its own object, so the
+long indicator descriptions, source HTML and embed URLs that many
+indicators share are held once per indicator, and each indicator is a full
+dict. ``compact_config`` rebuilds a config with:
+
+- IDs interned, so the keys of ``indicators`` and the IDs listed by
+  subthemes and theme groups are the same objects;
+- every other string deduplicated through a per-config ``StringPool``
+  (freed with the catalogue, unlike ``sys.intern``);
+- indicators as slotted ``IndicatorRecord`` mappings.
+
+Records behave like the read-only dicts they replace (``get``, ``[]``,
+iteration, ``dict(record)``, template lookups) and can carry their JSON
+pre-encoded as UTF-8 (``payload``) for writing straight into responses. To
+serialise a compacted config use ``json.dumps(config, default=dict)``.
+"""
+import json
+import sys
+from collections.abc import Mapping
+
+INDICATOR_FIELDS = ('title', 'description', 'source', 'unit_of_measure', 'icon', 'map1_url', 'map2_url')
+
+
+class StringPool:
+    """Hands out one shared object per distinct string."""
+
+    def __init__(self):
+        self._strings = {}
+        self.lookups = 0
+
+    def __len__(self):
+        return len(self._strings)
+
+    def __call__(self, value):
+        if type(value) is not str:
+            return value
+        self.lookups += 1
+        return self._strings.setdefault(value, value)
+
+    def value(self, value):
+        """Pool ``value`` and any strings nested in lists or dicts."""
+        if isinstance(value, list):
+            return [self.value(item) for item in value]
+        if isinstance(value, dict):
+            return {self(key): self.value(item) for key, item in value.items()}
+        return self(value)
+
+
+class IndicatorRecord(Mapping):
+    """
+    One indicator, read-only.
+
+    Known fields live in slots and anything else in ``_extra``; ``_keys``
+    keeps the original key order and is shared by records with the same
+    layout. Missing fields are unset slots, so templates see them as
+    missing rather than None. The slots are named ``_<field>``: Django's
+    template lookup re-raises an AttributeError for a name in ``dir()``, so
+    a public slot left unset would break ``{{ indicator.source }}``.
+    """
+
+    __slots__ = ('id', '_keys', '_extra', '_payload') + tuple(f'_{field}' for field in INDICATOR_FIELDS)
+    _fields = {field: f'_{field}' for field in INDICATOR_FIELDS}
+
+    def __init__(self, indicator_id, data, pool, layouts):
+        self.id = indicator_id
+        extra = None
+        for key, value in data.items():
+            if key in self._fields:
+                setattr(self, self._fields[key], pool.value(value))
+            else:
+                if extra is None:
+                    extra = {}
+                extra[pool(key)] = pool.value(value)
+        keys = tuple(data)
+        self._keys = layouts.setdefault(keys, keys)
+        self._extra = extra
+        self._payload = None
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            try:
+                return getattr(self, self._fields[key])
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __repr__(self):
+        return f'IndicatorRecord({self.id!r}, {dict(self)!r})'
+
+    @property
+    def payload(self):
+        """The record as compact UTF-8 JSON, encoded on first use."""
+        if self._payload is None:
+            self._payload = json.dumps(dict(self), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return self._payload
+
+
+def compact_config(config, preencode=False):
+    """
+    Return a compacted copy of a themed config and its StringPool.
+
+    Old flat configs are returned unchanged. With ``preencode`` every
+    indicator's ``payload`` is built up front.
+    """
+    pool = StringPool()
+    if 'themes' not in config:
+        return config, pool
+
+    def intern_id(value):
+        return sys.intern(value) if type(value) is str else value
+
+    def node(data, ids_key=None):
+        copy = {}
+        for key, value in data.items():
+            if key == 'id':
+                copy[key] = intern_id(value)
+            elif key == ids_key and isinstance(value, list):
+                copy[key] = [intern_id(item) for item in value]
+            elif key == 'subthemes' and isinstance(value, list):
+                copy[key] = [node(item, 'indicators') if isinstance(item, dict) else item for item in value]
+            else:
+                copy[pool(key)] = pool.value(value)
+        return copy
+
+    layouts = {}
+    indicators = {}
+    for indicator_id, data in config.get('indicators', {}).items():
+        indicator_id = intern_id(indicator_id)
+        if isinstance(data, dict):
+            record = IndicatorRecord(indicator_id, data, pool, layouts)
+            if preencode:
+                record.payload
+            indicators[indicator_id] = record
+        else:
+            indicators[indicator_id] = pool.value(data)
+
+    compacted = {}
+    for key, value in config.items():
+        if key == 'indicators':
+            compacted[key] = indicators
+        elif key == 'themes' and isinstance(value, list):
+            compacted[key] = [node(theme) if isinstance(theme, dict) else theme for theme in value]
+        elif key == 'themeGroups' and isinstance(value, list):
+            compacted[key] = [node(group, 'themeIds') if isinstance(group, dict) else group for group in value]
+        else:
+            compacted[key] = pool.value(value)
+    return compacted, pool
@@ -0,0 +1,248 @@
+"""
+Structural diff of two map configs and the impact of the changes.
+
+``diff_configs`` compares theme groups, themes, subthemes and indicators by
+ID and reports what was added, removed, moved or edited. ``impact`` turns
+those changes into the exported files, live URLs and cache keys that need
+rebuilding or purging. Both are linear in the size of the configs.
+
+Every page embeds the themes (with their indicators) of its theme group, or
+all themes when it has none, so a page is affected when anything it shows
+changes. Cache keys name the objects a response was built from:
+``catalogue``, ``group:<id>``, ``all-themes`` (the pages without a theme
+group), ``theme:<id>``, ``subtheme:<id>`` and ``indicator:<id>``.
+"""
+from collections import namedtuple
+from collections.abc import Mapping
+
+from .catalogue import embed_hosts
+
+ADDED = 'added'
+REMOVED = 'removed'
+MOVED = 'moved'
+EDITED = 'edited'
+
+Change = namedtuple('Change', 'kind action id detail')
+
+# Cache key of the pages that show every theme
+ALL_THEMES_KEY = 'all-themes'
+
+# Exported pages per scope besides index.html (see export_to_gh_pages)
+SECTION_PAGES = ('themes', 'indicators', 'themeGroups')
+
+
+def _fields(data, skip):
+    return {key: value for key, value in data.items() if key not in skip}
+
+
+def _edited(old, new):
+    """Names of the fields that differ between two flat dicts."""
+    return sorted(key for key in old.keys() | new.keys() if old.get(key) != new.get(key))
+
+
+class _Index:
+    """ID lookups for one config."""
+
+    def __init__(self, config):
+        self.indicators = config.get('indicators', {}) if 'themes' in config else {}
+        self.groups = {}
+        for position, group in enumerate(config.get('themeGroups', [])):
+            self.groups.setdefault(group['id'], (position, group))
+        self.themes = {}
+        self.subthemes = {}
+        self.placements = {}  # indicator id -> [(subtheme id, position)]
+        for position, theme in enumerate(config.get('themes', [])):
+            self.themes.setdefault(theme['id'], (position, theme))
+            for sub_position, subtheme in enumerate(theme.get('subthemes', [])):
+                self.subthemes.setdefault(subtheme['id'], (theme['id'], sub_position, subtheme))
+                for ind_position, indicator_id in enumerate(subtheme.get('indicators', [])):
+                    self.placements.setdefault(indicator_id, []).append((subtheme['id'], ind_position))
+
+        # Which themes show an indicator, and which scopes show a theme
+        self.indicator_themes = {}
+        for indicator_id, places in self.placements.items():
+            self.indicator_themes[indicator_id] = {self.subthemes[s][0] for s, _ in places}
+        self.theme_groups = {}
+        for group_id, (_, group) in self.groups.items():
+            for theme_id in group.get('themeIds', []):
+                self.theme_groups.setdefault(theme_id, set()).add(group_id)
+
+
+def diff_configs(old, new):
+    """Return the list of Changes that turn ``old`` into ``new``."""
+    return _diff(_Index(old), _Index(new))
+
+
+def _diff(a, b):
+    changes = []
+
+    def compare(kind, old_items, new_items, describe):
+        for key in old_items.keys() - new_items.keys():
+            changes.append(Change(kind, REMOVED, key, None))
+        for key in new_items.keys() - old_items.keys():
+            changes.append(Change(kind, ADDED, key, None))
+        for key in old_items.keys() & new_items.keys():
+            changes.extend(describe(key, old_items[key], new_items[key]))
+
+    def group_changes(key, old, new):
+        (old_pos, old_group), (new_pos, new_group) = old, new
+        fields = _edited(_fields(old_group, ('id',)), _fields(new_group, ('id',)))
+        if fields:
+            yield Change('themeGroup', EDITED, key, fields)
+        if old_pos != new_pos:
+            yield Change('themeGroup', MOVED, key, (old_pos, new_pos))
+
+    def theme_changes(key, old, new):
+        (old_pos, old_theme), (new_pos, new_theme) = old, new
+        fields = _edited(_fields(old_theme, ('id', 'subthemes')), _fields(new_theme, ('id', 'subthemes')))
+        old_order = [s['id'] for s in old_theme.get('subthemes', [])]
+        new_order = [s['id'] for s in new_theme.get('subthemes', [])]
+        if old_order != new_order:
+            fields.append('subthemes')
+        if fields:
+            yield Change('theme', EDITED, key, fields)
+        if old_pos != new_pos:
+            yield Change('theme', MOVED, key, (old_pos, new_pos))
+
+    def subtheme_changes(key, old, new):
+        (old_theme, old_pos, old_sub), (new_theme, new_pos, new_sub) = old, new
+        fields = _edited(_fields(old_sub, ('id',)), _fields(new_sub, ('id',)))
+        if fields:
+            yield Change('subtheme', EDITED, key, fields)
+        if (old_theme, old_pos) != (new_theme, new_pos):
+            yield Change('subtheme', MOVED, key, (old_theme, new_theme))
+
+    def indicator_changes(key, old, new):
+        if isinstance(old, Mapping) and isinstance(new, Mapping):
+            fields = _edited(old, new)
+        else:
+            fields = [] if old == new else ['value']
+        if fields:
+            yield Change('indicator', EDITED, key, fields)
+        # Reordering within a subtheme shows up as an edit of the subtheme
+        old_places = [s for s, _ in a.placements.get(key, [])]
+        new_places = [s for s, _ in b.placements.get(key, [])]
+        if old_places != new_places:
+            yield Change('indicator', MOVED, key, (old_places, new_places))
+
+    compare('themeGroup', a.groups, b.groups, group_changes)
+    compare('theme', a.themes, b.themes, theme_changes)
+    compare('subtheme', a.subthemes, b.subthemes, subtheme_changes)
+    compare('indicator', a.indicators, b.indicators, indicator_changes)
+    order = {'themeGroup': 0, 'theme': 1, 'subtheme': 2, 'indicator': 3}
+    changes.sort(key=lambda change: (order[change.kind], change.id, change.action))
+    return changes
+
+
+def export_pages(config, scope):
+    """Exported files for a scope (None for the ungrouped site), relative to the catalogue."""
+    prefix = f'{scope}/' if scope else ''
+    pages = [f'{prefix}index.html']
+    pages.extend(f'{prefix}{name}.html' for name in SECTION_PAGES if name in config)
+    if not scope and 'themes.html' not in pages:
+        pages.append('themes.html')
+    return pages
+
+
+def impact(old, new, changes=None, catalogue=None):
+    """
+    Work out what a set of changes affects.
+
+    Returns a dict with the ``changes``, the affected ``scopes`` (theme group IDs, ``None``
+    for the ungrouped site), exported ``pages``, live ``responses`` (URL
+    paths) and ``cache_keys``; ``full`` is True when everything changed.
+    ``catalogue`` is the name of a regional catalogue, which prefixes the
+    paths.
+    """
+    a, b = _Index(old), _Index(new)
+    if changes is None:
+        changes = _diff(a, b)
+    result = {'changes': changes, 'full': False, 'scopes': [], 'pages': [], 'responses': [], 'cache_keys': []}
+    if not changes:
+        return result
+
+    cache_keys = {'catalogue'}
+    themes = set()        # themes whose rendering changed
+    own_pages = set()     # indicators whose own page_config changed
+    groups = set()        # theme groups whose theme list changed
+
+    for change in changes:
+        if change.kind == 'themeGroup':
+            cache_keys.add(f'group:{change.id}')
+            if change.action != MOVED:
+                groups.add(change.id)
+        elif change.kind == 'theme':
+            cache_keys.add(f'theme:{change.id}')
+            themes.add(change.id)
+        elif change.kind == 'subtheme':
+            cache_keys.add(f'subtheme:{change.id}')
+            for index in (a, b):
+                if change.id in index.subthemes:
+                    themes.add(index.subthemes[change.id][0])
+        else:
+            cache_keys.add(f'indicator:{change.id}')
+            if change.action != MOVED:
+                own_pages.add(change.id)
+            for index in (a, b):
+                themes.update(index.indicator_themes.get(change.id, ()))
+                for subtheme_id, _ in index.placements.get(change.id, ()):
+                    cache_keys.add(f'subtheme:{subtheme_id}')
+
+    for theme_id in themes:
+        cache_keys.add(f'theme:{theme_id}')
+        for index in (a, b):
+            groups.update(index.theme_groups.get(theme_id, ()))
+    cache_keys.update(f'group:{group_id}' for group_id in groups)
+
+    # Every page hints the catalogue's embed hosts in order of use, so
+    # recount them when an embed URL was added, removed or edited
+    urls_changed = any(
+        change.kind == 'indicator' and (
+            change.action in (ADDED, REMOVED)
+            or (change.action == EDITED and {'map1_url', 'map2_url', 'value'} & set(change.detail))
+        )
+        for change in changes
+    )
+    all_scopes = [None] + list(b.groups)
+    if urls_changed and embed_hosts(a.indicators) != embed_hosts(b.indicators):
+        result['full'] = True
+        scopes = all_scopes
+    else:
+        scopes = ([None] if themes else []) + [group_id for group_id in b.groups if group_id in groups]
+    removed_groups = [group_id for group_id in a.groups if group_id not in b.groups]
+    if None in scopes:
+        cache_keys.add(ALL_THEMES_KEY)
+    if result['full']:
+        cache_keys.update(f'group:{group_id}' for group_id in b.groups)
+
+    page_prefix = f'{catalogue}/' if catalogue else ''
+    url_prefix = f'/catalogues/{catalogue}/' if catalogue else '/'
+    pages = set()
+    responses = set()
+    indicator_ids = list(b.indicators) + [key for key in a.indicators if key not in b.indicators]
+    for scope in scopes + removed_groups:
+        if scope in removed_groups:
+            pages.update(export_pages(old, scope))
+        else:
+            pages.update(export_pages(new, scope))
+        query = f'?theme_group={scope}' if scope else ''
+        responses.add(f'{url_prefix}{query}')
+        responses.update(f'{url_prefix}{indicator_id}/{query}' for indicator_id in indicator_ids)
+    # An edited indicator's own page changes wherever it is viewed
+    for indicator_id in own_pages:
+        for scope in all_scopes:
+            query = f'?theme_group={scope}' if scope else ''
+            responses.add(f'{url_prefix}{indicator_id}/{query}')
+    pages = {page_prefix + page for page in pages}
+    pages.add(page_prefix + 'map_config.json')
+    if len(pages) > 1:
+        # The service worker's precache manifest lists every page
+        pages.add('sw.js')
+
+    result.update(
+        scopes=scopes,
+        pages=sorted(pages),
+        responses=sorted(responses),
+        cache_keys=sorted(cache_keys),
+    )
+    return result
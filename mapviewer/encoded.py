@@ -0,0 +1,154 @@
+"""
+Responses kept as ready-to-send bytes.
+
+An ``EncodedBody`` holds a rendered page or JSON document once per content
+coding (identity, gzip and, when the ``brotli`` package is installed, br)
+plus an ETag per coding (``"<hash>"``, ``"<hash>-gzip"``, ``"<hash>-br"``,
+as the export preview server sends them), since the variants are different
+bytes. ``encoded_response`` picks the variant the client's
+``Accept-Encoding`` allows and hands the stored bytes object to the
+response as is, so serving a cached body does no rendering, encoding or
+copying. ``ResponseCache`` is an LRU of bodies bounded by their total size.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:  # gzip and identity only
+    brotli = None
+
+# Preferred first when the client accepts several
+CODINGS = ('br', 'gzip')
+
+
+class EncodedBody:
+    """
+    One response body in every useful content coding.
+
+    ``best`` spends more time compressing for smaller output; use it for
+    bodies built off the request path. ``headers`` are sent with every
+    response for the body, 304s included.
+    """
+
+    __slots__ = ('content_type', 'etags', 'variants', 'size', 'headers')
+
+    def __init__(self, data, content_type, best=False, headers=None):
+        variants = {'gzip': gzip.compress(data, compresslevel=9 if best else 6, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(data, quality=11 if best else 5)
+        # Only keep codings that actually make the body smaller
+        self.variants = {coding: body for coding, body in variants.items() if len(body) < len(data)}
+        self.variants['identity'] = data
+        self.content_type = content_type
+        digest = hashlib.md5(data).hexdigest()[:20]
+        self.etags = {
+            coding: f'"{digest}"' if coding == 'identity' else f'"{digest}-{coding}"' for coding in self.variants
+        }
+        self.size = sum(len(body) for body in self.variants.values())
+        self.headers = headers or {}
+
+
+def accepted_codings(header):
+    """Return ``{coding: q}`` from an Accept-Encoding header."""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_coding(header, available):
+    """The best coding in ``available`` that ``header`` accepts, else 'identity'."""
+    if not header:
+        return 'identity'
+    accepted = accepted_codings(header)
+    wildcard = accepted.get('*', 0.0)
+    for coding in CODINGS:
+        if coding in available and accepted.get(coding, wildcard) > 0:
+            return coding
+    return 'identity'
+
+
+def etag_matches(header, etag):
+    """Whether an If-None-Match header matches ``etag`` (weak comparison, as RFC 9110 asks)."""
+    tags = parse_etags(header)
+    return tags == ['*'] or etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in tags}
+
+
+def encoded_response(request, body):
+    """An HttpResponse serving ``body`` in the coding the request accepts."""
+    coding = choose_coding(request.META.get('HTTP_ACCEPT_ENCODING', ''), body.variants)
+    etag = body.etags[coding]
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''), etag):
+        response = HttpResponseNotModified()
+    else:
+        data = body.variants[coding]
+        # HttpResponse keeps a bytes object without copying it
+        response = HttpResponse(data, content_type=body.content_type)
+        if coding != 'identity':
+            response['Content-Encoding'] = coding
+        response['Content-Length'] = str(len(data))
+    response['ETag'] = etag
+    for name, value in body.headers.items():
+        response[name] = value
+    patch_vary_headers(response, ('Accept-Encoding',))
+    # Already post-processed and compressed; middleware must leave it alone
+    response.preencoded = True
+    return response
+
+
+class ResponseCache:
+    """Thread-safe LRU of EncodedBody objects, bounded by their total bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._bodies)
+
+    def get(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._bodies.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        """Store ``body`` (unless it alone exceeds the budget) and return it."""
+        if body.size > self.max_bytes:
+            return body
+        with self._lock:
+            old = self._bodies.pop(key, None)
+            if old is not None:
+                self.bytes -= old.size
+            self._bodies[key] = body
+            self.bytes += body.size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._bodies.popitem(last=False)
+                self.bytes -= evicted.size
+        return body
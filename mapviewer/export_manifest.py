@@ -0,0 +1,71 @@
+"""
+Content hashes for files in a static export.
+
+Used to build the service worker's precache manifest: every exported page
+plus the local files those pages (and their stylesheets) actually reference.
+"""
+import hashlib
+import posixpath
+import re
+from pathlib import Path
+
+_PAGE_REF = re.compile(r'''\b(?:href|src)=["']([^"'#?]+)''')
+_SRCSET = re.compile(r'''\bsrcset=["']([^"']+)''')
+_CSS_REF = re.compile(r'''(?:url\(\s*["']?|@import\s+["'])([^"')?#]+)''')
+
+
+def hash_file(path, chunk_size=64 * 1024):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def _local_ref(base, ref):
+    """Resolve a reference found in ``base`` (a root-relative posix path)."""
+    if ref.startswith(('http:', 'https:', 'data:', 'mailto:', '//', '#')) or not ref.strip():
+        return None
+    path = ref[1:] if ref.startswith('/') else posixpath.join(posixpath.dirname(base), ref)
+    path = posixpath.normpath(path)
+    return None if path.startswith('..') else path
+
+
+def _references(path, text):
+    if path.endswith('.css'):
+        return _CSS_REF.findall(text)
+    refs = _PAGE_REF.findall(text)
+    for srcset in _SRCSET.findall(text):
+        refs.extend(candidate.split()[0] for candidate in srcset.split(',') if candidate.strip())
+    return refs
+
+
+def referenced_files(root, pages):
+    """
+    Return the set of root-relative paths that ``pages`` depend on.
+
+    Follows ``href``/``src``/``srcset`` attributes in the pages and
+    ``url()``/``@import`` references in the stylesheets they load, however
+    deeply nested. Only files that exist under ``root`` are included, so a
+    reference the export didn't write is never precached.
+    """
+    root = Path(root)
+    found = set(pages)
+    pending = list(pages)
+    while pending:
+        base = pending.pop()
+        if not base.endswith(('.html', '.css')):
+            continue
+        text = (root / base).read_text(encoding='utf-8', errors='replace')
+        for ref in _references(base, text):
+            path = _local_ref(base, ref)
+            if path and path not in found and (root / path).is_file():
+                found.add(path)
+                pending.append(path)
+    return found
+
+
+def precache_manifest(root, pages):
+    """Return ``[{'url', 'revision'}]`` for the pages and every local file they reference."""
+    root = Path(root)
+    return [{'url': path, 'revision': hash_file(root / path)} for path in sorted(referenced_files(root, pages))]
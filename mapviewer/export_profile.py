@@ -0,0 +1,185 @@
+"""
+Timing and byte accounting for the static export.
+
+``ExportProfiler.stage(name, page=None)`` is a context manager that adds the
+wall-clock and CPU time spent inside it to the stage's totals, and to the
+page's own breakdown when one is given. Reads and writes are counted with
+``read``/``wrote`` (or ``wrote_tree`` after copying a directory) against the
+stage that is running. Stages can nest; time is charged to every open stage,
+bytes only to the innermost.
+
+With ``profile_stages`` the named stages also run under one ``cProfile``
+profiler, whose stats can be dumped for ``pstats`` or snakeviz.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+from contextlib import contextmanager
+
+
+class StageStats:
+    __slots__ = ('calls', 'wall', 'cpu', 'bytes_read', 'bytes_written', 'files_read', 'files_written')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.files_read = 0
+        self.files_written = 0
+
+    def as_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['wall'] = round(self.wall, 6)
+        data['cpu'] = round(self.cpu, 6)
+        return data
+
+
+class ExportProfiler:
+    """Collects per-stage and per-page timings and byte counts for one export."""
+
+    def __init__(self, profile_stages=()):
+        self.stages = {}
+        self.pages = {}
+        self.profile_stages = frozenset(profile_stages)
+        self.profiler = cProfile.Profile() if self.profile_stages else None
+        self._open = []
+        self._profiling = 0
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+
+    def _stats(self, name):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        return stats
+
+    @contextmanager
+    def stage(self, name, page=None):
+        stats = self._stats(name)
+        self._open.append(stats)
+        profiling = name in self.profile_stages
+        if profiling:
+            # Nested profiled stages share the outer one's enable()
+            if not self._profiling:
+                self.profiler.enable()
+            self._profiling += 1
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stats
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            if profiling:
+                self._profiling -= 1
+                if not self._profiling:
+                    self.profiler.disable()
+            self._open.pop()
+            stats.calls += 1
+            stats.wall += wall
+            stats.cpu += cpu
+            if page is not None:
+                timings = self.pages.setdefault(page, {'stages': {}, 'bytes': 0})['stages']
+                timings[name] = {
+                    'wall': round(timings.get(name, {}).get('wall', 0) + wall, 6),
+                    'cpu': round(timings.get(name, {}).get('cpu', 0) + cpu, 6),
+                }
+
+    def _current(self):
+        return self._open[-1] if self._open else self._stats('other')
+
+    def read(self, nbytes, files=1):
+        stats = self._current()
+        stats.bytes_read += nbytes
+        stats.files_read += files
+
+    def wrote(self, nbytes, files=1, page=None):
+        stats = self._current()
+        stats.bytes_written += nbytes
+        stats.files_written += files
+        if page is not None:
+            self.pages.setdefault(page, {'stages': {}, 'bytes': 0})['bytes'] += nbytes
+
+    def wrote_tree(self, path):
+        """Count a directory just copied: every file was read once and written once."""
+        nbytes = files = 0
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                nbytes += os.path.getsize(os.path.join(dirpath, filename))
+                files += 1
+        self.read(nbytes, files)
+        self.wrote(nbytes, files)
+
+    def report(self, top_functions=25):
+        """The whole profile as a JSON-serialisable dict."""
+        stages = {name: stats.as_dict() for name, stats in self.stages.items()}
+        report = {
+            'wall': round(time.perf_counter() - self._started, 6),
+            'cpu': round(time.process_time() - self._cpu_started, 6),
+            'bytes_read': sum(stats.bytes_read for stats in self.stages.values()),
+            'bytes_written': sum(stats.bytes_written for stats in self.stages.values()),
+            'files_written': sum(stats.files_written for stats in self.stages.values()),
+            'stages': stages,
+            'pages': self.pages,
+        }
+        if self.profiler is not None:
+            report['profiled_stages'] = sorted(self.profile_stages)
+            report['hot_functions'] = self.hot_functions(top_functions)
+        return report
+
+    def hot_functions(self, limit=25):
+        """The functions with the most cumulative time in the profiled stages."""
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        rows = []
+        for (filename, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+            rows.append({
+                'function': f'{os.path.basename(filename)}:{line}({function})',
+                'calls': calls,
+                'total': round(total, 6),
+                'cumulative': round(cumulative, 6),
+            })
+        rows.sort(key=lambda row: row['cumulative'], reverse=True)
+        return rows[:limit]
+
+    def dump_stats(self, path):
+        """Write the cProfile stats for ``python -m pstats`` or snakeviz."""
+        self.profiler.dump_stats(path)
+
+    def write_report(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def summary(self, slowest_pages=10):
+        """Human-readable summary lines."""
+        report = self.report(top_functions=10)
+        lines = [
+            f"Export took {report['wall']:.2f}s wall, {report['cpu']:.2f}s CPU; "
+            f"read {report['bytes_read']:,} bytes, wrote {report['bytes_written']:,} bytes "
+            f"in {report['files_written']:,} files",
+            '',
+            f"{'stage':<18} {'calls':>6} {'wall s':>8} {'cpu s':>8} {'read':>12} {'written':>12} {'files':>6}",
+        ]
+        for name, stats in sorted(self.stages.items(), key=lambda item: item[1].wall, reverse=True):
+            lines.append(
+                f'{name:<18} {stats.calls:>6} {stats.wall:>8.3f} {stats.cpu:>8.3f} '
+                f'{stats.bytes_read:>12,} {stats.bytes_written:>12,} {stats.files_written:>6}'
+            )
+        if self.pages:
+            lines += ['', 'Slowest pages:']
+            totals = sorted(
+                ((sum(timing['wall'] for timing in page['stages'].values()), name, page)
+                 for name, page in self.pages.items()),
+                reverse=True,
+            )
+            for wall, name, page in totals[:slowest_pages]:
+                breakdown = ', '.join(f"{stage} {timing['wall'] * 1000:.1f}ms"
+                                      for stage, timing in page['stages'].items())
+                lines.append(f"  {name}: {wall * 1000:.1f}ms, {page['bytes']:,} bytes ({breakdown})")
+        if self.profiler is not None:
+            lines += ['', f"Hot functions in {', '.join(sorted(self.profile_stages))} (cumulative):"]
+            for row in report['hot_functions']:
+                lines.append(f"  {row['cumulative']:8.3f}s {row['calls']:>7} {row['function']}")
+        return lines
@@ -0,0 +1,277 @@
+"""
+Single-pass HTML post-processing for rendered and exported pages.
+
+``HtmlPostProcessor.process`` walks the document once with one tokenising
+regex and, as it goes, rewrites root-relative URLs, minifies whitespace and
+inline scripts/styles, drops comments and duplicate viewport tags, adds
+resource hints for the map embed hosts and marks the map iframes as lazy.
+The live view uses it through ``HtmlPostProcessMiddleware`` and the static
+exporter calls it directly.
+"""
+import re
+from collections import namedtuple
+
+_TAG_BODY = r'''(?:[^>"']|"[^"]*"|'[^']*')*'''
+_TOKEN = re.compile(
+    r'(?P<comment><!--(?!\[if).*?-->)'
+    r'|(?P<raw><(?P<rawtag>script|style|pre|textarea)\b' + _TAG_BODY + r'>.*?</(?P=rawtag)\s*>)'
+    r'|(?P<tag></?[a-zA-Z!]' + _TAG_BODY + r'>)',
+    re.S | re.I,
+)
+_TAG_NAME = re.compile(r'</?([a-zA-Z!][^\s>/]*)')
+_URL_ATTR = re.compile(r'''\b(href|src)=(["'])(?!//)(/static/|static/|/)''')
+_ID_ATTR = re.compile(r'''\bid=["']([^"']*)["']''')
+_WHITESPACE = re.compile(r'\s+')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+
+
+class PostProcessResult(namedtuple('PostProcessResult', 'html original_bytes final_bytes')):
+    __slots__ = ()
+
+    @property
+    def saved_bytes(self):
+        return self.original_bytes - self.final_bytes
+
+
+class HtmlPostProcessor:
+    """
+    Rewrites an HTML document in one pass.
+
+    ``static_prefix``/``root_prefix`` replace ``/static/`` and other
+    root-relative URLs in ``href``/``src`` attributes (None leaves them alone).
+    ``preconnect`` and ``dns_prefetch`` are origins to hint right after the
+    charset declaration. Iframes whose id is in ``lazy_iframes`` get
+    ``loading="lazy"``.
+    """
+
+    def __init__(self, static_prefix=None, root_prefix=None, minify=True,
+                 preconnect=(), dns_prefetch=(), lazy_iframes=('map1', 'map2')):
+        self.static_prefix = static_prefix
+        self.root_prefix = root_prefix
+        self.minify = minify
+        self.lazy_iframes = frozenset(lazy_iframes)
+        hints = []
+        for origin in preconnect:
+            hints.append(f'<link rel="preconnect" href="{origin}">')
+        for origin in list(preconnect) + list(dns_prefetch):
+            hints.append(f'<link rel="dns-prefetch" href="{origin}">')
+        self.hints = ''.join(hints)
+
+    def process(self, html):
+        out = []
+        append = out.append
+        position = 0
+        state = {'hints_done': not self.hints, 'viewport_seen': False}
+
+        for match in _TOKEN.finditer(html):
+            if match.start() > position:
+                append(self._text(html[position:match.start()]))
+            position = match.end()
+
+            if match.group('comment') is not None:
+                if not self.minify:
+                    append(match.group())
+            elif match.group('raw') is not None:
+                append(self._raw(match.group('raw'), match.group('rawtag').lower()))
+            else:
+                append(self._tag(match.group('tag'), state))
+
+        if position < len(html):
+            append(self._text(html[position:]))
+
+        result = ''.join(out)
+        return PostProcessResult(result, len(html.encode('utf-8')), len(result.encode('utf-8')))
+
+    def _text(self, text):
+        if not self.minify:
+            return text
+        if not text.strip():
+            return '\n' if '\n' in text else (' ' if text else '')
+        return _WHITESPACE.sub(' ', text)
+
+    def _rewrite_urls(self, tag):
+        if self.static_prefix is None and self.root_prefix is None:
+            return tag
+
+        def replace(match):
+            attr, quote, prefix = match.groups()
+            if prefix in ('/static/', 'static/'):
+                new_prefix = self.static_prefix if self.static_prefix is not None else prefix
+            else:
+                new_prefix = self.root_prefix if self.root_prefix is not None else prefix
+            return f'{attr}={quote}{new_prefix}'
+
+        return _URL_ATTR.sub(replace, tag)
+
+    def _tag(self, tag, state):
+        name_match = _TAG_NAME.match(tag)
+        name = name_match.group(1).lower() if name_match else ''
+        closing = tag.startswith('</')
+
+        if name == 'meta' and 'viewport' in tag:
+            if state['viewport_seen']:
+                return ''
+            state['viewport_seen'] = True
+
+        tag = self._rewrite_urls(tag)
+
+        if name == 'iframe' and self.lazy_iframes and 'loading=' not in tag:
+            id_match = _ID_ATTR.search(tag)
+            if id_match and id_match.group(1) in self.lazy_iframes:
+                tag = tag[:-1].rstrip() + ' loading="lazy">'
+
+        if not state['hints_done']:
+            # Hints go straight after <meta charset>, or before </head> at the latest
+            if name == 'meta' and 'charset' in tag:
+                state['hints_done'] = True
+                return tag + self.hints
+            if name == 'head' and closing:
+                state['hints_done'] = True
+                return self.hints + tag
+        return tag
+
+    def _raw(self, block, tag_name):
+        open_end = block.index('>') + 1
+        close_start = block.rindex('</')
+        open_tag = self._rewrite_urls(block[:open_end])
+        body = block[open_end:close_start]
+        close_tag = block[close_start:]
+        if not self.minify or tag_name in ('pre', 'textarea'):
+            return open_tag + body + close_tag
+        if tag_name == 'style':
+            body = _BLANK_LINES.sub('\n', '\n'.join(line.strip() for line in body.split('\n')))
+        elif 'src=' not in open_tag:
+            body = minify_script(body)
+        return open_tag + body.strip() + close_tag
+
+
+def minify_script(source):
+    """
+    Conservatively shrink inline JavaScript.
+
+    Strips indentation, blank lines and whole-line ``//`` comments. Lines
+    that start inside a template literal (or a string continued with a
+    backslash) are left untouched; ``_literal_newlines`` finds them.
+    """
+    lines = source.split('\n')
+    literal = _literal_newlines(source)
+    out = []
+    for index, line in enumerate(lines):
+        starts_literal = index > 0 and literal[index - 1]
+        ends_literal = index < len(literal) and literal[index]
+        if starts_literal:
+            out.append(line if ends_literal else line.rstrip())
+            continue
+        line = line.lstrip() if ends_literal else line.strip()
+        if ends_literal or (line and not line.startswith('//')):
+            out.append(line)
+    return '\n'.join(out)
+
+
+# Script scanner states
+_CODE, _LINE_COMMENT, _BLOCK_COMMENT, _SINGLE, _DOUBLE, _TEMPLATE, _REGEX = range(7)
+# States whose newlines (and whitespace) belong to the program text
+_LITERALS = frozenset((_SINGLE, _DOUBLE, _TEMPLATE, _REGEX))
+# A ``/`` after one of these (or at the start) begins a regex literal rather than a division
+_REGEX_AFTER = frozenset('(,=:[!&|?{};+-*%<>~^}')
+_REGEX_KEYWORDS = frozenset((
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw', 'case', 'do', 'else',
+    'yield', 'await',
+))
+
+
+def _is_identifier(char):
+    return char.isalnum() or char in '_$'
+
+
+def _literal_newlines(source):
+    """
+    Return, for each newline in ``source``, whether it is inside a literal.
+
+    One pass over the script tracks strings, comments, regex literals and
+    template literals with their ``${...}`` substitutions (nested to any
+    depth), so a backtick or quote in a comment, string or regex can't
+    throw the state off. Unescaped newlines can't occur in strings and
+    regexes, so one there resets to code: a misjudged regex spoils only
+    its own line.
+    """
+    newlines = []
+    state = _CODE
+    substitutions = []  # open braces inside each ${...} we are in
+    last = ''  # last significant character of code
+    word = ''  # last identifier of code
+    in_class = False
+    index = 0
+    length = len(source)
+    while index < length:
+        char = source[index]
+        if char == '\n':
+            if state in (_LINE_COMMENT, _SINGLE, _DOUBLE, _REGEX):
+                state = _CODE
+            newlines.append(state in _LITERALS)
+        elif state == _CODE:
+            if char in '\'"`':
+                state = {'\'': _SINGLE, '"': _DOUBLE, '`': _TEMPLATE}[char]
+            elif char == '/' and source.startswith('//', index):
+                state = _LINE_COMMENT
+            elif char == '/' and source.startswith('/*', index):
+                state = _BLOCK_COMMENT
+                index += 1
+            elif char == '/' and (not last or last in _REGEX_AFTER or word in _REGEX_KEYWORDS):
+                state = _REGEX
+                in_class = False
+            elif char == '}' and substitutions and not substitutions[-1]:
+                substitutions.pop()
+                state = _TEMPLATE
+            elif _is_identifier(char):
+                word = word + char if index and _is_identifier(source[index - 1]) else char
+                last = char
+            elif not char.isspace():
+                if char == '{' and substitutions:
+                    substitutions[-1] += 1
+                elif char == '}' and substitutions:
+                    substitutions[-1] -= 1
+                last = char
+                word = ''
+        elif state == _BLOCK_COMMENT:
+            if source.startswith('*/', index):
+                state = _CODE
+                index += 1
+        elif state != _LINE_COMMENT:
+            if char == '\\':
+                # An escaped newline continues the literal on the next line
+                if source.startswith('\n', index + 1):
+                    newlines.append(True)
+                index += 2
+                continue
+            closed = False
+            if state == _TEMPLATE:
+                if char == '`':
+                    closed = True
+                elif source.startswith('${', index):
+                    substitutions.append(0)
+                    state = _CODE
+                    last = '{'
+                    word = ''
+                    index += 1
+            elif state == _REGEX:
+                if char == '[':
+                    in_class = True
+                elif char == ']':
+                    in_class = False
+                elif char == '/' and not in_class:
+                    closed = True
+            elif char == ('\'' if state == _SINGLE else '"'):
+                closed = True
+            if closed:
+                # A literal is a value: a ``/`` after it divides
+                state = _CODE
+                last = 'a'
+                word = ''
+        index += 1
+    return newlines
+
+
+def embed_hint_origins(hosts, preconnect_limit=2):
+    """Split embed origins (most used first) into preconnect and dns-prefetch lists."""
+    return list(hosts[:preconnect_limit]), list(hosts[preconnect_limit:])
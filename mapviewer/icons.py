@@ -0,0 +1,226 @@
+"""
+Icon font subsetting.
+
+``static/fonts/custom-icons.*`` is generated by fantasticon from every SVG in
+``assets/icons``. The helpers here work out which glyphs each page can
+actually show (from the theme, subtheme and indicator ``icon`` fields plus the
+icon classes hard-coded in templates) and build a content-hashed WOFF2 and CSS
+pair containing just those glyphs. The pairs are generated into
+``static/fonts/subsets/`` (not tracked), by ``build_icon_subset`` or by the
+export itself; ``stale_subsets`` tells whether they still cover the config.
+
+fontTools (with brotli for WOFF2) is only needed to write the subset fonts;
+the analysis functions work without it.
+"""
+import hashlib
+import io
+import json
+import logging
+import re
+from pathlib import Path
+
+ICON_CLASS_PREFIX = 'icon-'
+MANIFEST_NAME = 'custom-icons.subsets.json'
+# Where the subsets go, relative to the static root
+SUBSET_DIR = 'fonts/subsets'
+
+_GLYPH_RULE = re.compile(r'\.icon\.(icon-[\w-]+):before\s*\{\s*content:\s*"\\([0-9a-fA-F]+)";')
+_FONT_FACE = re.compile(r'@font-face\s*\{.*?\}\s*', re.S)
+_TEMPLATE_ICON = re.compile(r'\bicon (icon-[\w-]+)')
+
+
+def parse_icon_css(css):
+    """Return ``{class name: codepoint}`` from fantasticon's generated CSS."""
+    return {name: int(code, 16) for name, code in _GLYPH_RULE.findall(css)}
+
+
+def css_preamble(css):
+    """Return the shared ``.icon:before`` rule from fantasticon's CSS."""
+    body = _FONT_FACE.sub('', css, count=1)
+    first_glyph = _GLYPH_RULE.search(body)
+    return body[:first_glyph.start()].strip() if first_glyph else body.strip()
+
+
+def config_icon_refs(config):
+    """
+    Yield ``(location, icon class)`` for every icon field in the config.
+
+    Locations are ``theme:<id>``, ``subtheme:<id>`` and ``indicator:<id>``.
+    Font Awesome classes (``fa-*``) are not ours and are skipped.
+    """
+    for theme in config.get('themes', []):
+        yield f"theme:{theme.get('id')}", theme.get('icon', '')
+        for subtheme in theme.get('subthemes', []):
+            yield f"subtheme:{subtheme.get('id')}", subtheme.get('icon', '')
+    for indicator_id, indicator in config.get('indicators', {}).items():
+        yield f'indicator:{indicator_id}', indicator.get('icon', '')
+
+
+def template_icons(template_dirs):
+    """Return the icon classes hard-coded in ``*.html`` templates."""
+    icons = set()
+    for template_dir in template_dirs:
+        for path in Path(template_dir).rglob('*.html'):
+            icons.update(_TEMPLATE_ICON.findall(path.read_text(encoding='utf-8')))
+    return icons
+
+
+def page_icon_usage(config, shared_icons=()):
+    """
+    Return ``{page key: set of icon classes}`` for every exported page.
+
+    ``'all'`` is the unfiltered site; each theme group gets its own key with
+    only the icons of the themes it shows.
+    """
+    def icons_for(themes):
+        icons = set(shared_icons)
+        for theme in themes:
+            icons.add(theme.get('icon'))
+            for subtheme in theme.get('subthemes', []):
+                icons.add(subtheme.get('icon'))
+                for indicator_id in subtheme.get('indicators', []):
+                    indicator = indicators.get(indicator_id)
+                    if isinstance(indicator, dict):
+                        icons.add(indicator.get('icon'))
+        return {icon for icon in icons if isinstance(icon, str) and icon.startswith(ICON_CLASS_PREFIX)}
+
+    indicators = config.get('indicators', {})
+    themes = config.get('themes', [])
+    usage = {'all': icons_for(themes)}
+    for group in config.get('themeGroups', []):
+        theme_ids = set(group.get('themeIds', []))
+        usage[group['id']] = icons_for(t for t in themes if t.get('id') in theme_ids)
+    return usage
+
+
+def missing_icons(config, glyphs):
+    """Return ``[(location, icon class)]`` for config icons with no glyph (``null`` icons are skipped)."""
+    return [
+        (location, icon) for location, icon in config_icon_refs(config)
+        if isinstance(icon, str) and not icon.startswith('fa-') and icon not in glyphs
+    ]
+
+
+def stale_subsets(config, css_path, subset_dir, template_dirs=()):
+    """
+    Return ``{page key: [icon classes]}`` for pages whose subset lacks glyphs they show.
+
+    Pages without a subset of their own are checked against the ``'all'``
+    one they fall back to. Without a manifest pages use the full font, so
+    nothing is stale.
+    """
+    subset_dir = Path(subset_dir)
+    try:
+        manifest = json.loads((subset_dir / MANIFEST_NAME).read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return {}
+    glyphs = parse_icon_css(Path(css_path).read_text(encoding='utf-8'))
+    covered = {}
+    stale = {}
+    for page, icons in page_icon_usage(config, template_icons(template_dirs)).items():
+        css_name = manifest.get(page) or manifest.get('all')
+        if css_name not in covered:
+            try:
+                covered[css_name] = set(parse_icon_css((subset_dir / css_name).read_text(encoding='utf-8')))
+            except (OSError, TypeError):
+                covered[css_name] = set()
+        missing = sorted(icon for icon in icons if icon in glyphs and icon not in covered[css_name])
+        if missing:
+            stale[page] = missing
+    return stale
+
+
+def subset_font(font_path, codepoints):
+    """Return WOFF2 bytes for the font at ``font_path`` cut down to ``codepoints``."""
+    from fontTools import subset
+
+    # fontTools logs harmless warnings about fantasticon's post table
+    logging.getLogger('fontTools').setLevel(logging.ERROR)
+    options = subset.Options()
+    options.flavor = 'woff2'
+    options.layout_features = []
+    options.notdef_outline = True
+    font = subset.load_font(str(font_path), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=sorted(codepoints))
+    subsetter.subset(font)
+    out = io.BytesIO()
+    subset.save_font(font, out, options)
+    return out.getvalue()
+
+
+def content_hash(data):
+    return hashlib.md5(data).hexdigest()[:12]
+
+
+def subset_css(preamble, glyphs, icons, font_filename):
+    """Build the CSS for a subset font with rules for ``icons`` only."""
+    lines = [
+        '@font-face {',
+        '    font-family: "custom-icons";',
+        f'    src: url("{font_filename}") format("woff2");',
+        '    font-display: block;',
+        '}',
+        '',
+        preamble,
+        '',
+    ]
+    for icon in sorted(icons):
+        lines.append(f'.icon.{icon}:before {{\n    content: "\\{glyphs[icon]:x}";\n}}')
+    return '\n'.join(lines) + '\n'
+
+
+def build_subsets(configs, css_path, font_path, out_dir, template_dirs=()):
+    """
+    Write one content-hashed WOFF2/CSS pair per page and a manifest.
+
+    ``configs`` lists the configs of every catalogue; their pages share the
+    manifest, so a page key gets the icons it shows in any of them. Pages
+    that use the same glyphs share files. Returns a report dict with
+    per-page glyph counts and byte sizes, the written files and any icons
+    referenced in the config that have no glyph.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    css = Path(css_path).read_text(encoding='utf-8')
+    glyphs = parse_icon_css(css)
+    preamble = css_preamble(css)
+    shared = template_icons(template_dirs)
+    full_size = Path(font_path).stat().st_size
+
+    usage = {}
+    for config in configs:
+        for page, icons in page_icon_usage(config, shared).items():
+            usage.setdefault(page, set()).update(icons)
+
+    manifest = {}
+    pages = {}
+    written = {}
+    for page, icons in usage.items():
+        icons = {icon for icon in icons if icon in glyphs}
+        key = tuple(sorted(icons))
+        if key not in written:
+            font = subset_font(font_path, {glyphs[icon] for icon in icons})
+            font_name = f'custom-icons.{content_hash(font)}.woff2'
+            (out_dir / font_name).write_bytes(font)
+            css_text = subset_css(preamble, glyphs, icons, font_name).encode('utf-8')
+            css_name = f'custom-icons.{content_hash(css_text)}.css'
+            (out_dir / css_name).write_bytes(css_text)
+            written[key] = (css_name, font_name, len(font), len(css_text))
+        css_name, font_name, font_size, css_size = written[key]
+        manifest[page] = css_name
+        pages[page] = {
+            'glyphs': len(icons),
+            'css': css_name,
+            'font': font_name,
+            'font_bytes': font_size,
+            'css_bytes': css_size,
+        }
+
+    (out_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2, sort_keys=True) + '\n')
+    return {
+        'total_glyphs': len(glyphs),
+        'full_font_bytes': full_size,
+        'pages': pages,
+        'missing': [missing for config in configs for missing in missing_icons(config, glyphs)],
+    }
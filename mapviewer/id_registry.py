@@ -0,0 +1,196 @@
+"""
+Stable IDs for the framework import (``csv-json.py --stable-ids``).
+
+``csv-json.py`` numbers themes, subthemes and indicators by position, so an
+inserted spreadsheet row used to change the ID of every row after it. With
+``--stable-ids`` IDs come from an ``IdRegistry`` saved next to the output
+(``<output>.ids.json``) instead, keyed by content rather than position:
+
+- a theme by the slug of its name;
+- a subtheme by ``<theme slug>/<subtheme slug>``;
+- an indicator by the value of a key column when one is given, otherwise
+  by ``<theme slug>/<subtheme slug>/<indicator slug>``. An indicator that moved to
+  another subtheme keeps its ID when its name is unambiguous.
+
+Once registered an ID never changes; new rows get IDs from their slug with
+no position in them. The display numbering ("1.2.3") stays in the names
+and titles only. A missing registry is seeded from the previous output, so
+switching to stable IDs keeps every published ID.
+
+Each indicator's row hash and built fields are remembered too, so rows that
+did not change are not processed again. This module does not need pandas
+or Django.
+"""
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+
+REGISTRY_VERSION = 1
+
+_NUMBER_PREFIX = re.compile(r'^(?:\d+-)+')
+
+
+def registry_path(output_path):
+    root, _ = os.path.splitext(output_path)
+    return f'{root}.ids.json'
+
+
+def row_hash(row):
+    """Hash of a CSV row (a dict of column -> value)."""
+    data = json.dumps(row, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+
+def strip_number(item_id):
+    """The slug part of a positional ID such as ``01-02-03-land-cover``."""
+    return _NUMBER_PREFIX.sub('', item_id)
+
+
+class IdRegistry:
+    """Content keys -> IDs for themes, subthemes and indicators, plus a row cache."""
+
+    def __init__(self, data=None):
+        data = data or {}
+        self.themes = dict(data.get('themes', {}))
+        self.subthemes = dict(data.get('subthemes', {}))
+        self.indicators = dict(data.get('indicators', {}))
+        self.rows = dict(data.get('rows', {}))
+        self.stats = Counter()
+        self._used = set(self.themes.values()) | set(self.subthemes.values()) | set(self.indicators.values())
+        self._claimed = set()
+        self._present = set()
+        self._seen_rows = set()
+
+    @classmethod
+    def load(cls, path, previous_output=None):
+        """Load a registry, or seed a new one from the previous output JSON."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            pass
+        registry = cls()
+        if previous_output and os.path.exists(previous_output):
+            with open(previous_output, 'r', encoding='utf-8') as f:
+                registry.seed(json.load(f))
+        return registry
+
+    def seed(self, framework):
+        """Register the IDs of an existing (positionally numbered) framework JSON."""
+        for theme in framework.get('themes', []):
+            theme_slug = strip_number(theme['id'])
+            self._register(self.themes, theme_slug, theme['id'])
+            for subtheme in theme.get('subthemes', []):
+                subtheme_slug = strip_number(subtheme['id'])
+                self._register(self.subthemes, f'{theme_slug}/{subtheme_slug}', subtheme['id'])
+                for indicator_id in subtheme.get('indicators', []):
+                    key = self.indicator_key(theme_slug, subtheme_slug, strip_number(indicator_id))
+                    self._register(self.indicators, key, indicator_id)
+        self.stats['seeded'] = len(self.indicators)
+
+    def _register(self, table, key, item_id):
+        table.setdefault(key, item_id)
+        self._used.add(item_id)
+
+    def _new_id(self, *candidates):
+        """The first unused candidate slug, with a numeric suffix if need be."""
+        candidates = [candidate for candidate in candidates if candidate] or ['item']
+        for candidate in candidates:
+            if candidate not in self._used:
+                break
+        else:
+            base = candidates[-1]
+            number = 2
+            while f'{base}-{number}' in self._used:
+                number += 1
+            candidate = f'{base}-{number}'
+        self._used.add(candidate)
+        return candidate
+
+    @staticmethod
+    def indicator_key(theme_slug, subtheme_slug, indicator_slug, key_value=None):
+        return f'key:{key_value}' if key_value else f'{theme_slug}/{subtheme_slug}/{indicator_slug}'
+
+    def expect(self, keys):
+        """
+        The indicator keys (see ``indicator_key``) of every row in this import.
+
+        Their IDs are not handed to a moved row that happens to come first.
+        """
+        self._present = set(keys)
+
+    def theme_id(self, theme_slug):
+        if theme_slug not in self.themes:
+            self.themes[theme_slug] = self._new_id(theme_slug)
+        return self.themes[theme_slug]
+
+    def subtheme_id(self, theme_slug, subtheme_slug):
+        key = f'{theme_slug}/{subtheme_slug}'
+        if key not in self.subthemes:
+            self.subthemes[key] = self._new_id(subtheme_slug, f'{theme_slug}-{subtheme_slug}')
+        return self.subthemes[key]
+
+    def indicator_id(self, theme_slug, subtheme_slug, indicator_slug, key_value=None):
+        """
+        The ID for an indicator row; each ID is handed out once per import.
+
+        ``key_value`` is the row's value in the key column, if there is one.
+        """
+        key = self.indicator_key(theme_slug, subtheme_slug, indicator_slug, key_value)
+        indicator_id = self.indicators.get(key)
+        if indicator_id is None or indicator_id in self._claimed:
+            indicator_id = self._moved(indicator_slug) if indicator_id is None else None
+            if indicator_id is None:
+                indicator_id = self._new_id(indicator_slug, f'{subtheme_slug}-{indicator_slug}')
+                self.stats['new'] += 1
+            else:
+                self.stats['moved'] += 1
+            self.indicators[key] = indicator_id
+        self._claimed.add(indicator_id)
+        return indicator_id
+
+    def _moved(self, indicator_slug):
+        """The ID of the only unclaimed indicator registered under this slug, if any."""
+        matches = {
+            indicator_id for key, indicator_id in self.indicators.items()
+            if key.endswith(f'/{indicator_slug}') and key not in self._present and indicator_id not in self._claimed
+        }
+        return matches.pop() if len(matches) == 1 else None
+
+    def cached_fields(self, indicator_id, digest):
+        """The fields built last time for an unchanged row, else None."""
+        self._seen_rows.add(indicator_id)
+        entry = self.rows.get(indicator_id)
+        if entry and entry['hash'] == digest:
+            self.stats['unchanged'] += 1
+            return dict(entry['fields'])
+        self.stats['changed' if entry else 'added'] += 1
+        return None
+
+    def remember(self, indicator_id, digest, fields):
+        self.rows[indicator_id] = {'hash': digest, 'fields': fields}
+
+    def save(self, path):
+        """Write the registry, dropping the cached rows of indicators no longer in the CSV."""
+        removed = [indicator_id for indicator_id in self.rows if indicator_id not in self._seen_rows]
+        for indicator_id in removed:
+            del self.rows[indicator_id]
+        self.stats['removed'] = len(removed)
+        data = {
+            'version': REGISTRY_VERSION,
+            'themes': self.themes,
+            'subthemes': self.subthemes,
+            'indicators': self.indicators,
+            'rows': {indicator_id: self.rows[indicator_id] for indicator_id in sorted(self.rows)},
+        }
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def summary(self):
+        stats = self.stats
+        return (f"{stats['unchanged']} unchanged, {stats['changed']} changed, {stats['added']} added and "
+                f"{stats['removed']} removed rows; {stats['new']} new and {stats['moved']} moved indicator IDs")
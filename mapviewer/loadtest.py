@@ -0,0 +1,165 @@
+"""
+Traffic replay for load-testing the map viewer.
+
+The traffic mix is built from the deep links ``generate_urls.py`` writes to
+``all_map_urls.txt``. Each link is replayed as the viewer's root page with
+its query string, as the indicator's own page, and once per theme group that
+shows its theme. Links are weighted per indicator and per theme group, then
+a pool of threads issues requests against a running server and records
+latency, status and bytes for the report.
+"""
+import http.client
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, quote, urlencode, urlsplit
+
+CatalogueEntry = namedtuple('CatalogueEntry', 'url theme_id subtheme_id indicator_id')
+Sample = namedtuple('Sample', 'path status latency bytes error')
+
+_ENTRY_URL = re.compile(r'^\d+\.\s+(\S+)\s*$')
+
+
+def parse_url_catalogue(path):
+    """Read the deep links from an ``all_map_urls.txt`` style file."""
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = _ENTRY_URL.match(line)
+            if not match:
+                continue
+            url = match.group(1)
+            query = parse_qs(urlsplit(url).query)
+            entries.append(CatalogueEntry(
+                url,
+                query.get('theme', [''])[0],
+                query.get('subtheme', [''])[0],
+                query.get('indicator', [''])[0],
+            ))
+    return entries
+
+
+def catalogue_from_config(config):
+    """Build the same deep links straight from a config (as generate_urls.py does)."""
+    entries = []
+    for theme in config.get('themes', []):
+        for subtheme in theme.get('subthemes', []):
+            for indicator_id in subtheme.get('indicators', []):
+                query = urlencode({'theme': theme['id'], 'subtheme': subtheme['id'], 'indicator': indicator_id})
+                entries.append(CatalogueEntry(f'/?{query}', theme['id'], subtheme['id'], indicator_id))
+    return entries
+
+
+def build_traffic_mix(entries, config, weights=None):
+    """
+    Return ``(paths, weights)`` for random.choices.
+
+    ``weights`` may map indicator IDs and theme group IDs (plus ``"*"`` for
+    the ungrouped site) to relative weights; anything unlisted weighs 1.
+    """
+    weights = weights or {}
+    groups_by_theme = {}
+    for group in config.get('themeGroups', []):
+        for theme_id in group.get('themeIds', []):
+            groups_by_theme.setdefault(theme_id, []).append(group['id'])
+
+    paths, path_weights = [], []
+    for entry in entries:
+        indicator_weight = weights.get(entry.indicator_id, 1.0)
+        query = urlsplit(entry.url).query
+        for group_id in [None] + groups_by_theme.get(entry.theme_id, []):
+            weight = indicator_weight * weights.get(group_id or '*', 1.0)
+            if weight <= 0:
+                continue
+            suffix = f'&theme_group={group_id}' if group_id else ''
+            paths.append(quote(f'/?{query}{suffix}', safe='/?&=%'))
+            path_weights.append(weight)
+            paths.append(quote(f'/{entry.indicator_id}/', safe='/') + (f'?theme_group={group_id}' if group_id else ''))
+            path_weights.append(weight)
+    return paths, path_weights
+
+
+def _worker(base, paths, weights, deadline, remaining, lock, samples, seed, timeout):
+    rng = random.Random(seed)
+    scheme_cls = http.client.HTTPSConnection if base.scheme == 'https' else http.client.HTTPConnection
+    conn = scheme_cls(base.netloc, timeout=timeout)
+    prefix = base.path.rstrip('/')
+    local = []
+    while time.monotonic() < deadline:
+        with lock:
+            if remaining[0] == 0:
+                break
+            remaining[0] -= 1
+        path = rng.choices(paths, weights)[0]
+        started = time.perf_counter()
+        try:
+            conn.request('GET', prefix + path, headers={'Accept-Encoding': 'gzip, br'})
+            response = conn.getresponse()
+            body = response.read()
+            local.append(Sample(path, response.status, time.perf_counter() - started, len(body), None))
+        except (OSError, http.client.HTTPException) as e:
+            local.append(Sample(path, 0, time.perf_counter() - started, 0, type(e).__name__))
+            conn.close()
+    conn.close()
+    with lock:
+        samples.extend(local)
+
+
+def run_load(base_url, paths, weights, concurrency=8, requests=None, duration=None, seed=None, timeout=30):
+    """Replay the mix and return ``(samples, elapsed seconds)``."""
+    if requests is None and duration is None:
+        requests = 1000
+    base = urlsplit(base_url)
+    deadline = time.monotonic() + (duration if duration else 10 ** 9)
+    remaining = [requests if requests is not None else -1]
+    lock = threading.Lock()
+    samples = []
+    seeds = random.Random(seed)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(_worker, base, paths, weights, deadline, remaining, lock, samples,
+                        seeds.random(), timeout)
+            for _ in range(concurrency)
+        ]
+        for future in futures:
+            future.result()
+    return samples, time.perf_counter() - started
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(sample.latency for sample in samples)
+    errors = [s for s in samples if s.error or s.status >= 400 or s.status == 0]
+    statuses = Counter(str(s.status) if not s.error else s.error for s in samples)
+    total_bytes = sum(s.bytes for s in samples)
+    return {
+        'requests': len(samples),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'error_rate': round(len(errors) / len(samples), 4) if samples else 0.0,
+        'statuses': dict(statuses),
+        'bytes': total_bytes,
+        'bytes_per_s': round(total_bytes / elapsed) if elapsed else 0,
+        'latency_ms': {
+            'mean': round(1000 * sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            **{f'p{p}': round(1000 * percentile(latencies, p), 2) for p in (50, 90, 95, 99)},
+            'max': round(1000 * latencies[-1], 2) if latencies else 0.0,
+        },
+    }
+
+
+def load_weights(path):
+    with open(path, 'r') as f:
+        return {key: float(value) for key, value in json.load(f).items()}
@@ -0,0 +1,105 @@
+import json
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from mapviewer.catalogue import load_catalogue
+from mapviewer.store import export_config, import_config, load_page
+
+
+def synthetic_config(indicator_count, themes=20, subthemes=5, groups=4):
+    """A themed config with ``indicator_count`` indicators spread over the subthemes."""
+    indicators = {}
+    theme_list = []
+    per_subtheme = max(indicator_count // (themes * subthemes), 1)
+    n = 0
+    for t in range(themes):
+        theme = {'id': f'theme-{t}', 'name': f'Theme {t}', 'description': 'Synthetic theme',
+                 'icon': 'icon-forest', 'subthemes': []}
+        for s in range(subthemes):
+            ids = []
+            for _ in range(per_subtheme):
+                if n >= indicator_count:
+                    break
+                key = f'indicator-{n}'
+                indicators[key] = {
+                    'title': f'Indicator {n}', 'description': 'Synthetic indicator ' * 8,
+                    'source': 'Benchmark', 'unit_of_measure': 'ha', 'icon': 'icon-forest',
+                    'map1_url': f'https://felt.com/embed/map/bench-{n}',
+                    'map2_url': f'https://felt.com/embed/map/bench-{n}-b',
+                }
+                ids.append(key)
+                n += 1
+            theme['subthemes'].append({'id': f'subtheme-{t}-{s}', 'name': f'Subtheme {t}.{s}',
+                                       'description': '', 'icon': 'icon-forest', 'indicators': ids})
+        theme_list.append(theme)
+    group_list = [
+        {'id': f'group-{g}', 'name': f'Group {g}', 'icon': 'fa-leaf',
+         'themeIds': [theme['id'] for theme in theme_list[g::groups]]}
+        for g in range(groups)
+    ]
+    return {'themeGroups': group_list, 'themes': theme_list, 'indicators': indicators}
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) * 1000 / repeat, result
+
+
+class Command(BaseCommand):
+    help = 'Compare the JSON and database catalogue read paths on a synthetic catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--indicators', type=int, nargs='+', default=[100, 10000],
+                            help='Catalogue sizes to try (default: 100 10000)')
+        parser.add_argument('--pages', type=int, default=50, help='Pages to fetch per size')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        # The database path runs against a throwaway test database, so the
+        # real one is never written to or locked
+        self.stdout.write('Creating a temporary database...')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.bench(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def bench(self, options):
+        rng = random.Random(options['seed'])
+        for size in options['indicators']:
+            config = synthetic_config(size)
+            keys = list(config['indicators'])
+            pages = [(rng.choice(keys), rng.choice([None] + [g['id'] for g in config['themeGroups']]))
+                     for _ in range(options['pages'])]
+
+            fd, path = tempfile.mkstemp(suffix='.json')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(config, f)
+            try:
+                # Before the snapshot the view re-read the file on every request
+                cold_ms, catalogue = timed(lambda: load_catalogue(path), 3)
+                warm_ms, _ = timed(lambda: [
+                    (catalogue.indicators[key], catalogue.themes_for_group(group),
+                     catalogue.theme_for_indicator(key, group)) for key, group in pages
+                ], 3)
+            finally:
+                os.unlink(path)
+
+            import_ms, _ = timed(lambda: import_config(config), 1)
+            with CaptureQueriesContext(connection) as queries:
+                db_ms, _ = timed(lambda: [load_page(key, group) for key, group in pages], 1)
+            export_ms, _ = timed(export_config, 1)
+
+            self.stdout.write(self.style.SUCCESS(f'{size} indicators ({len(json.dumps(config)) // 1024} KB of JSON)'))
+            self.stdout.write(f'  json: load+index {cold_ms:.1f} ms, page lookup {warm_ms / len(pages):.3f} ms')
+            self.stdout.write(f'  db:   page query {db_ms / len(pages):.2f} ms '
+                              f'({len(queries) / len(pages):.1f} queries/page)')
+            self.stdout.write(f'  db:   import {import_ms:.0f} ms, export {export_ms:.0f} ms')
@@ -0,0 +1,68 @@
+import gc
+import json
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from mapviewer.catalogue import Catalogue, config_path
+from mapviewer.management.commands.bench_catalogue import synthetic_config
+
+
+def scaled_config(base, indicator_count):
+    """
+    A synthetic config whose indicators reuse the text of ``base``'s.
+
+    Descriptions, sources and embed URLs repeat the way they do in the real
+    config; titles stay unique.
+    """
+    config = synthetic_config(indicator_count)
+    samples = [data for data in base.get('indicators', {}).values() if isinstance(data, dict)]
+    if samples:
+        for n, (key, data) in enumerate(config['indicators'].items()):
+            data.update(samples[n % len(samples)])
+            data['title'] = f'{data.get("title", "Indicator")} ({n})'
+    return config
+
+
+def traced(build):
+    """Run ``build`` and return (result, bytes it still holds, peak bytes)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+
+class Command(BaseCommand):
+    help = 'Measure the memory a worker holds for the catalogue at several sizes (tracemalloc)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--indicators', type=int, nargs='+', default=[100, 10000, 100000],
+                            help='Catalogue sizes to try (default: 100 10000 100000)')
+        parser.add_argument('--config', help='Config whose indicator text to reuse (defaults to MAP_CONFIG_PATH)')
+
+    def handle(self, *args, **options):
+        with open(options['config'] or config_path(), 'r') as f:
+            base = json.load(f)
+
+        def mb(size):
+            return f'{size / 1024 / 1024:8.2f} MB'
+
+        for size in options['indicators']:
+            raw = json.dumps(scaled_config(base, size)).encode('utf-8')
+            self.stdout.write(self.style.SUCCESS(f'{size} indicators ({len(raw) / 1024 / 1024:.1f} MB of JSON)'))
+
+            config, plain, _ = traced(lambda: json.loads(raw))
+            del config
+            self.stdout.write(f'  parsed dicts:            {mb(plain)}')
+
+            for label, preencode in (('catalogue', False), ('catalogue + payloads', True)):
+                catalogue, held, peak = traced(lambda: Catalogue(json.loads(raw), preencode=preencode))
+                strings = len(catalogue.strings)
+                del catalogue
+                self.stdout.write(f'  {label + ":":<24} {mb(held)} (peak {mb(peak).strip()}, '
+                                  f'{100 * held / plain:.0f}% of parsed, {strings:,} distinct strings)')
@@ -0,0 +1,186 @@
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from mapviewer.build import (
+    BLOCKED, BUILT, CACHED, FAILED, SKIPPED, Node, Skip, merge_framework, precompress, run_graph, select,
+)
+from mapviewer.aliases import aliases_path, record_renames
+from mapviewer.catalogue import backup_path, catalogue_paths
+from mapviewer.id_registry import registry_path
+
+FRAMEWORK_JSON = 'ecoscapes_framework.json'
+FRAMEWORK_IDS = registry_path(FRAMEWORK_JSON)
+# Files written by the exporter as well as sources; ignored when hashing
+GENERATED = ('*.pyc', '*.gz', '*.br')
+
+
+class Command(BaseCommand):
+    help = 'Run the publish pipeline (CSV import, config, icons, pages, compression, deploy), skipping unchanged steps'
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='*',
+                            help='Steps to build, with the steps they depend on (default: all)')
+        parser.add_argument('--force', nargs='*', metavar='STEP',
+                            help='Rerun these steps (or every step, given no names) even if nothing changed')
+        parser.add_argument('--workers', type=int, default=4, help='Steps to run at the same time')
+        parser.add_argument('--dry-run', action='store_true', help='Only show which steps would run')
+        parser.add_argument('--csv', default=getattr(settings, 'MAP_FRAMEWORK_CSV', None),
+                            help='Framework CSV to import with csv-json.py (defaults to MAP_FRAMEWORK_CSV)')
+        parser.add_argument('--deploy', action='store_true',
+                            help='Finish with an incremental deploy of docs/ (see deploy.py --incremental)')
+        parser.add_argument('--no-push', action='store_true', help='With --deploy, commit but do not push')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        self.root = Path(settings.BASE_DIR)
+        nodes = self.nodes(options)
+        try:
+            nodes = select(nodes, options['targets']) if options['targets'] else nodes
+        except KeyError as e:
+            raise CommandError(f"Unknown step {e}; steps are: {', '.join(node.name for node in nodes)}")
+
+        force = options['force']
+        force = () if force is None else (force or True)
+        started = time.perf_counter()
+        results = run_graph(nodes, self.root, force=force, workers=options['workers'],
+                            dry_run=options['dry_run'], on_result=self.report)
+
+        counts = {status: sum(1 for result in results if result.status == status)
+                  for status in (BUILT, CACHED, SKIPPED, FAILED, BLOCKED)}
+        summary = ', '.join(f'{count} {status}' for status, count in counts.items() if count)
+        summary = f'{summary} in {time.perf_counter() - started:.2f}s'
+        if counts[FAILED] or counts[BLOCKED]:
+            raise CommandError(f'Build failed: {summary}')
+        self.stdout.write(self.style.SUCCESS(f'Build finished: {summary}'))
+
+    def report(self, result):
+        style = {
+            BUILT: self.style.SUCCESS, FAILED: self.style.ERROR, BLOCKED: self.style.ERROR,
+            SKIPPED: self.style.WARNING,
+        }.get(result.status, lambda text: text)
+        line = f'{result.name:<14} {style(f"{result.status:<8}")} {result.seconds:7.2f}s'
+        if result.summary:
+            line += f'  {result.summary}'
+        self.stdout.write(line)
+
+    def nodes(self, options):
+        configs = [os.path.relpath(path, self.root) for path in catalogue_paths().values()]
+        config_json = configs[0]
+        aliases = [aliases_path(path) for path in configs]
+        csv_path = options['csv']
+        static_dir = os.path.relpath(settings.STATICFILES_DIRS[0], self.root)
+        static_root = os.path.relpath(settings.STATIC_ROOT, self.root)
+        fonts = [f'{static_dir}/fonts/custom-icons.{ext}' for ext in ('css', 'woff', 'woff2')]
+        screenshots = getattr(settings, 'MAP_SCREENSHOTS_DIR', None)
+        screenshots = [os.path.relpath(screenshots, self.root)] if screenshots else []
+        templates = 'templates'
+
+        nodes = [
+            Node('csv', lambda: self.import_csv(csv_path),
+                 inputs=[csv_path, 'csv-json.py', FRAMEWORK_IDS] if csv_path else [],
+                 outputs=[FRAMEWORK_JSON, FRAMEWORK_IDS], params={'csv': csv_path},
+                 description='Convert the framework CSV to JSON'),
+            # Hand edits to the config (theme groups, fixes) must survive a
+            # cached build, so only a change to the framework rewrites it
+            Node('config', lambda: self.merge_config(config_json),
+                 inputs=[FRAMEWORK_JSON], outputs=[config_json], deps=['csv'], verify_outputs=False,
+                 description='Merge the framework into the map config'),
+            Node('icons', self.build_icons,
+                 inputs=['assets/icons', 'fantasticon-config.js'], outputs=fonts,
+                 description='Build the icon font with fantasticon'),
+            Node('icon_subsets', lambda: self.call('build_icon_subset'),
+                 inputs=configs + fonts + [templates], outputs=[f'{static_dir}/fonts/subsets'],
+                 deps=['config', 'icons'], description='Subset the icon font per page'),
+            Node('thumbnails', lambda: self.call('build_thumbnails'),
+                 inputs=configs + fonts + screenshots, outputs=[f'{static_dir}/thumbs'],
+                 deps=['config', 'icons'], description='Build the map placeholder images'),
+            # The exporter copies static files from STATIC_ROOT
+            Node('collectstatic', lambda: self.call('collectstatic', interactive=False),
+                 inputs=[static_dir], outputs=[static_root],
+                 deps=['icons', 'icon_subsets', 'thumbnails'], description='Collect the static files'),
+            Node('pages', lambda: self.call('export_to_gh_pages', no_thumbnails=True, no_icon_subsets=True),
+                 inputs=configs + aliases + [static_root, templates, 'mapviewer', 'ecomaps'],
+                 outputs=['docs'], exclude=GENERATED, deps=['collectstatic'],
+                 description='Export the static site to docs/'),
+            Node('compress', lambda: self.compress(options['workers']),
+                 inputs=[f'docs/**/*{suffix}' for suffix in ('.html', '.css', '.js', '.json', '.svg', '.txt', '.xml')],
+                 outputs=['docs/**/*.gz', 'docs/**/*.br'], deps=['pages'],
+                 description='Write .gz/.br siblings for the export'),
+        ]
+        if options['deploy']:
+            nodes.append(Node('deploy', lambda: self.deploy(not options['no_push']),
+                              inputs=['docs'], params={'push': not options['no_push']}, deps=['compress'],
+                              description='Deploy docs/ to the gh-pages branch'))
+        return nodes
+
+    def call(self, name, **options):
+        """Run another management command, keeping its output unless it fails."""
+        out = io.StringIO()
+        try:
+            call_command(name, stdout=out, stderr=out, **options)
+        except BaseException:
+            self.stderr.write(out.getvalue())
+            raise
+        if self.verbosity >= 2:
+            self.stdout.write(out.getvalue())
+        lines = [line for line in out.getvalue().splitlines() if line.strip()]
+        return lines[-1].strip() if lines else ''
+
+    def run(self, command):
+        """Run a subprocess from the project root, raising with its output if it fails."""
+        process = subprocess.run(command, cwd=self.root, capture_output=True, text=True)
+        if process.returncode:
+            self.stderr.write(process.stdout + process.stderr)
+            raise CommandError(f"{' '.join(command)} exited with {process.returncode}")
+        if self.verbosity >= 2:
+            self.stdout.write(process.stdout)
+
+    def import_csv(self, csv_path):
+        if not csv_path:
+            raise Skip('no CSV given (--csv or MAP_FRAMEWORK_CSV)')
+        self.run([sys.executable, 'csv-json.py', '--stable-ids', csv_path, FRAMEWORK_JSON])
+        return f'{csv_path} -> {FRAMEWORK_JSON}'
+
+    def merge_config(self, config_json):
+        if not (self.root / FRAMEWORK_JSON).exists():
+            raise Skip(f'no {FRAMEWORK_JSON}')
+        path = self.root / config_json
+        old_config = json.loads(path.read_text(encoding='utf-8')) if path.exists() else {}
+        # The backup lets config_diff show what the import changed
+        count = merge_framework(self.root / FRAMEWORK_JSON, path, backup_path(str(path)))
+        # Old links to renumbered IDs keep working through the alias table
+        new_config = json.loads(path.read_text(encoding='utf-8'))
+        record_renames(aliases_path(str(path)), old_config, new_config)
+        return f'{count} indicators'
+
+    def build_icons(self):
+        if not shutil.which('npm'):
+            raise Skip('npm not found; using the committed icon font')
+        self.run(['npm', 'run', 'build:icons'])
+
+    def compress(self, workers):
+        written = precompress(self.root / 'docs', workers=workers)
+        return f'{written} files written'
+
+    def deploy(self, push):
+        sys.path.insert(0, str(self.root))
+        try:
+            import deploy
+        finally:
+            sys.path.pop(0)
+        result = deploy.deploy_incremental(source=str(self.root / 'docs'), repo=str(self.root),
+                                           worktree=str(self.root / '.deploy'), push=push)
+        if result is None:
+            return 'nothing changed'
+        changed, removed = result
+        return f'{len(changed)} changed, {len(removed)} removed'
@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mapviewer.aliases import AliasTable, aliases_path, config_ids, find_renames
+from mapviewer.catalogue import config_path
+
+
+class Command(BaseCommand):
+    help = 'Build the alias table of renamed theme, subtheme and indicator IDs from the config\'s git history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--catalogue', help='Name of the regional catalogue (default: the main one)')
+        parser.add_argument('--since', help='Only replay commits after this revision')
+
+    def git(self, *args, cwd):
+        process = subprocess.run(['git', *args], cwd=cwd, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(f"git {' '.join(args)}: {process.stderr.strip()}")
+        return process.stdout
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(config_path(options['catalogue']))
+        directory, filename = os.path.split(path)
+        revisions = ['HEAD'] if not options['since'] else [f"{options['since']}..HEAD"]
+        commits = self.git('log', '--format=%H', '--reverse', *revisions, '--', filename, cwd=directory).split()
+
+        versions = []
+        for commit in commits:
+            try:
+                versions.append(json.loads(self.git('show', f'{commit}:./{filename}', cwd=directory)))
+            except (CommandError, ValueError):
+                self.stderr.write(f'Skipping {commit[:8]}: no readable {filename}')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                versions.append(json.load(f))
+        except (FileNotFoundError, ValueError) as e:
+            raise CommandError(f'{path}: {e}')
+
+        # Replay every change in order, so links from any version resolve
+        table_path = aliases_path(path)
+        table = AliasTable.load(table_path)
+        for old, new in zip(versions, versions[1:]):
+            table.update(find_renames(old, new), config_ids(new))
+        table.update({}, config_ids(versions[-1]))
+        table.save(table_path)
+        counts = ', '.join(f'{len(ids)} {kind}' for kind, ids in table.tables.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(versions)} versions of {filename} replayed; {table_path} maps {counts}'
+        ))
@@ -0,0 +1,75 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mapviewer.catalogue import catalogue_paths
+from mapviewer.icons import MANIFEST_NAME, SUBSET_DIR, build_subsets
+
+
+class Command(BaseCommand):
+    help = 'Build per-page subsets of the custom icon font from the icons the config and templates use'
+
+    def add_arguments(self, parser):
+        static_dir = Path(settings.STATICFILES_DIRS[0])
+        parser.add_argument('--config', help='Config file to scan (defaults to every configured catalogue)')
+        parser.add_argument('--fonts-dir', default=str(static_dir / 'fonts'),
+                            help='Directory holding the fantasticon output')
+        parser.add_argument('--out-dir', default=str(static_dir / SUBSET_DIR),
+                            help='Directory the subsets and their manifest are written to (generated, not tracked)')
+        parser.add_argument('--report', help='Also write the report as JSON to this path')
+        parser.add_argument('--strict', action='store_true',
+                            help='Fail if the config references icons with no glyph')
+
+    def handle(self, *args, **options):
+        fonts_dir = Path(options['fonts_dir'])
+        css_path = fonts_dir / 'custom-icons.css'
+        font_path = fonts_dir / 'custom-icons.woff2'
+        for path in (css_path, font_path):
+            if not path.exists():
+                raise CommandError(f'{path} not found; run `npm run build:icons` first')
+
+        configs = []
+        for path in [options['config']] if options['config'] else catalogue_paths().values():
+            try:
+                with open(path, 'r') as f:
+                    configs.append(json.load(f))
+            except FileNotFoundError:
+                if options['config']:
+                    raise CommandError(f'{path} not found')
+
+        out_dir = Path(options['out_dir'])
+        # Remove subsets from previous runs so stale hashes don't pile up
+        for old in out_dir.glob('custom-icons.*.*'):
+            if old.suffix in ('.woff2', '.css') and old.stem.count('.') == 1:
+                old.unlink()
+
+        try:
+            report = build_subsets(
+                configs, css_path, font_path, out_dir,
+                template_dirs=[d for t in settings.TEMPLATES for d in t.get('DIRS', [])],
+            )
+        except ImportError:
+            raise CommandError('fontTools and brotli are required: pip install fonttools brotli')
+
+        full = report['full_font_bytes']
+        self.stdout.write(f"Full font: {report['total_glyphs']} glyphs, {full:,} bytes")
+        for page, info in sorted(report['pages'].items()):
+            saved = 100 * (1 - info['font_bytes'] / full) if full else 0
+            self.stdout.write(
+                f"  {page}: {info['glyphs']} glyphs, {info['font_bytes']:,} bytes "
+                f"({saved:.0f}% smaller) -> {info['css']}"
+            )
+        self.stdout.write(f'Wrote {out_dir / MANIFEST_NAME}')
+
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        missing = report['missing']
+        for location, icon in missing:
+            self.stderr.write(self.style.WARNING(f'{location}: no glyph for {icon or "(empty)"!r}'))
+        if missing and options['strict']:
+            raise CommandError(f'{len(missing)} icon(s) referenced in the config have no glyph')
+        self.stdout.write(self.style.SUCCESS('Icon subsets built'))
@@ -0,0 +1,70 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mapviewer.catalogue import catalogue_paths
+from mapviewer.thumbnails import MANIFEST_NAME, build_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Build the placeholder images shown while the map embeds load'
+
+    def add_arguments(self, parser):
+        static_dir = Path(settings.STATICFILES_DIRS[0])
+        parser.add_argument('--out-dir', default=str(static_dir / 'thumbs'),
+                            help='Where to write the images and their manifest')
+        parser.add_argument('--screenshots', default=getattr(settings, 'MAP_SCREENSHOTS_DIR', None),
+                            help='Directory of <indicator id>.png/.jpg/.webp screenshots (defaults to MAP_SCREENSHOTS_DIR)')
+        parser.add_argument('--fonts-dir', default=str(static_dir / 'fonts'),
+                            help='Directory holding the fantasticon output')
+        parser.add_argument('--workers', type=int, help='Worker processes (defaults to the CPU count)')
+        parser.add_argument('--force', action='store_true', help='Re-encode every image')
+        parser.add_argument('--report', help='Also write the report as JSON to this path')
+
+    def handle(self, *args, **options):
+        fonts_dir = Path(options['fonts_dir'])
+        css_path = fonts_dir / 'custom-icons.css'
+        font_path = fonts_dir / 'custom-icons.woff'
+        for path in (css_path, font_path):
+            if not path.exists():
+                raise CommandError(f'{path} not found; run `npm run build:icons` first')
+
+        configs = {}
+        for name, path in catalogue_paths().items():
+            try:
+                with open(path, 'r') as f:
+                    configs[name] = json.load(f)
+            except FileNotFoundError:
+                self.stderr.write(self.style.WARNING(f'{path} not found, skipping catalogue {name}'))
+
+        try:
+            report = build_thumbnails(
+                configs, css_path, font_path, options['out_dir'],
+                screenshots_dir=options['screenshots'],
+                workers=options['workers'],
+                force=options['force'],
+            )
+        except ImportError:
+            raise CommandError('Pillow is required: pip install Pillow')
+
+        if 'avif' not in report['formats']:
+            self.stderr.write(self.style.WARNING(
+                'This Pillow build cannot encode AVIF (Pillow 11.3+ can); writing WebP images only'
+            ))
+        self.stdout.write(
+            f"{report['images']} images ({report['screenshots']} from screenshots): "
+            f"{report['built']} built, {report['reused']} unchanged, {len(report['removed'])} removed"
+        )
+        sizes = ', '.join(f'{fmt} {total:,} bytes' for fmt, total in report['bytes'].items())
+        self.stdout.write(f"  {sizes}; inline previews {report['preview_bytes']:,} bytes")
+        self.stdout.write(f"Wrote {Path(options['out_dir']) / MANIFEST_NAME}")
+
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        for name, indicator_id in report['missing']:
+            self.stderr.write(self.style.WARNING(f'{name}: no screenshot or icon glyph for {indicator_id}'))
+        self.stdout.write(self.style.SUCCESS('Thumbnails built'))
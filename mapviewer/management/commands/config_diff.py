@@ -0,0 +1,75 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mapviewer.cache_policy import namespaced
+from mapviewer.catalogue import backup_path, config_path
+from mapviewer.diff import ADDED, MOVED, REMOVED, impact
+
+SYMBOLS = {ADDED: '+', REMOVED: '-', MOVED: '>'}
+
+
+class Command(BaseCommand):
+    help = 'Show what changed between two map configs and which pages, URLs and cache keys it affects'
+
+    def add_arguments(self, parser):
+        parser.add_argument('old', nargs='?', help='Old config (defaults to the backup next to MAP_CONFIG_PATH)')
+        parser.add_argument('new', nargs='?', help='New config (defaults to MAP_CONFIG_PATH)')
+        parser.add_argument('--catalogue', help='Name of the regional catalogue the configs belong to')
+        parser.add_argument('--json', action='store_true', help='Print the changes and impact as JSON')
+        parser.add_argument('--list', action='store_true',
+                            help='List every affected page, URL and cache key, not just the counts')
+        parser.add_argument('--purge', action='store_true',
+                            help='Only print the surrogate keys to purge from the CDN, one per line')
+
+    def load(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise CommandError(f'{path} not found')
+        except ValueError as e:
+            raise CommandError(f'{path}: invalid JSON ({e})')
+
+    def handle(self, *args, **options):
+        new_path = Path(options['new'] or config_path(options['catalogue']))
+        old_path = Path(options['old'] or backup_path(str(new_path)))
+        old, new = self.load(old_path), self.load(new_path)
+
+        started = time.perf_counter()
+        result = impact(old, new, catalogue=options['catalogue'])
+        changes = result['changes']
+        elapsed = (time.perf_counter() - started) * 1000
+
+        if options['purge']:
+            for key in namespaced(result['cache_keys'], options['catalogue']):
+                self.stdout.write(key)
+            return
+
+        if options['json']:
+            result['changes'] = [change._asdict() for change in changes]
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+
+        for change in changes:
+            symbol = SYMBOLS.get(change.action, '~')
+            line = f'{symbol} {change.kind} {change.id}'
+            if change.action == MOVED:
+                line += f': {change.detail[0]} -> {change.detail[1]}'
+            elif change.detail:
+                line += ': ' + ', '.join(change.detail)
+            self.stdout.write(line)
+
+        if not changes:
+            self.stdout.write(self.style.SUCCESS(f'{old_path.name} and {new_path.name} are equivalent'))
+            return
+        scopes = ', '.join(scope or '(all themes)' for scope in result['scopes']) or 'none'
+        self.stdout.write(f'\nAffected theme groups: {scopes}' + (' (embed hosts changed)' if result['full'] else ''))
+        for key in ('pages', 'responses', 'cache_keys'):
+            self.stdout.write(f"{key.replace('_', ' ').capitalize()}: {len(result[key])}")
+            if options['list']:
+                for item in result[key]:
+                    self.stdout.write(f'  {item}')
+        self.stdout.write(self.style.SUCCESS(f'{len(changes)} change(s) ({elapsed:.1f} ms)'))
@@ -0,0 +1,23 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mapviewer.store import export_config, is_populated
+
+
+class Command(BaseCommand):
+    help = 'Write the catalogue stored in the database back out as map_config.json'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Where to write the config (defaults to stdout)')
+
+    def handle(self, *args, **options):
+        if not is_populated():
+            raise CommandError('The database has no catalogue, run import_catalogue first')
+        text = json.dumps(export_config(), indent=2, ensure_ascii=False) + '\n'
+        if not options['path']:
+            self.stdout.write(text, ending='')
+            return
+        with open(options['path'], 'w', encoding='utf-8') as f:
+            f.write(text)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['path']}"))
@@ -1,46 +1,208 @@
+import hashlib
 import os
 import shutil
 import logging
+from contextlib import nullcontext
 from pathlib import Path
-from django.core.management.base import BaseCommand
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
 from django.test import Client, RequestFactory
 from django.conf import settings
 from django.template.loader import render_to_string, get_template
 from django.http import HttpRequest, Http404
+from django.utils.html import escape
 from django.views.static import serve
+from urllib.parse import urlencode
 import json
 
+from mapviewer.aliases import AliasTable, aliases_path
+from mapviewer.catalogue import DEFAULT_CATALOGUE, Catalogue, catalogue_paths, config_path
+from mapviewer.chunks import chunk_set
+from mapviewer.export_manifest import precache_manifest
+from mapviewer.export_profile import ExportProfiler
+from mapviewer.icons import SUBSET_DIR, stale_subsets
+from mapviewer.htmlpost import HtmlPostProcessor, embed_hint_origins
+from mapviewer.views import FRAGMENT_PLACEHOLDER, fragment_payload
+
 # Set up logging
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
     help = 'Export the site as static files for GitHub Pages'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--skip-validation',
+            action='store_true',
+            help='Export even if map_config.json fails validation',
+        )
+        parser.add_argument(
+            '--no-service-worker',
+            action='store_true',
+            help="Don't generate the offline service worker (sw.js)",
+        )
+        parser.add_argument(
+            '--no-thumbnails',
+            action='store_true',
+            help="Don't rebuild the map placeholder images (see build_thumbnails)",
+        )
+        parser.add_argument(
+            '--no-icon-subsets',
+            action='store_true',
+            help="Don't rebuild the per-page icon font subsets (see build_icon_subset); stale ones still fail",
+        )
+        parser.add_argument(
+            '--profile',
+            action='store_true',
+            help='Time every stage and page and count bytes read and written',
+        )
+        parser.add_argument(
+            '--profile-out',
+            default=str(Path(settings.BASE_DIR) / 'export-profile.json'),
+            help='Where --profile writes its JSON report (default: export-profile.json)',
+        )
+        parser.add_argument(
+            '--profile-render',
+            metavar='PATH',
+            help='Also run rendering and post-processing under cProfile and dump the stats to PATH '
+                 '(implies --profile)',
+        )
+
     def handle(self, *args, **options):
+        self.service_worker = not options['no_service_worker']
+        self.profiler = None
+        if options['profile'] or options['profile_render']:
+            self.profiler = ExportProfiler(('render', 'postprocess') if options['profile_render'] else ())
+        
+        # Refuse to write anything if the config has broken references
+        if not options['skip_validation']:
+            with self.stage('validate'):
+                for name, path in catalogue_paths().items():
+                    self.stdout.write(f'Validating {name} map config...')
+                    call_command('validate_config', path, errors_only=True, stdout=self.stdout, stderr=self.stderr)
+
+        # Placeholder images go into static/thumbs before the static files are copied;
+        # unchanged images are reused, so this is quick after the first run
+        if not options['no_thumbnails']:
+            with self.stage('thumbnails'):
+                call_command('build_thumbnails', stdout=self.stdout, stderr=self.stderr)
+        
+        # Icon font subsets too, so pages never point at glyphs a subset lacks
+        with self.stage('icon_subsets'):
+            self.build_icon_subsets(rebuild=not options['no_icon_subsets'])
+
         # Set up the output directory (docs/ for GitHub Pages)
         output_dir = Path(settings.BASE_DIR) / 'docs'
         static_dir = output_dir / 'static'
+        self.output_root = output_dir
         
         # Clean up previous build files (except .nojekyll and .gitkeep)
         self.stdout.write('Cleaning up previous build...')
-        for item in output_dir.glob('*'):
-            if item.is_file() and item.name not in ['.nojekyll', 'CNAME']:
-                item.unlink()
-            elif item.is_dir() and item.name != 'static':
-                shutil.rmtree(item, ignore_errors=True)
-        
-        # Clean and create output directories
-        if output_dir.exists():
-            shutil.rmtree(output_dir)
-        output_dir.mkdir(parents=True, exist_ok=True)
-        static_dir.mkdir(parents=True, exist_ok=True)
+        with self.stage('clean'):
+            for item in output_dir.glob('*'):
+                if item.is_file() and item.name not in ['.nojekyll', 'CNAME']:
+                    item.unlink()
+                elif item.is_dir() and item.name != 'static':
+                    shutil.rmtree(item, ignore_errors=True)
+            
+            # Clean and create output directories
+            if output_dir.exists():
+                shutil.rmtree(output_dir)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            static_dir.mkdir(parents=True, exist_ok=True)
         
         # Copy static files including fonts
         static_files_dir = settings.STATIC_ROOT if hasattr(settings, 'STATIC_ROOT') else settings.BASE_DIR / 'static'
+        with self.stage('static_copy'):
+            self.copy_static_root(static_files_dir, static_dir)
+        
+        # The app and project static files (generated subsets and thumbnails
+        # included) complete docs/static, which every page links to
+        self.copy_static_files(static_dir)
+        
+        # Create a request factory
+        self.factory = RequestFactory()
+        self.bytes_saved = 0
+        self.alias_stubs = set()
+        
+        try:
+            # Build every catalogue into one tree; the regional ones live in
+            # docs/<name>/ and share the static files, 404 page and service worker
+            redirects = []
+            for name, path in catalogue_paths().items():
+                # Old IDs first, so they win over the catch-all rules
+                redirects[:0] = self.export_catalogue(name, path, output_dir)
+                if name != DEFAULT_CATALOGUE:
+                    redirects.append(f'/{name}/* /{name}/index.html 200')
+            
+            # Create a simple _redirects file for Netlify/Cloudflare Pages
+            with self.stage('write'):
+                with open(output_dir / '_redirects', 'w') as f:
+                    for rule in redirects + ['/* /index.html 200']:
+                        f.write(rule + '\n')
+                self.wrote(output_dir / '_redirects')
+            
+            # Create a simple 404 page
+            with self.stage('write'):
+                self.create_404_page(output_dir)
+                self.wrote(output_dir / '404.html')
+            
+            # Generate the service worker last so its manifest sees every file
+            if self.service_worker:
+                with self.stage('service_worker'):
+                    self.create_service_worker(output_dir)
+                    self.wrote(output_dir / 'sw.js')
+            
+            self.stdout.write(f'HTML post-processing saved {self.bytes_saved:,} bytes in total')
+            self.stdout.write(self.style.SUCCESS(f'Successfully exported site to {output_dir}'))
+            
+        except Exception as e:
+            logger.error(f'Error during export: {str(e)}', exc_info=True)
+            self.stderr.write(self.style.ERROR(f'Error: {str(e)}'))
+            raise
+        
+        if self.profiler:
+            self.write_profile(options['profile_out'], options['profile_render'])
+    
+    def stage(self, name, page=None):
+        """Time a stage of the export when profiling."""
+        return self.profiler.stage(name, page) if self.profiler else nullcontext()
+    
+    def wrote(self, path, page=None):
+        if self.profiler:
+            self.profiler.wrote(os.path.getsize(path), page=page)
+    
+    def copied(self, path):
+        """Count a file or directory that was just copied."""
+        if not self.profiler:
+            return
+        if os.path.isdir(path):
+            self.profiler.wrote_tree(path)
+        else:
+            size = os.path.getsize(path)
+            self.profiler.read(size)
+            self.profiler.wrote(size)
+    
+    def write_profile(self, report_path, stats_path=None):
+        """Write the --profile JSON report and print its summary."""
+        self.profiler.write_report(report_path)
+        self.stdout.write('')
+        for line in self.profiler.summary():
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f'Wrote export profile to {report_path}'))
+        if stats_path:
+            self.profiler.dump_stats(stats_path)
+            self.stdout.write(self.style.SUCCESS(
+                f'Wrote render profile to {stats_path} (view with `python -m pstats {stats_path}`)'
+            ))
+    
+    def copy_static_root(self, static_files_dir, static_dir):
+        """Copy the collected static files (STATIC_ROOT) into the export."""
         if os.path.exists(static_files_dir):
             self.stdout.write(f'Copying static files from {static_files_dir} to {static_dir}...')
             if os.path.exists(static_dir):
                 shutil.rmtree(static_dir)
+            os.makedirs(static_dir, exist_ok=True)
             
             # Copy all files except the fonts directory first
             for item in os.listdir(static_files_dir):
@@ -63,99 +225,132 @@ class Command(BaseCommand):
                         os.path.join(fonts_dest, font_file)
                     )
                 self.stdout.write(self.style.SUCCESS('Copied font files'))
+            self.copied(static_dir)
+    
+    def build_icon_subsets(self, rebuild=True):
+        """
+        Rebuild the icon font subsets, then make sure they cover every catalogue.
+
+        A failed rebuild (no fontTools, no fantasticon output) is only a
+        warning while the existing subsets, if any, still have every glyph
+        the pages show; stale subsets fail the export.
+        """
+        if rebuild:
+            try:
+                call_command('build_icon_subset', stdout=self.stdout, stderr=self.stderr)
+            except CommandError as e:
+                self.stderr.write(self.style.WARNING(f'Icon subsets not rebuilt: {e}'))
+        static_dir = Path(settings.STATICFILES_DIRS[0])
+        template_dirs = [d for t in settings.TEMPLATES for d in t.get('DIRS', [])]
+        for name, path in catalogue_paths().items():
+            try:
+                with open(path, 'r') as f:
+                    config = json.load(f)
+            except FileNotFoundError:
+                continue
+            stale = stale_subsets(config, static_dir / 'fonts' / 'custom-icons.css', static_dir / SUBSET_DIR,
+                                  template_dirs)
+            if stale:
+                pages = ', '.join(f"{page} ({', '.join(icons)})" for page, icons in sorted(stale.items()))
+                raise CommandError(f'Icon subsets are missing glyphs for catalogue {name}: {pages}; '
+                                   'run `python manage.py build_icon_subset`')
+    
+    def export_catalogue(self, name, path, output_dir):
+        """Export the pages of one catalogue (the default one at the site root)."""
+        catalogue_dir = output_dir if name == DEFAULT_CATALOGUE else output_dir / name
+        catalogue_dir.mkdir(parents=True, exist_ok=True)
+        if name != DEFAULT_CATALOGUE:
+            self.stdout.write(self.style.SUCCESS(f'Exporting catalogue {name} to {catalogue_dir}'))
+        self.catalogue_name = name
+        with self.stage('config_load'):
+            self.load_config(path, depth=0 if name == DEFAULT_CATALOGUE else 1)
+            if self.profiler and os.path.exists(path):
+                self.profiler.read(os.path.getsize(path))
+            self.aliases = AliasTable.load(aliases_path(path))
         
-        # Create a request factory
-        self.factory = RequestFactory()
+        # Indicator menu data, shared by every catalogue's pages in docs/chunks/
+        with self.stage('chunks'):
+            self.export_chunks()
         
-        try:
-            # Load the map config
-            self.load_config()
+        # Export the root URL (homepage) first
+        self.export_page('', catalogue_dir, self.config, 'index.html')
+        
+        # Create theme group index pages (they use the static files in docs/static/)
+        for group in self.config.get('themeGroups', []):
+            group_id = group['id']
+            group_dir = catalogue_dir / group_id
+            group_dir.mkdir(exist_ok=True)
+            
+            # Create index.html for the theme group
+            self.export_page(
+                '', 
+                catalogue_dir, 
+                self.config, 
+                theme_group=group_id,
+                output_filename=f"{group_id}/index.html"
+            )
+        
+        # Export each page from config with theme groups
+        for page_name in self.config.keys():
+            if page_name not in ['themes', 'indicators', 'themeGroups']:  # Skip special keys
+                continue
             
-            # Export the root URL (homepage) first
-            self.export_page('', output_dir, self.config, 'index.html')
+            # Export the page with all themes
+            self.export_page(page_name, catalogue_dir, self.config)
             
-            # Create theme group index pages
+            # Export the page for each theme group
             for group in self.config.get('themeGroups', []):
                 group_id = group['id']
-                group_dir = output_dir / group_id
+                group_dir = catalogue_dir / group_id
                 group_dir.mkdir(exist_ok=True)
                 
-                # Create index.html for the theme group
                 self.export_page(
-                    '', 
-                    output_dir, 
+                    page_name, 
+                    catalogue_dir, 
                     self.config, 
                     theme_group=group_id,
-                    output_filename=f"{group_id}/index.html"
+                    output_filename=f"{group_id}/{page_name}.html"
                 )
-                
-                # Copy static files to the theme group directory
-                static_src = Path(settings.STATIC_ROOT or settings.STATICFILES_DIRS[0])
-                static_dest = group_dir / 'static'
-                if static_src.exists() and static_src.is_dir():
-                    if static_dest.exists():
-                        shutil.rmtree(static_dest)
-                    shutil.copytree(static_src, static_dest)
-                    self.stdout.write(self.style.SUCCESS(f'Copied static files to {static_dest}'))
-            
-            # Export each page from config with theme groups
-            for page_name in self.config.keys():
-                if page_name not in ['themes', 'indicators', 'themeGroups']:  # Skip special keys
-                    continue
-                
-                # Export the page with all themes
-                self.export_page(page_name, output_dir, self.config)
-                
-                # Export the page for each theme group
-                for group in self.config.get('themeGroups', []):
-                    group_id = group['id']
-                    group_dir = output_dir / group_id
-                    group_dir.mkdir(exist_ok=True)
-                    
-                    self.export_page(
-                        page_name, 
-                        output_dir, 
-                        self.config, 
-                        theme_group=group_id,
-                        output_filename=f"{group_id}/{page_name}.html"
-                    )
-                    
-                    # Ensure static files are copied for each theme group page
-                    static_src = Path(settings.STATIC_ROOT or settings.STATICFILES_DIRS[0])
-                    static_dest = group_dir / 'static'
-                    if not static_dest.exists() and static_src.exists() and static_src.is_dir():
-                        shutil.copytree(static_src, static_dest)
-                        self.stdout.write(self.style.SUCCESS(f'Copied static files to {static_dest}'))
-            
-            # Export themes page
-            self.export_page('themes', output_dir, self.config, 'themes.html')
-            
-            # Create a simple _redirects file for Netlify/Cloudflare Pages
-            with open(output_dir / '_redirects', 'w') as f:
-                f.write('/* /index.html 200\n')
-            
-            # Copy static files
-            self.copy_static_files(static_dir)
-            
-            # Create a simple 404 page
-            self.create_404_page(output_dir)
-            
-            self.stdout.write(self.style.SUCCESS(f'Successfully exported site to {output_dir}'))
-            
-        except Exception as e:
-            logger.error(f'Error during export: {str(e)}', exc_info=True)
-            self.stderr.write(self.style.ERROR(f'Error: {str(e)}'))
-            raise
+        
+        # Export themes page
+        self.export_page('themes', catalogue_dir, self.config, 'themes.html')
+        
+        # Indicator fragments for switching indicators without a page load
+        with self.stage('fragments'):
+            self.export_fragments(catalogue_dir)
+        
+        # Old links to renamed IDs
+        with self.stage('aliases'):
+            return self.export_aliases(name, catalogue_dir)
     
-    def load_config(self):
-        """Load the map configuration."""
-        config_path = Path(settings.BASE_DIR) / 'map_config.json'
+    def load_config(self, path=None, depth=0):
+        """
+        Load a catalogue's config and set up HTML post-processing for it.
+
+        ``depth`` is how far the catalogue's pages sit below the export root;
+        every page, theme group and regional ones included, uses the root's
+        static files and service worker instead of copies of its own.
+        """
+        path = path or config_path()
         try:
-            with open(config_path, 'r') as f:
+            with open(path, 'r') as f:
                 self.config = json.load(f)
         except FileNotFoundError:
-            self.stderr.write(self.style.ERROR('map_config.json not found!'))
+            self.stderr.write(self.style.ERROR(f'{path} not found!'))
             self.config = {}
+        
+        self.catalogue = Catalogue(self.config, name=self.catalogue_name)
+        preconnect, dns_prefetch = embed_hint_origins(self.catalogue.embed_hosts)
+        self.depth = depth
+        self.postprocessors = {}
+        for group_depth in (0, 1):
+            static_prefix = '../' * (depth + group_depth) + 'static/' if depth + group_depth else './static/'
+            self.postprocessors[group_depth] = HtmlPostProcessor(
+                static_prefix=static_prefix,
+                root_prefix='./',
+                preconnect=preconnect,
+                dns_prefetch=dns_prefetch,
+            )
     
     def copy_static_files(self, static_dir):
         """Copy all static files to the output directory."""
@@ -164,6 +359,28 @@ class Command(BaseCommand):
         # Ensure the static directory exists
         static_dir.mkdir(parents=True, exist_ok=True)
         
+        with self.stage('app_static_copy'):
+            self.copy_app_static_files(static_dir)
+        
+        # Copy admin static files
+        with self.stage('admin_copy'):
+            try:
+                from django.contrib import admin
+                admin_static = Path(admin.__file__).parent / 'static' / 'admin'
+                if admin_static.exists():
+                    self.stdout.write('Copying admin static files...')
+                    dest_admin = static_dir / 'admin'
+                    if dest_admin.exists():
+                        shutil.rmtree(dest_admin)
+                    shutil.copytree(admin_static, dest_admin)
+                    self.copied(dest_admin)
+            except Exception as e:
+                self.stderr.write(f'Error copying admin static files: {str(e)}')
+        
+        self.stdout.write(self.style.SUCCESS(f'Successfully copied static files to {static_dir}'))
+    
+    def copy_app_static_files(self, static_dir):
+        """Copy the static files of the project's apps and STATICFILES_DIRS."""
         # Copy static files from each app
         for app in settings.INSTALLED_APPS:
             if app.startswith('django.'):
@@ -194,6 +411,7 @@ class Command(BaseCommand):
                                 dest_path = static_dir / rel_path
                                 dest_path.parent.mkdir(parents=True, exist_ok=True)
                                 shutil.copy2(item, dest_path)
+                                self.copied(dest_path)
                         except Exception as e:
                             self.stderr.write(f'Error copying {item}: {str(e)}')
                             
@@ -216,25 +434,11 @@ class Command(BaseCommand):
                                 dest_path = static_dir / rel_path
                                 dest_path.parent.mkdir(parents=True, exist_ok=True)
                                 shutil.copy2(item, dest_path)
+                                self.copied(dest_path)
                         except Exception as e:
                             self.stderr.write(f'Error copying {item}: {str(e)}')
             except Exception as e:
                 self.stderr.write(f'Error processing static directory {static_dir_path}: {str(e)}')
-        
-        # Copy admin static files
-        try:
-            from django.contrib import admin
-            admin_static = Path(admin.__file__).parent / 'static' / 'admin'
-            if admin_static.exists():
-                self.stdout.write('Copying admin static files...')
-                dest_admin = static_dir / 'admin'
-                if dest_admin.exists():
-                    shutil.rmtree(dest_admin)
-                shutil.copytree(admin_static, dest_admin)
-        except Exception as e:
-            self.stderr.write(f'Error copying admin static files: {str(e)}')
-        
-        self.stdout.write(self.style.SUCCESS(f'Successfully copied static files to {static_dir}'))
     
     def export_page(self, page_name, output_dir, config, output_filename=None, theme_group=None):
         """Export a single page to a static HTML file."""
@@ -259,6 +463,7 @@ class Command(BaseCommand):
                 
             # Ensure we're always writing to the root of output_dir
             output_path = output_dir / output_filename
+            page_key = output_path.relative_to(self.output_root).as_posix()
             
             self.stdout.write(f'Exporting {url} to {output_path}...')
             
@@ -269,29 +474,51 @@ class Command(BaseCommand):
             page_data = config.get(page_name, {}) if (page_name and page_name in config) else {}
             
             # Get themes based on theme group filter
-            themes = config.get('themes', [])
-            if theme_group:
-                # Find the theme group and filter themes
-                theme_group_data = next(
-                    (g for g in config.get('themeGroups', []) if g['id'] == theme_group),
-                    None
-                )
-                if theme_group_data:
-                    theme_ids = set(theme_group_data.get('themeIds', []))
-                    themes = [t for t in themes if t.get('id') in theme_ids]
+            with self.stage('theme_filter', page_key):
+                themes = config.get('themes', [])
+                if theme_group:
+                    # Find the theme group and filter themes
+                    theme_group_data = next(
+                        (g for g in config.get('themeGroups', []) if g['id'] == theme_group),
+                        None
+                    )
+                    if theme_group_data:
+                        theme_ids = set(theme_group_data.get('themeIds', []))
+                        themes = [t for t in themes if t.get('id') in theme_ids]
             
             # Prepare the context with themes and indicators
             context = {
                 'page_name': page_name or 'Home',
+                'theme_group': theme_group,
                 'themes': themes,  # Filtered themes based on theme group
                 'indicators': {
                     'all': config.get('indicators', {}),
                     'page_name': page_data if isinstance(page_data, dict) else {}
                 },
                 'page_config': page_data if isinstance(page_data, dict) else {},
-                'STATIC_URL': '../static/' if theme_group else './static/'  # Adjust static URL based on theme group
+                'STATIC_URL': '../static/' if theme_group else './static/',  # Adjust static URL based on theme group
+                'defer_map2': getattr(settings, 'MAP_DEFER_SECOND_MAP', True),
+                # Placeholder images are only copied to the root static directory
+                'thumbnails_url': '../' * (self.depth + (1 if theme_group else 0)) + 'static/thumbs/',
+                'catalogue_name': self.catalogue_name,
+                # Fragments sit in the catalogue's fragment/ directory
+                'fragment_url': ('../' if theme_group else './') + f'fragment/{FRAGMENT_PLACEHOLDER}.json',
+                'chunk_urls': [
+                    '../' * (self.depth + (1 if theme_group else 0)) + f'chunks/{chunk}.js'
+                    for chunk in chunk_set(self.catalogue).for_scope(theme_group)
+                ] if self.catalogue.has_themes else None,
+                # The page maps old IDs in its query string itself (no 301s here)
+                'aliases_url': (('../' if theme_group else './') + 'aliases.json') if self.aliases else '',
             }
             
+            # The service worker lives at the site root and controls every page
+            if self.service_worker:
+                root = '../' * (self.depth + (1 if theme_group else 0)) or './'
+                context.update({
+                    'service_worker_url': f'{root}sw.js',
+                    'service_worker_scope': root,
+                })
+            
             # Add map URLs if they exist
             if isinstance(page_data, dict):
                 context.update({
@@ -301,32 +528,22 @@ class Command(BaseCommand):
             
             # Render the template
             try:
-                content = render_to_string('mapviewer/map.html', context)
-                
-                # Fix any remaining static file paths to be relative to the base URL
-                content = content.replace('href="/static/', 'href="static/')
-                content = content.replace('src="/static/', 'src="static/')
-                
-                # Ensure all static file paths are relative to the base URL
-                content = content.replace('href="static/', 'href="./static/')
-                content = content.replace('src="static/', 'src="./static/')
+                with self.stage('render', page_key):
+                    content = render_to_string('mapviewer/map.html', context)
                 
-                # Fix any remaining absolute paths that might cause issues
-                content = content.replace('href="/', 'href="./')
-                
-                # For GitHub Pages, we need to set the base URL correctly
-                # Since we're using .html files in the root, we can use './' as the base
-                base_path = './'
-                
-                # Add base tag to fix relative paths
-                head_end = content.find('</head>')
-                if head_end > 0:
-                    base_tag = f'<base href="{base_path}">\n    <meta name="viewport" content="width=device-width, initial-scale=1.0">\n</head>'
-                    content = content[:head_end] + base_tag + content[head_end + 7:]
+                # Make static and root-relative paths relative to the page,
+                # minify, and add embed host hints in a single pass
+                with self.stage('postprocess', page_key):
+                    result = self.postprocessors[1 if theme_group else 0].process(content)
+                content = result.html
+                self.bytes_saved += result.saved_bytes
+                self.stdout.write(f'  {result.final_bytes:,} bytes (saved {result.saved_bytes:,})')
                 
                 # Write the content to a file
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
+                with self.stage('write', page_key):
+                    with open(output_path, 'w', encoding='utf-8') as f:
+                        f.write(content)
+                    self.wrote(output_path, page_key)
                     
             except Exception as e:
                 self.stderr.write(f'Error rendering {url}: {str(e)}')
@@ -336,6 +553,90 @@ class Command(BaseCommand):
             self.stderr.write(f'Error exporting page {page_name}: {str(e)}')
             raise
     
+    def export_chunks(self):
+        """Write the content-hashed indicator chunks of the current catalogue to docs/chunks/."""
+        chunk_dir = self.output_root / 'chunks'
+        chunk_dir.mkdir(exist_ok=True)
+        bodies = chunk_set(self.catalogue).bodies if self.catalogue.has_themes else {}
+        for chunk, body in bodies.items():
+            path = chunk_dir / f'{chunk}.js'
+            path.write_bytes(body)
+            self.wrote(path)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(bodies)} indicator chunks to {chunk_dir}'))
+    
+    def export_fragments(self, catalogue_dir):
+        """Write fragment/<indicator id>.json for every indicator, as served by /fragment/<id>/."""
+        fragment_dir = catalogue_dir / 'fragment'
+        fragment_dir.mkdir(exist_ok=True)
+        count = 0
+        for indicator_id in self.catalogue.indicators if self.catalogue.has_themes else ():
+            fragment = self.catalogue.fragment(indicator_id)
+            if fragment is None:
+                continue
+            path = fragment_dir / f'{indicator_id}.json'
+            path.write_bytes(fragment_payload(fragment))
+            self.wrote(path)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} indicator fragments to {fragment_dir}'))
+    
+    def export_aliases(self, name, catalogue_dir):
+        """
+        Write aliases.json and a redirect stub at <old indicator id>/index.html for each renamed indicator.
+
+        Returns the matching ``_redirects`` rules (301s to the current page).
+        """
+        if not self.aliases:
+            return []
+        path = catalogue_dir / 'aliases.json'
+        path.write_text(json.dumps(self.aliases.as_dict(), ensure_ascii=False, separators=(',', ':')),
+                        encoding='utf-8')
+        self.wrote(path)
+        prefix = '' if name == DEFAULT_CATALOGUE else f'/{name}'
+        rules = []
+        for old_id, new_id in sorted(self.aliases.tables['indicators'].items()):
+            fragment = self.catalogue.fragment(new_id)
+            stub_dir = catalogue_dir / old_id
+            if fragment is None or '/' in old_id or old_id.startswith('.') or stub_dir.exists():
+                continue
+            query = urlencode([('theme', fragment['theme']), ('subtheme', fragment['subtheme']),
+                               ('indicator', new_id)])
+            stub_dir.mkdir()
+            stub = stub_dir / 'index.html'
+            target = escape(f'../?{query}')
+            stub.write_text(
+                '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Moved</title>'
+                f'<link rel="canonical" href="{target}"><meta http-equiv="refresh" content="0; url={target}">'
+                f'</head><body><p>This map has moved to <a href="{target}">{target}</a>.</p></body></html>',
+                encoding='utf-8',
+            )
+            self.wrote(stub)
+            self.alias_stubs.add(stub.relative_to(self.output_root).as_posix())
+            rules.append(f'{prefix}/{old_id}/ {prefix}/?{query} 301')
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {len(self.aliases)} ID aliases and {len(rules)} redirect stubs for catalogue {name}'
+        ))
+        return rules
+    
+    def create_service_worker(self, output_dir):
+        """Write sw.js with a precache manifest built from the exported files."""
+        pages = sorted(
+            path.relative_to(output_dir).as_posix()
+            for path in output_dir.rglob('*.html')
+            if path.name != '404.html' and 'static' not in path.relative_to(output_dir).parts
+            and path.relative_to(output_dir).as_posix() not in self.alias_stubs
+        )
+        manifest = precache_manifest(output_dir, pages)
+        version = hashlib.md5(json.dumps(manifest, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        content = render_to_string('mapviewer/sw.js', {
+            'version': version,
+            'manifest': json.dumps(manifest, indent=2),
+        })
+        with open(output_dir / 'sw.js', 'w', encoding='utf-8') as f:
+            f.write(content)
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated service worker version {version} precaching {len(manifest)} files'
+        ))
+    
     def create_404_page(self, output_dir):
         """Create a simple 404 page."""
         try:
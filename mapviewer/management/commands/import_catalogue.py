@@ -0,0 +1,41 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mapviewer.catalogue import ConfigError, check_config, config_path
+from mapviewer.store import import_config
+from mapviewer.validation import errors, parse_config, validate_config
+
+
+class Command(BaseCommand):
+    help = 'Load map_config.json into the database (replaces what is stored)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Config file to import (defaults to MAP_CONFIG_PATH)')
+        parser.add_argument('--force', action='store_true',
+                            help='Import even if validation fails (broken references are dropped)')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'] or config_path())
+        try:
+            config, duplicates = parse_config(path.read_bytes())
+            check_config(config)
+        except FileNotFoundError:
+            raise CommandError(f'{path} not found')
+        except (ValueError, ConfigError) as e:
+            raise CommandError(f'{path}: {e}')
+        if 'themes' not in config:
+            raise CommandError(f'{path}: only the themed config format can be imported')
+
+        problems = errors(validate_config(config, duplicates))
+        for problem in problems:
+            self.stderr.write(self.style.ERROR(str(problem)))
+        if problems and not options['force']:
+            raise CommandError(f'{path}: {len(problems)} validation error(s), use --force to import anyway')
+
+        started = time.perf_counter()
+        counts = import_config(config)
+        elapsed = (time.perf_counter() - started) * 1000
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Imported {summary} from {path.name} ({elapsed:.0f} ms)'))
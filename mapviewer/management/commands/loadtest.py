@@ -0,0 +1,71 @@
+import json
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mapviewer.catalogue import get_catalogue
+from mapviewer.loadtest import (
+    build_traffic_mix, catalogue_from_config, load_weights, parse_url_catalogue, run_load, summarize,
+)
+
+
+class Command(BaseCommand):
+    help = 'Replay a weighted mix of map viewer deep links against a running server and report latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', nargs='?', default='http://127.0.0.1:8000',
+                            help='Server to test (default http://127.0.0.1:8000)')
+        parser.add_argument('--urls', default=str(Path(settings.BASE_DIR) / 'all_map_urls.txt'),
+                            help='URL catalogue written by generate_urls.py')
+        parser.add_argument('--weights', help='JSON file of {indicator or theme group id: weight}')
+        parser.add_argument('-c', '--concurrency', type=int, default=8)
+        parser.add_argument('-n', '--requests', type=int, help='Total requests to send (default 1000)')
+        parser.add_argument('-d', '--duration', type=float, help='Run for this many seconds instead')
+        parser.add_argument('--seed', type=int, help='Seed for a repeatable request sequence')
+        parser.add_argument('--json', dest='json_path', help='Also write the report as JSON')
+
+    def handle(self, *args, **options):
+        config = get_catalogue().config
+        if os.path.exists(options['urls']):
+            entries = parse_url_catalogue(options['urls'])
+        else:
+            self.stderr.write(f"{options['urls']} not found; building deep links from the config")
+            entries = catalogue_from_config(config)
+        if not entries:
+            raise CommandError('No URLs to replay')
+
+        weights = load_weights(options['weights']) if options['weights'] else None
+        paths, path_weights = build_traffic_mix(entries, config, weights)
+        if not paths:
+            raise CommandError('Every URL has a weight of zero')
+
+        self.stdout.write(
+            f"Replaying {len(paths)} distinct URLs from {len(entries)} deep links against "
+            f"{options['base_url']} with {options['concurrency']} workers..."
+        )
+        samples, elapsed = run_load(
+            options['base_url'], paths, path_weights,
+            concurrency=options['concurrency'],
+            requests=options['requests'],
+            duration=options['duration'],
+            seed=options['seed'],
+        )
+        report = summarize(samples, elapsed)
+
+        latency = report['latency_ms']
+        self.stdout.write(f"Requests:    {report['requests']} in {report['elapsed_s']}s")
+        self.stdout.write(f"Throughput:  {report['throughput_rps']} req/s")
+        self.stdout.write(
+            f"Latency ms:  mean {latency['mean']}  p50 {latency['p50']}  p90 {latency['p90']}  "
+            f"p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}"
+        )
+        self.stdout.write(f"Transferred: {report['bytes']:,} bytes ({report['bytes_per_s']:,} bytes/s)")
+        self.stdout.write(f"Statuses:    {report['statuses']}")
+        style = self.style.ERROR if report['error_rate'] else self.style.SUCCESS
+        self.stdout.write(style(f"Error rate:  {report['error_rate']:.2%}"))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
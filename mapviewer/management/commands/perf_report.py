@@ -0,0 +1,71 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from mapviewer.telemetry import DIMENSIONS, METRICS, load_histograms
+
+
+class Command(BaseCommand):
+    help = 'Rank the indicators and embed hosts visitors wait on longest, from the client telemetry'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=7, help='Report on the last N days (default 7)')
+        parser.add_argument('--metric', choices=METRICS, help='Only this metric (default all)')
+        parser.add_argument('--by', choices=DIMENSIONS, help='Only rank indicators or hosts (default both)')
+        parser.add_argument('--catalogue', help='Only timings from pages of this catalogue')
+        parser.add_argument('--percentile', type=float, default=95, help='Rank by this percentile (default 95)')
+        parser.add_argument('--min-samples', type=int, default=5,
+                            help='Leave out keys with fewer timings (default 5)')
+        parser.add_argument('--limit', type=int, default=10, help='Rows per table (default 10)')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if not 0 < options['percentile'] <= 100:
+            raise CommandError('--percentile must be between 0 and 100')
+        fraction = options['percentile'] / 100
+        since = timezone.now() - timedelta(days=options['days'])
+        histograms = load_histograms(since, options['catalogue'], options['metric'])
+
+        report = []
+        for metric in METRICS:
+            for dimension in DIMENSIONS:
+                if options['metric'] not in (None, metric) or options['by'] not in (None, dimension):
+                    continue
+                rows = [
+                    {
+                        'key': key,
+                        'count': histogram.count,
+                        'p50_ms': histogram.percentile(0.5),
+                        'rank_ms': histogram.percentile(fraction),
+                        'mean_ms': round(histogram.mean_ms),
+                        'max_ms': round(histogram.max_ms),
+                    }
+                    for (row_metric, row_dimension, key), histogram in histograms.items()
+                    if row_metric == metric and row_dimension == dimension
+                    and histogram.count >= options['min_samples']
+                ]
+                rows.sort(key=lambda row: (-row['rank_ms'], -row['mean_ms']))
+                if rows:
+                    report.append({'metric': metric, 'by': dimension, 'rows': rows[:options['limit']]})
+
+        if options['json']:
+            self.stdout.write(json.dumps({'days': options['days'], 'percentile': options['percentile'],
+                                          'tables': report}, indent=2))
+            return
+        if not report:
+            self.stdout.write(self.style.WARNING(
+                f"No timings with at least {options['min_samples']} samples in the last {options['days']:g} days"
+            ))
+            return
+
+        rank = f"p{options['percentile']:g}"
+        for table in report:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Slowest {table['by']}s: {table['metric']}"))
+            width = max(len(table['by']), *(len(row['key']) for row in table['rows']))
+            self.stdout.write(f"  {table['by']:<{width}} {'count':>7} {'p50 ms':>8} {rank + ' ms':>8} "
+                              f"{'mean ms':>8} {'max ms':>8}")
+            for row in table['rows']:
+                self.stdout.write(f"  {row['key']:<{width}} {row['count']:>7} {row['p50_ms']:>8.0f} "
+                                  f"{row['rank_ms']:>8.0f} {row['mean_ms']:>8} {row['max_ms']:>8}")
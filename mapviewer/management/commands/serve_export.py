@@ -0,0 +1,48 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mapviewer.preview_server import PreviewServer
+
+
+class Command(BaseCommand):
+    help = 'Serve the static export in docs/ with CDN-like caching, compression and range support'
+
+    def add_arguments(self, parser):
+        parser.add_argument('addrport', nargs='?', default='127.0.0.1:8000',
+                            help='Address and port to listen on (default 127.0.0.1:8000)')
+        parser.add_argument('--root', default=str(Path(settings.BASE_DIR) / 'docs'),
+                            help='Directory to serve (default docs/)')
+        parser.add_argument('--cache-mb', type=int, default=32,
+                            help='Size of the in-memory file cache in MB')
+        parser.add_argument('--quiet', action='store_true', help="Don't log each request")
+
+    def handle(self, *args, **options):
+        root = Path(options['root'])
+        if not root.is_dir():
+            raise CommandError(f'{root} does not exist; run `python manage.py export_to_gh_pages` first')
+
+        host, _, port = options['addrport'].rpartition(':')
+        try:
+            port = int(port)
+        except ValueError:
+            raise CommandError(f"'{options['addrport']}' is not a valid port or address:port")
+
+        server = PreviewServer(
+            (host or '127.0.0.1', port),
+            root,
+            cache_bytes=options['cache_mb'] * 1024 * 1024,
+            verbose=not options['quiet'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Serving {root} at http://{host or "127.0.0.1"}:{port}/ ({len(server.redirects)} redirect rule(s))'
+        ))
+        self.stdout.write('Quit the server with CONTROL-C.')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'File cache: {server.cache.hits} hits, {server.cache.misses} misses')
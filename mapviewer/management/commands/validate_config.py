@@ -0,0 +1,46 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mapviewer.catalogue import config_path
+from mapviewer.validation import ERROR, WARNING, parse_config, validate_config
+
+
+class Command(BaseCommand):
+    help = 'Check map_config.json for broken references, duplicate IDs and bad embed URLs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Config file to check (defaults to MAP_CONFIG_PATH)')
+        parser.add_argument('--strict', action='store_true', help='Treat warnings as errors')
+        parser.add_argument('--errors-only', action='store_true', help="Don't print warnings")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'] or config_path())
+        try:
+            raw = path.read_bytes()
+        except FileNotFoundError:
+            raise CommandError(f'{path} not found')
+
+        started = time.perf_counter()
+        try:
+            config, duplicates = parse_config(raw)
+        except ValueError as e:
+            raise CommandError(f'{path}: invalid JSON ({e})')
+        issues = validate_config(config, duplicates)
+        elapsed = (time.perf_counter() - started) * 1000
+
+        error_count = sum(1 for issue in issues if issue.level == ERROR)
+        warning_count = len(issues) - error_count
+        for issue in issues:
+            if issue.level == ERROR:
+                self.stderr.write(self.style.ERROR(str(issue)))
+            elif not options['errors_only']:
+                self.stdout.write(self.style.WARNING(str(issue)))
+
+        indicator_count = len(config.get('indicators', {})) if isinstance(config, dict) else 0
+        summary = (f'{path.name}: {error_count} error(s), {warning_count} warning(s) '
+                   f'in {indicator_count} indicators ({elapsed:.1f} ms)')
+        if error_count or (options['strict'] and warning_count):
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
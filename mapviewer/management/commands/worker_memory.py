@@ -0,0 +1,51 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mapviewer.preload import child_pids, process_memory
+
+
+class Command(BaseCommand):
+    help = "Show the shared and private memory of a prefork server's master and workers (Linux)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('pid', nargs='?', type=int, help='PID of the master process')
+        parser.add_argument('--pidfile', default='gunicorn.pid', help='Read the master PID from this file')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        pid = options['pid']
+        if pid is None:
+            try:
+                with open(options['pidfile'], 'r') as f:
+                    pid = int(f.read().strip())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No PID given and {options['pidfile']} is unusable ({e})")
+
+        rows = [('master', pid, process_memory(pid))]
+        if rows[0][2] is None:
+            raise CommandError(f'Cannot read /proc/{pid}/smaps_rollup')
+        rows += [('worker', child, process_memory(child)) for child in child_pids(pid)]
+        rows = [row for row in rows if row[2] is not None]
+        workers = [memory for role, _, memory in rows if role == 'worker']
+
+        if options['json']:
+            self.stdout.write(json.dumps([{'role': role, 'pid': pid, **memory} for role, pid, memory in rows],
+                                         indent=2))
+            return
+
+        def mb(size):
+            return f'{size / 1024 / 1024:9.1f}'
+
+        self.stdout.write(f"{'process':<8} {'pid':>7} {'RSS MB':>9} {'PSS MB':>9} {'shared':>9} {'private':>9}")
+        for role, pid, memory in rows:
+            self.stdout.write(f"{role:<8} {pid:>7} {mb(memory['Rss'])} {mb(memory['Pss'])} "
+                              f"{mb(memory['Shared'])} {mb(memory['Private'])}")
+        if workers:
+            private = sum(memory['Private'] for memory in workers) / len(workers)
+            shared = sum(memory['Shared'] for memory in workers) / len(workers)
+            total = sum(memory['Pss'] for _, _, memory in rows)
+            self.stdout.write(self.style.SUCCESS(
+                f'{len(workers)} workers: {mb(private).strip()} MB private and {mb(shared).strip()} MB shared each '
+                f'on average; {mb(total).strip()} MB in total (PSS)'
+            ))
@@ -0,0 +1,47 @@
+import logging
+
+from django.conf import settings
+
+from .catalogue import get_catalogue
+from .htmlpost import HtmlPostProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def get_processor(catalogue, **kwargs):
+    """Return a post-processor for a catalogue snapshot."""
+    # Kept on the snapshot, so it goes away with a reload or eviction
+    key = ('htmlpost', tuple(sorted(kwargs.items())))
+    processor = catalogue.cache.get(key)
+    if processor is None:
+        # map_view renders its own embed host hints for the indicator shown
+        processor = catalogue.cache[key] = HtmlPostProcessor(**kwargs)
+    return processor
+
+
+class HtmlPostProcessMiddleware:
+    """Minify rendered HTML pages."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            not getattr(settings, 'HTML_POSTPROCESS', True)
+            or response.streaming
+            or getattr(response, 'preencoded', False)
+            or response.status_code != 200
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith('text/html')
+        ):
+            return response
+
+        match = request.resolver_match
+        catalogue = get_catalogue(match.kwargs.get('catalogue') if match else None)
+        result = get_processor(catalogue).process(response.content.decode(response.charset))
+        response.content = result.html.encode(response.charset)
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = str(len(response.content))
+        logger.debug('%s: saved %d of %d bytes', request.path, result.saved_bytes, result.original_bytes)
+        return response
@@ -0,0 +1,126 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Indicator',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('title', models.TextField(blank=True, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('source', models.TextField(blank=True, null=True)),
+                ('unit_of_measure', models.TextField(blank=True, null=True)),
+                ('icon', models.CharField(blank=True, max_length=200, null=True)),
+                ('map1_url', models.TextField(blank=True, null=True)),
+                ('map2_url', models.TextField(blank=True, null=True)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('extra', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Subtheme',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True)),
+                ('name', models.TextField(blank=True, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('icon', models.CharField(blank=True, max_length=200, null=True)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('extra', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Theme',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True)),
+                ('name', models.TextField(blank=True, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('icon', models.CharField(blank=True, max_length=200, null=True)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('extra', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ThemeGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True)),
+                ('name', models.TextField(blank=True, null=True)),
+                ('icon', models.CharField(blank=True, max_length=200, null=True)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('extra', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ThemeGroupTheme',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='mapviewer.themegroup')),
+                ('theme', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_memberships', to='mapviewer.theme')),
+            ],
+            options={
+                'ordering': ['position'],
+                'unique_together': {('group', 'theme')},
+            },
+        ),
+        migrations.AddField(
+            model_name='theme',
+            name='groups',
+            field=models.ManyToManyField(related_name='themes', through='mapviewer.ThemeGroupTheme', to='mapviewer.themegroup'),
+        ),
+        migrations.CreateModel(
+            name='SubthemeIndicator',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('indicator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subtheme_memberships', to='mapviewer.indicator')),
+                ('subtheme', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='mapviewer.subtheme')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.AddField(
+            model_name='subtheme',
+            name='theme',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subthemes', to='mapviewer.theme'),
+        ),
+        migrations.AddField(
+            model_name='indicator',
+            name='subthemes',
+            field=models.ManyToManyField(related_name='indicators', through='mapviewer.SubthemeIndicator', to='mapviewer.subtheme'),
+        ),
+        migrations.AddIndex(
+            model_name='subthemeindicator',
+            index=models.Index(fields=['subtheme', 'position'], name='mapviewer_s_subthem_2a1238_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subtheme',
+            index=models.Index(fields=['theme', 'position'], name='mapviewer_s_theme_i_ad4a4d_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-19 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mapviewer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatencyHistogram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateTimeField(db_index=True)),
+                ('catalogue', models.CharField(max_length=100)),
+                ('metric', models.CharField(max_length=20)),
+                ('dimension', models.CharField(max_length=20)),
+                ('key', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('buckets', models.JSONField(default=list)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['metric', 'dimension', 'period'], name='mapviewer_l_metric_79d36d_idx')],
+            },
+        ),
+    ]
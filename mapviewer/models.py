@@ -1,3 +1,116 @@
 from django.db import models
 
-# Create your models here.
+# The catalogue as database rows, mirroring the structure of map_config.json.
+# Each object keeps its config ID in ``key``; ``position`` preserves the
+# order things appear in the file so import/export round-trips exactly, and
+# ``extra`` holds any fields the models don't know about.
+
+
+class ThemeGroup(models.Model):
+    key = models.CharField(max_length=200, unique=True)
+    name = models.TextField(null=True, blank=True)
+    icon = models.CharField(max_length=200, null=True, blank=True)
+    position = models.PositiveIntegerField(default=0)
+    extra = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['position']
+
+    def __str__(self):
+        return self.key
+
+
+class Theme(models.Model):
+    key = models.CharField(max_length=200, unique=True)
+    name = models.TextField(null=True, blank=True)
+    description = models.TextField(null=True, blank=True)
+    icon = models.CharField(max_length=200, null=True, blank=True)
+    position = models.PositiveIntegerField(default=0)
+    extra = models.JSONField(default=dict, blank=True)
+    groups = models.ManyToManyField(ThemeGroup, through='ThemeGroupTheme', related_name='themes')
+
+    class Meta:
+        ordering = ['position']
+
+    def __str__(self):
+        return self.key
+
+
+class ThemeGroupTheme(models.Model):
+    group = models.ForeignKey(ThemeGroup, on_delete=models.CASCADE, related_name='memberships')
+    theme = models.ForeignKey(Theme, on_delete=models.CASCADE, related_name='group_memberships')
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['position']
+        unique_together = [('group', 'theme')]
+
+
+class Subtheme(models.Model):
+    key = models.CharField(max_length=200, unique=True)
+    theme = models.ForeignKey(Theme, on_delete=models.CASCADE, related_name='subthemes')
+    name = models.TextField(null=True, blank=True)
+    description = models.TextField(null=True, blank=True)
+    icon = models.CharField(max_length=200, null=True, blank=True)
+    position = models.PositiveIntegerField(default=0)
+    extra = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['position']
+        indexes = [models.Index(fields=['theme', 'position'])]
+
+    def __str__(self):
+        return self.key
+
+
+class Indicator(models.Model):
+    key = models.CharField(max_length=255, unique=True)
+    title = models.TextField(null=True, blank=True)
+    description = models.TextField(null=True, blank=True)
+    source = models.TextField(null=True, blank=True)
+    unit_of_measure = models.TextField(null=True, blank=True)
+    icon = models.CharField(max_length=200, null=True, blank=True)
+    map1_url = models.TextField(null=True, blank=True)
+    map2_url = models.TextField(null=True, blank=True)
+    position = models.PositiveIntegerField(default=0)
+    extra = models.JSONField(default=dict, blank=True)
+    subthemes = models.ManyToManyField(Subtheme, through='SubthemeIndicator', related_name='indicators')
+
+    class Meta:
+        ordering = ['position']
+
+    def __str__(self):
+        return self.key
+
+
+class SubthemeIndicator(models.Model):
+    subtheme = models.ForeignKey(Subtheme, on_delete=models.CASCADE, related_name='memberships')
+    indicator = models.ForeignKey(Indicator, on_delete=models.CASCADE, related_name='subtheme_memberships')
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['position']
+        indexes = [models.Index(fields=['subtheme', 'position'])]
+
+
+class LatencyHistogram(models.Model):
+    """
+    Client timings of one metric for one indicator or embed host, as
+    collected by a server process between two flushes (``telemetry.py``).
+    """
+    period = models.DateTimeField(db_index=True)
+    catalogue = models.CharField(max_length=100)
+    metric = models.CharField(max_length=20)
+    dimension = models.CharField(max_length=20)
+    key = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    # Sample counts per bucket of telemetry.BUCKETS_MS, plus one for the rest
+    buckets = models.JSONField(default=list)
+
+    class Meta:
+        indexes = [models.Index(fields=['metric', 'dimension', 'period'])]
+
+    def __str__(self):
+        return f'{self.metric} {self.dimension}:{self.key}'
@@ -0,0 +1,117 @@
+"""
+Preloading for prefork servers, and a per-process memory breakdown.
+
+With gunicorn's ``--preload`` (see ``gunicorn.conf.py``) the app is imported
+once in the master process, which then forks the workers. ``preload()``
+does the expensive work there: it loads and indexes every catalogue, compiles
+the templates, renders the prewarmed pages and resolves the URLconf. Then it
+moves everything that survived into the permanent generation with
+``gc.freeze()``. The workers start with all of it in pages shared
+copy-on-write with the master. Because of the freeze, the cyclic garbage
+collector never writes to those objects, which would otherwise copy a page
+into every worker on the first collection. Reference counts are still
+written when an object is used, so only the parts workers actually touch
+(mostly small) get copied.
+
+Nothing may leave a thread running in the master: threads don't survive a
+fork. So preloading prewarms in the foreground, and the config watchers
+start in each worker (``after_fork``).
+
+``process_memory`` reads ``/proc/<pid>/smaps_rollup`` (Linux) for the
+``worker_memory`` command's report of shared and private memory per worker.
+"""
+import gc
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+from .catalogue import catalogue_paths, catalogue_published, load_once, loaded_catalogues, start_watcher
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES = ('mapviewer/map.html', 'mapviewer/sw.js')
+
+# Fields of smaps_rollup reported, in kB
+MEMORY_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty', 'Swap')
+
+
+def preload(freeze=True):
+    """
+    Load everything a worker needs before the server forks; returns a summary dict.
+
+    Loads at most ``MAP_CATALOGUE_CACHE_SIZE`` catalogues (the default one first).
+    """
+    from .views import prewarm_on_publish, prewarm_responses
+
+    started = time.perf_counter()
+    limit = max(getattr(settings, 'MAP_CATALOGUE_CACHE_SIZE', 4), 1) + 1
+    names = list(catalogue_paths())[:limit]
+    # No background prewarm threads or watchers in the master
+    catalogue_published.disconnect(prewarm_on_publish)
+    try:
+        catalogues = [load_once(name) for name in names]
+    finally:
+        catalogue_published.connect(prewarm_on_publish)
+
+    for name in TEMPLATES:
+        get_template(name)
+    get_resolver().resolve('/')
+    if getattr(settings, 'MAP_PREWARM_RESPONSES', False):
+        for catalogue in catalogues:
+            prewarm_responses(catalogue)
+
+    gc.collect()
+    if freeze:
+        gc.freeze()
+    summary = {
+        'catalogues': [catalogue.name for catalogue in catalogues],
+        'seconds': round(time.perf_counter() - started, 3),
+        'frozen_objects': gc.get_freeze_count(),
+    }
+    logger.info('Preloaded catalogues %s in %.2fs; %d objects frozen',
+                ', '.join(summary['catalogues']), summary['seconds'], summary['frozen_objects'])
+    return summary
+
+
+def after_fork():
+    """Run in each worker after the fork: start the config watchers preloading skipped."""
+    if getattr(settings, 'MAP_CONFIG_WATCH', False):
+        for name in loaded_catalogues():
+            start_watcher(name)
+
+
+def process_memory(pid):
+    """``{field: bytes}`` from a process's smaps_rollup, or None if it can't be read."""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    memory = dict.fromkeys(MEMORY_FIELDS, 0)
+    for line in lines:
+        field, _, value = line.partition(':')
+        if field in memory:
+            memory[field] = int(value.split()[0]) * 1024
+    memory['Shared'] = memory['Shared_Clean'] + memory['Shared_Dirty']
+    memory['Private'] = memory['Private_Clean'] + memory['Private_Dirty']
+    return memory
+
+
+def child_pids(pid):
+    """The PIDs of a process's children (the workers of a server's master)."""
+    children = []
+    try:
+        tasks = os.listdir(f'/proc/{pid}/task')
+    except OSError:
+        return children
+    for task in tasks:
+        try:
+            with open(f'/proc/{pid}/task/{task}/children', 'r') as f:
+                children.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return sorted(children)
@@ -0,0 +1,271 @@
+"""
+A threaded HTTP server for previewing a static export.
+
+It behaves like the CDN the export is deployed to: precompressed ``.br`` and
+``.gz`` siblings are served when the client accepts them, responses carry
+ETags and honour ``If-None-Match`` and single ``Range`` requests, small files
+are kept in an in-memory LRU cache, and the rules in the export's
+``_redirects`` file are applied to paths that don't exist.
+"""
+import email.utils
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+logger = logging.getLogger(__name__)
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+_HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.\w+$')
+_RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+mimetypes.add_type('font/woff2', '.woff2')
+mimetypes.add_type('font/woff', '.woff')
+mimetypes.add_type('text/javascript', '.js')
+
+
+class CachedFile:
+    __slots__ = ('data', 'etag', 'mtime', 'signature')
+
+    def __init__(self, data, signature, mtime):
+        self.data = data
+        self.signature = signature
+        self.mtime = mtime
+        self.etag = '"%x-%x"' % (signature[0], signature[1])
+
+
+class FileCache:
+    """LRU cache of file contents, revalidated against the file's mtime and size."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_file_bytes=2 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, st):
+        signature = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.signature == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        with open(path, 'rb') as f:
+            data = f.read()
+        entry = CachedFile(data, signature, st.st_mtime)
+        if len(data) <= self.max_file_bytes:
+            with self._lock:
+                old = self._entries.pop(path, None)
+                if old is not None:
+                    self._size -= len(old.data)
+                self._entries[path] = entry
+                self._size += len(data)
+                while self._size > self.max_bytes and self._entries:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= len(evicted.data)
+        return entry
+
+
+def parse_redirects(path):
+    """Parse a Netlify/Cloudflare style ``_redirects`` file into (regex, target, status) rules."""
+    rules = []
+    try:
+        with open(path, 'r') as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return rules
+    for line in lines:
+        parts = line.split('#', 1)[0].split()
+        if len(parts) < 2:
+            continue
+        source, target = parts[0], parts[1]
+        status = int(parts[2].rstrip('!')) if len(parts) > 2 else 301
+        pattern = re.escape(source).replace(r'\*', '(?P<splat>.*)')
+        rules.append((re.compile(pattern + '$'), target, status))
+    return rules
+
+
+def cache_control(fs_path):
+    """Cache-Control for the file actually served, whatever URL reached it."""
+    name = os.path.basename(fs_path)
+    if name.endswith('.html') or name == 'sw.js':
+        return 'no-cache'
+    if _HASHED_NAME.search(name):
+        return 'public, max-age=31536000, immutable'
+    return 'public, max-age=3600'
+
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'EcoScapesPreview/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_HEAD(self):
+        self.handle_get(head=True)
+
+    def do_GET(self):
+        self.handle_get(head=False)
+
+    def handle_get(self, head):
+        url = urlsplit(self.path)
+        url_path = posixpath.normpath(unquote(url.path))
+        if url.path.endswith('/') and not url_path.endswith('/'):
+            url_path += '/'
+        if not url_path.endswith('/') and os.path.isdir(self.fs_path(url_path) or ''):
+            # Like GitHub Pages: the page's relative URLs need the trailing slash
+            query = f'?{url.query}' if url.query else ''
+            self.send_redirect(HTTPStatus.MOVED_PERMANENTLY, f'{url.path}/{query}')
+            return
+        resolved = self.resolve(url_path)
+        if resolved is None:
+            resolved = self.apply_redirects(url_path)
+            if resolved is None:
+                return
+        fs_path, status = resolved
+        self.send_file(fs_path, status, head)
+
+    def fs_path(self, url_path):
+        """The filesystem path of a URL path, or None if it is outside the export."""
+        root = self.server.root
+        fs_path = os.path.realpath(os.path.join(root, url_path.lstrip('/')))
+        return fs_path if fs_path == root or fs_path.startswith(root + os.sep) else None
+
+    def resolve(self, url_path):
+        """Map a URL path to a file in the export, or None."""
+        fs_path = self.fs_path(url_path)
+        if fs_path is None:
+            return None
+        if os.path.isdir(fs_path):
+            fs_path = os.path.join(fs_path, 'index.html')
+        elif not os.path.exists(fs_path) and os.path.isfile(fs_path + '.html'):
+            fs_path += '.html'
+        return (fs_path, HTTPStatus.OK) if os.path.isfile(fs_path) else None
+
+    def apply_redirects(self, url_path):
+        for pattern, target, status in self.server.redirects:
+            match = pattern.match(url_path)
+            if not match:
+                continue
+            if 'splat' in pattern.groupindex:
+                target = target.replace(':splat', match.group('splat'))
+            if status == 200:
+                # A rewrite: serve the target's content under the original URL
+                resolved = self.resolve(target)
+                if resolved:
+                    return resolved
+                continue
+            self.send_redirect(status, target)
+            return None
+        self.send_error(HTTPStatus.NOT_FOUND)
+        return None
+
+    def send_redirect(self, status, location):
+        self.send_response(status)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.send_header('Cache-Control', 'public, max-age=3600')
+        self.end_headers()
+
+    def pick_encoding(self, fs_path):
+        accepted = {
+            part.split(';', 1)[0].strip()
+            for part in self.headers.get('Accept-Encoding', '').split(',')
+        }
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted and os.path.isfile(fs_path + suffix):
+                return encoding, fs_path + suffix
+        return None, fs_path
+
+    def send_file(self, fs_path, status, head):
+        ranged = 'Range' in self.headers and status == HTTPStatus.OK
+        encoding, body_path = (None, fs_path) if ranged else self.pick_encoding(fs_path)
+        try:
+            entry = self.server.cache.get(body_path, os.stat(body_path))
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        etag = entry.etag if encoding is None else f'{entry.etag[:-1]}-{encoding}"'
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control(fs_path))
+            self.end_headers()
+            return
+
+        data = entry.data
+        body = memoryview(data)
+        if ranged:
+            byte_range = self.parse_range(len(data))
+            if byte_range is False:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                body = body[start:end + 1]
+                status = HTTPStatus.PARTIAL_CONTENT
+
+        content_type = mimetypes.guess_type(fs_path)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type.endswith(('javascript', 'json')):
+            content_type += '; charset=utf-8'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', email.utils.formatdate(entry.mtime, usegmt=True))
+        self.send_header('Cache-Control', cache_control(fs_path))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def parse_range(self, size):
+        """Return (start, end) for a satisfiable single range, None to ignore it, False if unsatisfiable."""
+        match = _RANGE.match(self.headers['Range'].strip())
+        if not match or match.groups() == ('', ''):
+            return None
+        start, end = match.groups()
+        if start == '':
+            length = int(end)
+            if length == 0:
+                return False
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+        if start >= size or start > end:
+            return False
+        return start, end
+
+
+class PreviewServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, root, cache_bytes=32 * 1024 * 1024, verbose=True):
+        super().__init__(address, PreviewRequestHandler)
+        self.root = os.path.realpath(root)
+        self.cache = FileCache(max_bytes=cache_bytes)
+        self.redirects = parse_redirects(os.path.join(self.root, '_redirects'))
+        self.verbose = verbose
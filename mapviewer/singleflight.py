@@ -0,0 +1,97 @@
+"""
+Request coalescing: one computation per key at a time.
+
+When many requests miss the same cache key at once (a traffic spike, or
+right after a config reload empties the response cache), ``SingleFlight.do``
+lets the first one compute the value while the others wait for it and
+share its result or exception. A caller that has an older copy to hand can
+pass ``stale`` to get that instead of waiting.
+
+Each instance counts what it saw (``stats()``): computations run, callers
+that waited for one and the total time they waited, stale copies served
+and computations that failed.
+"""
+import threading
+import time
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key."""
+
+    def __init__(self):
+        self.computed = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.stale_served = 0
+        self.errors = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key, compute, stale=None):
+        """
+        Return ``compute()``, or the result of the call for ``key`` already running.
+
+        ``stale`` is an optional callable returning an older value (or None);
+        while another caller is computing ``key`` its value is returned
+        straight away instead of waiting.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.computed += 1
+            elif stale is None:
+                self.waits += 1
+        if leader:
+            try:
+                call.result = compute()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                with self._lock:
+                    self.errors += 1
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if stale is not None:
+            value = stale()
+            with self._lock:
+                if value is not None:
+                    self.stale_served += 1
+                    return value
+                self.waits += 1
+        started = time.perf_counter()
+        call.done.wait()
+        with self._lock:
+            self.wait_seconds += time.perf_counter() - started
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'computed': self.computed,
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 6),
+                'stale_served': self.stale_served,
+                'errors': self.errors,
+                'in_flight': len(self._calls),
+            }
@@ -0,0 +1,246 @@
+"""
+The catalogue held in the database instead of ``map_config.json``.
+
+``import_config`` loads a themed config into the models in one transaction
+and ``export_config`` rebuilds the same JSON from them; fields appear in the
+order ``map_config.json`` uses and anything the models don't know about
+survives in ``extra``. ``load_page`` is the read path ``map_view`` uses when
+``MAP_CATALOGUE_BACKEND = 'db'``: it fetches only the themes, subthemes and
+indicators one page shows rather than the whole catalogue.
+"""
+import logging
+
+from django.db import transaction
+
+from .compact import INDICATOR_FIELDS
+from .models import Indicator, Subtheme, SubthemeIndicator, Theme, ThemeGroup, ThemeGroupTheme
+
+logger = logging.getLogger(__name__)
+
+GROUP_FIELDS = ('name', 'icon')
+THEME_FIELDS = ('name', 'description', 'icon')
+SUBTHEME_FIELDS = ('name', 'description', 'icon')
+
+BATCH_SIZE = 500
+
+
+def _split(data, fields, skip=()):
+    """Split a config object into model field values and leftover ``extra`` data."""
+    values, extra = {}, {}
+    for key, value in data.items():
+        if key in skip:
+            continue
+        if key in fields and (value is None or isinstance(value, str)):
+            values[key] = value
+        else:
+            extra[key] = value
+    values['extra'] = extra
+    return values
+
+
+def _join(obj, fields, first=()):
+    data = dict(first)
+    for field in fields:
+        value = getattr(obj, field)
+        if value is not None:
+            data[field] = value
+    data.update(obj.extra)
+    return data
+
+
+@transaction.atomic
+def import_config(config):
+    """
+    Replace the stored catalogue with a themed config.
+
+    References to themes or indicators that don't exist are skipped (the
+    validator reports them); returns a dict of row counts.
+    """
+    if 'themes' not in config:
+        raise ValueError('only the themed config format can be imported')
+    SubthemeIndicator.objects.all().delete()
+    ThemeGroupTheme.objects.all().delete()
+    Subtheme.objects.all().delete()
+    Theme.objects.all().delete()
+    ThemeGroup.objects.all().delete()
+    Indicator.objects.all().delete()
+
+    indicators = Indicator.objects.bulk_create([
+        Indicator(key=key, position=position, **_split(data, INDICATOR_FIELDS))
+        for position, (key, data) in enumerate(config.get('indicators', {}).items())
+    ], batch_size=BATCH_SIZE)
+    indicator_pks = {indicator.key: indicator.pk for indicator in indicators}
+
+    seen_themes = set()
+    themes = Theme.objects.bulk_create([
+        Theme(key=theme['id'], position=position, **_split(theme, THEME_FIELDS, skip=('id', 'subthemes')))
+        for position, theme in enumerate(config['themes'])
+        if not (theme['id'] in seen_themes or seen_themes.add(theme['id']))
+    ], batch_size=BATCH_SIZE)
+    theme_pks = {theme.key: theme.pk for theme in themes}
+
+    subthemes, subtheme_indicators, seen_subthemes = [], [], set()
+    for theme in config['themes']:
+        for position, subtheme in enumerate(theme.get('subthemes', [])):
+            if subtheme['id'] in seen_subthemes:
+                continue
+            seen_subthemes.add(subtheme['id'])
+            subthemes.append(Subtheme(
+                key=subtheme['id'], theme_id=theme_pks[theme['id']], position=position,
+                **_split(subtheme, SUBTHEME_FIELDS, skip=('id', 'indicators'))
+            ))
+            subtheme_indicators.append(subtheme.get('indicators', []))
+    subthemes = Subtheme.objects.bulk_create(subthemes, batch_size=BATCH_SIZE)
+    SubthemeIndicator.objects.bulk_create([
+        SubthemeIndicator(subtheme_id=subtheme.pk, indicator_id=indicator_pks[key], position=position)
+        for subtheme, keys in zip(subthemes, subtheme_indicators)
+        for position, key in enumerate(keys)
+        if key in indicator_pks
+    ], batch_size=BATCH_SIZE)
+
+    groups = config.get('themeGroups', [])
+    group_rows = ThemeGroup.objects.bulk_create([
+        ThemeGroup(key=group['id'], position=position, **_split(group, GROUP_FIELDS, skip=('id', 'themeIds')))
+        for position, group in enumerate(groups)
+    ], batch_size=BATCH_SIZE)
+    memberships = []
+    for row, group in zip(group_rows, groups):
+        seen = set()
+        for position, key in enumerate(group.get('themeIds', [])):
+            if key in theme_pks and key not in seen:
+                seen.add(key)
+                memberships.append(ThemeGroupTheme(group_id=row.pk, theme_id=theme_pks[key], position=position))
+    ThemeGroupTheme.objects.bulk_create(memberships, batch_size=BATCH_SIZE)
+
+    return {
+        'themeGroups': len(group_rows),
+        'themes': len(themes),
+        'subthemes': len(subthemes),
+        'indicators': len(indicators),
+    }
+
+
+def export_config():
+    """Rebuild the config dict from the database."""
+    indicator_keys = dict(Indicator.objects.values_list('pk', 'key'))
+    subtheme_indicators = {}
+    for subtheme_id, indicator_id in SubthemeIndicator.objects.values_list('subtheme_id', 'indicator_id'):
+        subtheme_indicators.setdefault(subtheme_id, []).append(indicator_keys[indicator_id])
+    subthemes_by_theme = {}
+    for subtheme in Subtheme.objects.all():
+        data = _join(subtheme, SUBTHEME_FIELDS, first={'id': subtheme.key})
+        data['indicators'] = subtheme_indicators.get(subtheme.pk, [])
+        subthemes_by_theme.setdefault(subtheme.theme_id, []).append(data)
+
+    theme_keys = {}
+    themes = []
+    for theme in Theme.objects.all():
+        theme_keys[theme.pk] = theme.key
+        data = _join(theme, THEME_FIELDS, first={'id': theme.key})
+        data['subthemes'] = subthemes_by_theme.get(theme.pk, [])
+        themes.append(data)
+
+    group_themes = {}
+    for group_id, theme_id in ThemeGroupTheme.objects.values_list('group_id', 'theme_id'):
+        group_themes.setdefault(group_id, []).append(theme_keys[theme_id])
+    groups = []
+    for group in ThemeGroup.objects.all():
+        data = _join(group, GROUP_FIELDS, first={'id': group.key})
+        data['themeIds'] = group_themes.get(group.pk, [])
+        groups.append(data)
+
+    return {
+        'themeGroups': groups,
+        'themes': themes,
+        'indicators': {indicator.key: _join(indicator, INDICATOR_FIELDS) for indicator in Indicator.objects.all()},
+    }
+
+
+def is_populated():
+    return Theme.objects.exists()
+
+
+def _row(values, fields, prefix='', first=()):
+    data = dict(first)
+    for field in fields:
+        value = values[prefix + field]
+        if value is not None:
+            data[field] = value
+    data.update(values[prefix + 'extra'])
+    return data
+
+
+def load_page(page_name='default', theme_group_id=None):
+    """
+    Fetch what ``map_view`` needs for one page.
+
+    Returns a dict with ``page_id`` (the indicator shown), ``page_config``,
+    ``themes`` (prepared like ``Catalogue.themes_for_group``), ``indicators``
+    (just the ones on the page), ``current_theme`` and the effective
+    ``theme_group``, or None if the indicator doesn't exist.
+    """
+    indicator_columns = ('pk', 'key', 'extra') + INDICATOR_FIELDS
+    pages = Indicator.objects.values(*indicator_columns)
+    page_row = pages.first() if page_name == 'default' else pages.filter(key=page_name).first()
+    if page_row is None:
+        return None
+
+    themes = Theme.objects.all()
+    if theme_group_id:
+        if ThemeGroup.objects.filter(key=theme_group_id).exists():
+            themes = themes.filter(groups__key=theme_group_id)
+        else:
+            logger.warning("Theme group '%s' not found in database", theme_group_id)
+            theme_group_id = None
+
+    prepared = []
+    subthemes_by_pk = {}
+    themes_by_pk = {}
+    for row in themes.values('pk', 'key', 'extra', *THEME_FIELDS):
+        theme_data = _row(row, THEME_FIELDS, first={'id': row['key']})
+        theme_data['subthemes'] = []
+        themes_by_pk[row['pk']] = theme_data
+        prepared.append(theme_data)
+    for row in Subtheme.objects.filter(theme__in=themes).values('pk', 'theme_id', 'key', 'extra', *SUBTHEME_FIELDS):
+        subtheme_data = _row(row, SUBTHEME_FIELDS, first={'id': row['key']})
+        subtheme_data['indicators'] = []
+        subtheme_data['indicator_items'] = []
+        subthemes_by_pk[row['pk']] = subtheme_data
+        themes_by_pk[row['theme_id']]['subthemes'].append(subtheme_data)
+
+    # One query for every indicator on the page, in subtheme order
+    indicators = {}
+    memberships = SubthemeIndicator.objects.filter(subtheme__theme__in=themes).values(
+        'subtheme_id', *('indicator__' + column for column in indicator_columns[1:]))
+    for row in memberships:
+        key = row['indicator__key']
+        data = indicators.get(key)
+        if data is None:
+            data = indicators[key] = _row(row, INDICATOR_FIELDS, prefix='indicator__')
+        subtheme_data = subthemes_by_pk[row['subtheme_id']]
+        subtheme_data['indicators'].append(key)
+        subtheme_data['indicator_items'].append(dict(data, id=key))
+
+    page_config = indicators.get(page_row['key']) or _row(page_row, INDICATOR_FIELDS)
+    indicators.setdefault(page_row['key'], page_config)
+
+    # The indicator's home theme is the first one listing it, shown or not
+    # (like the JSON path, the default page has no current theme)
+    current_theme = None
+    if page_name != 'default':
+        home = (
+            SubthemeIndicator.objects.filter(indicator_id=page_row['pk'])
+            .order_by('subtheme__theme__position', 'subtheme__position', 'position')
+            .values_list('subtheme__theme__key', flat=True)
+            .first()
+        )
+        current_theme = next((theme for theme in prepared if theme['id'] == home), None)
+
+    return {
+        'page_id': page_row['key'],
+        'page_config': page_config,
+        'themes': prepared,
+        'indicators': indicators,
+        'current_theme': current_theme,
+        'theme_group': theme_group_id,
+    }
@@ -0,0 +1,270 @@
+"""
+Client performance telemetry: latency histograms collected from beacons.
+
+``map.html`` times what visitors wait for and sends the timings in batches
+with ``navigator.sendBeacon`` to ``telemetry_beacon``:
+
+- ``embed``: a map iframe (``map1``/``map2``) from setting its URL to its
+  load event;
+- ``switch``: picking an indicator until its map has loaded;
+- ``posts``: the WordPress tag and post lookups of ``fetchWordPressPosts``.
+
+Each timing goes into two histograms, one for its indicator and one for the
+host it waited on. The histograms live in memory per process (``collector``)
+and a background thread flushes them every ``MAP_TELEMETRY_FLUSH_INTERVAL``
+seconds as ``LatencyHistogram`` rows in one bulk insert. So a busy page
+costs a dictionary update per timing, not a database write. Each flush
+also deletes rows older than ``MAP_TELEMETRY_RETENTION_DAYS``.
+``manage.py perf_report`` merges the rows and ranks the slowest indicators
+and hosts.
+
+The beacon endpoint is public, so only timings for the catalogue's own
+indicators and for hosts its pages actually wait on are kept.
+"""
+import atexit
+import logging
+import math
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('embed', 'switch', 'posts')
+DIMENSIONS = ('indicator', 'host')
+
+# Upper bounds of the histogram buckets in milliseconds; slower samples go
+# into one more bucket
+BUCKETS_MS = (100, 200, 400, 800, 1600, 3200, 6400, 12800, 25600, 51200)
+
+# Timings beyond this are clocks gone wrong (a laptop lid closed mid-load)
+MAX_MS = 10 * 60 * 1000
+
+# Distinct histograms a process keeps between flushes; later keys are dropped
+MAX_KEYS = 5000
+
+BATCH_SIZE = 500
+
+# The WordPress site map.html looks up an indicator's posts on
+POSTS_ORIGIN = 'https://newdev.naturesquamish.ca'
+
+
+class Histogram:
+    """Sample counts per bucket, with their count, sum and maximum."""
+
+    __slots__ = ('buckets', 'count', 'total_ms', 'max_ms')
+
+    def __init__(self, buckets=None, count=0, total_ms=0.0, max_ms=0.0):
+        self.buckets = list(buckets) if buckets else [0] * (len(BUCKETS_MS) + 1)
+        self.count = count
+        self.total_ms = total_ms
+        self.max_ms = max_ms
+
+    def add(self, ms):
+        index = next((i for i, bound in enumerate(BUCKETS_MS) if ms <= bound), len(BUCKETS_MS))
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def merge(self, other):
+        for index, count in enumerate(other.buckets):
+            self.buckets[index] += count
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """
+        Estimate a percentile (0-1) in milliseconds.
+
+        Returns the upper bound of the bucket that reaches it, or the maximum
+        seen if that is lower.
+        """
+        if not self.count:
+            return 0.0
+        needed = math.ceil(fraction * self.count)
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= needed:
+                bound = BUCKETS_MS[index] if index < len(BUCKETS_MS) else self.max_ms
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+
+class Collector:
+    """Histograms of one process, keyed by (catalogue, metric, dimension, key)."""
+
+    def __init__(self):
+        self.dropped = 0
+        self._histograms = {}
+        self._since = timezone.now()
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def record(self, catalogue, metric, dimension, key, ms):
+        """Add one timing; returns False if it was dropped for lack of room."""
+        self._start_flusher()
+        hist_key = (catalogue, metric, dimension, key)
+        with self._lock:
+            histogram = self._histograms.get(hist_key)
+            if histogram is None:
+                if len(self._histograms) >= MAX_KEYS:
+                    self.dropped += 1
+                    return False
+                histogram = self._histograms[hist_key] = Histogram()
+            histogram.add(ms)
+        return True
+
+    def pending(self):
+        with self._lock:
+            return len(self._histograms)
+
+    def flush(self):
+        """Write the histograms collected so far to the database; returns the rows written."""
+        from .models import LatencyHistogram
+
+        with self._lock:
+            histograms, self._histograms = self._histograms, {}
+            period, self._since = self._since, timezone.now()
+        if not histograms:
+            return 0
+        rows = [
+            LatencyHistogram(period=period, catalogue=catalogue, metric=metric, dimension=dimension, key=key,
+                             count=histogram.count, total_ms=histogram.total_ms, max_ms=histogram.max_ms,
+                             buckets=histogram.buckets)
+            for (catalogue, metric, dimension, key), histogram in histograms.items()
+        ]
+        try:
+            LatencyHistogram.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        except Exception:
+            # Keep the samples for the next flush
+            with self._lock:
+                for hist_key, histogram in histograms.items():
+                    current = self._histograms.setdefault(hist_key, Histogram())
+                    current.merge(histogram)
+                self._since = min(self._since, period)
+            raise
+        prune_histograms()
+        return len(rows)
+
+    def _start_flusher(self):
+        # Started by the first timing, so in the worker process after a fork
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            interval = getattr(settings, 'MAP_TELEMETRY_FLUSH_INTERVAL', 60)
+            self._flusher = Flusher(self, interval)
+            if interval > 0:
+                self._flusher.start()
+            atexit.register(self._flusher.final_flush)
+
+
+class Flusher(threading.Thread):
+    """Background thread that flushes a Collector every ``interval`` seconds."""
+
+    def __init__(self, collector, interval):
+        super().__init__(name='map-telemetry-flusher', daemon=True)
+        self.collector = collector
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self._flush()
+
+    def final_flush(self):
+        self.stop()
+        self._flush()
+
+    def _flush(self):
+        try:
+            written = self.collector.flush()
+        except Exception:
+            logger.exception('Could not flush the telemetry histograms')
+            return
+        if written:
+            logger.info('Flushed %d telemetry histograms', written)
+
+
+collector = Collector()
+
+
+def prune_histograms(now=None):
+    """Delete rows older than ``MAP_TELEMETRY_RETENTION_DAYS``; returns how many."""
+    from .models import LatencyHistogram
+
+    days = getattr(settings, 'MAP_TELEMETRY_RETENTION_DAYS', 90)
+    if not days:
+        return 0
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return LatencyHistogram.objects.filter(period__lt=cutoff).delete()[0]
+
+
+def known_hosts(catalogue):
+    """The origins a catalogue's pages load from: its map embeds and the WordPress posts."""
+    hosts = catalogue.cache.get('telemetry_hosts')
+    if hosts is None:
+        hosts = catalogue.cache['telemetry_hosts'] = frozenset(catalogue.embed_hosts) | {POSTS_ORIGIN}
+    return hosts
+
+
+def parse_beacon(payload, catalogue):
+    """
+    Yield ``(metric, dimension, key, ms)`` for the valid timings of a beacon.
+
+    ``payload`` is ``{"events": [{"metric", "indicator", "host", "ms"}, ...]}``.
+    Indicators the catalogue doesn't know, hosts its pages don't load from
+    and anything else malformed are skipped.
+    """
+    events = payload.get('events') if isinstance(payload, dict) else None
+    if not isinstance(events, list):
+        return
+    hosts = known_hosts(catalogue)
+    limit = getattr(settings, 'MAP_TELEMETRY_MAX_EVENTS', 100)
+    for event in events[:limit]:
+        if not isinstance(event, dict) or event.get('metric') not in METRICS:
+            continue
+        ms = event.get('ms')
+        if isinstance(ms, bool) or not isinstance(ms, (int, float)) or not 0 <= ms <= MAX_MS:
+            continue
+        indicator = event.get('indicator')
+        if isinstance(indicator, str) and indicator in catalogue.indicators:
+            yield event['metric'], 'indicator', indicator, float(ms)
+        host = event.get('host')
+        if isinstance(host, str) and host in hosts:
+            yield event['metric'], 'host', host, float(ms)
+
+
+def load_histograms(since=None, catalogue=None, metric=None):
+    """
+    Merge the stored rows into ``{(metric, dimension, key): Histogram}``.
+
+    ``since`` limits it to rows flushed after a datetime.
+    """
+    from .models import LatencyHistogram
+
+    rows = LatencyHistogram.objects.all()
+    if since is not None:
+        rows = rows.filter(period__gte=since)
+    if catalogue is not None:
+        rows = rows.filter(catalogue=catalogue)
+    if metric is not None:
+        rows = rows.filter(metric=metric)
+    merged = {}
+    for row in rows.values_list('metric', 'dimension', 'key', 'buckets', 'count', 'total_ms', 'max_ms').iterator():
+        metric_name, dimension, key, buckets, count, total_ms, max_ms = row
+        merged.setdefault((metric_name, dimension, key), Histogram()).merge(Histogram(buckets, count, total_ms, max_ms))
+    return merged
@@ -0,0 +1,35 @@
+import json
+import os
+
+from django import template
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+
+from mapviewer.icons import MANIFEST_NAME, SUBSET_DIR
+
+register = template.Library()
+
+_manifest_cache = {}
+
+
+def _load_manifest():
+    """Read the icon subset manifest, re-reading it only when it changes."""
+    path = finders.find(f'{SUBSET_DIR}/{MANIFEST_NAME}')
+    if not path:
+        return {}
+    mtime = os.stat(path).st_mtime_ns
+    cached = _manifest_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    _manifest_cache[path] = (mtime, manifest)
+    return manifest
+
+
+@register.simple_tag
+def icon_stylesheet(theme_group=None):
+    """URL of the icon CSS for a page: its glyph subset if built, else the full font."""
+    manifest = _load_manifest()
+    css = manifest.get(theme_group or 'all') or manifest.get('all')
+    return static(f'{SUBSET_DIR}/{css}' if css else 'fonts/custom-icons.css')
@@ -0,0 +1,39 @@
+import json
+import os
+
+from django import template
+from django.contrib.staticfiles import finders
+
+from mapviewer.catalogue import DEFAULT_CATALOGUE
+from mapviewer.thumbnails import MANIFEST_NAME
+
+register = template.Library()
+
+_manifest_cache = {}
+
+
+def _load_manifest():
+    """Read the thumbnail manifest, re-reading it only when it changes."""
+    path = finders.find(f'thumbs/{MANIFEST_NAME}')
+    if not path:
+        return {}
+    mtime = os.stat(path).st_mtime_ns
+    cached = _manifest_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    images = manifest.get('images', {})
+    # Resolve each catalogue's indicators to their image entries once
+    thumbnails = {
+        name: {indicator_id: images[key] for indicator_id, key in indicators.items() if key in images}
+        for name, indicators in manifest.get('catalogues', {}).items()
+    }
+    _manifest_cache[path] = (mtime, thumbnails)
+    return thumbnails
+
+
+@register.simple_tag
+def thumbnail_manifest(catalogue=None):
+    """``{indicator id: image entry}`` for a catalogue, empty if no thumbnails are built."""
+    return _load_manifest().get(catalogue or DEFAULT_CATALOGUE, {})
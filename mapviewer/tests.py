@@ -1,3 +1,1380 @@
-from django.test import TestCase
+import copy
+import http.client
+import json
+import os
+import pstats
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+import deploy
+from mapviewer.aliases import AliasTable, config_ids, find_renames
+from mapviewer import build
+from mapviewer.cache_policy import fragment_keys, page_keys, purge_keys
+from mapviewer import catalogue as catalogues
+from mapviewer.catalogue import NO_EMBED_HINTS, Catalogue
+from mapviewer.chunks import ChunkSet
+from mapviewer.compact import IndicatorRecord, compact_config
+from mapviewer.diff import EDITED, MOVED, Change, diff_configs, impact
+from mapviewer.encoded import EncodedBody, encoded_response
+from mapviewer.export_manifest import hash_file, precache_manifest
+from mapviewer.export_profile import ExportProfiler
+from mapviewer.htmlpost import HtmlPostProcessor, minify_script
+from mapviewer.icons import MANIFEST_NAME, build_subsets, missing_icons, parse_icon_css, stale_subsets
+from mapviewer.id_registry import IdRegistry
+from mapviewer.loadtest import build_traffic_mix, catalogue_from_config, parse_url_catalogue, run_load, summarize
+from mapviewer.management.commands.export_to_gh_pages import Command as ExportCommand
+from mapviewer.models import LatencyHistogram
+from mapviewer.preview_server import PreviewServer
+from mapviewer import store
+from mapviewer.telemetry import POSTS_ORIGIN, collector, load_histograms, prune_histograms
+from mapviewer.thumbnails import MANIFEST_NAME as THUMBNAIL_MANIFEST, build_thumbnails
+from mapviewer.validation import errors, parse_config, validate_config
+from mapviewer.views import (
+    FRAGMENT_PLACEHOLDER, alias_redirect, cached_response, catalogue_page, fragment_url, render_flights,
+    response_cache,
+)
+
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'Test', 'GIT_AUTHOR_EMAIL': 'test@example.com',
+    'GIT_COMMITTER_NAME': 'Test', 'GIT_COMMITTER_EMAIL': 'test@example.com',
+    'GIT_CONFIG_NOSYSTEM': '1',
+}
+
+
+def run_git(*args, cwd):
+    return subprocess.run(['git', *args], cwd=cwd, check=True, text=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.strip()
+
+
+class IncrementalDeployTests(SimpleTestCase):
+    """deploy.deploy_incremental against a local bare repository."""
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, GIT_ENV)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.remote = os.path.join(tmp.name, 'remote.git')
+        self.repo = os.path.join(tmp.name, 'src')
+        self.docs = os.path.join(self.repo, 'docs')
+        self.worktree = os.path.join(tmp.name, 'deploy')
+        run_git('init', '-q', '--bare', self.remote, cwd=tmp.name)
+        run_git('init', '-q', self.repo, cwd=tmp.name)
+        run_git('commit', '-q', '--allow-empty', '-m', 'source', cwd=self.repo)
+        run_git('remote', 'add', 'origin', self.remote, cwd=self.repo)
+        for path, text in [('index.html', 'home'), ('static/app.css', 'css'), ('group/index.html', 'group')]:
+            self.write(path, text)
+
+    def write(self, path, text):
+        path = os.path.join(self.docs, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def deploy(self):
+        with mock.patch('builtins.print'):
+            return deploy.deploy_incremental(source=self.docs, worktree=self.worktree, repo=self.repo)
+
+    def last_commit_paths(self):
+        output = run_git('show', '--name-status', '--format=', 'gh-pages', cwd=self.remote)
+        return sorted(tuple(line.split('\t')) for line in output.splitlines())
+
+    def test_first_deploy_publishes_everything(self):
+        self.assertEqual(self.deploy(), (['group/index.html', 'index.html', 'static/app.css'], []))
+        files = run_git('ls-tree', '-r', '--name-only', 'gh-pages', cwd=self.remote).splitlines()
+        self.assertEqual(sorted(files), ['.build-manifest.json', 'group/index.html', 'index.html', 'static/app.css'])
+        # The source branch is left alone
+        self.assertEqual(run_git('log', '--format=%s', cwd=self.repo), 'source')
+
+    def test_redeploy_stages_only_the_change(self):
+        self.deploy()
+        self.write('index.html', 'home v2')
+        self.write('new.html', 'new')
+        os.remove(os.path.join(self.docs, 'group', 'index.html'))
+        self.assertEqual(self.deploy(), (['index.html', 'new.html'], ['group/index.html']))
+        self.assertEqual(self.last_commit_paths(), [
+            ('A', 'new.html'), ('D', 'group/index.html'), ('M', '.build-manifest.json'), ('M', 'index.html'),
+        ])
+
+    def test_unchanged_export_makes_no_commit(self):
+        self.deploy()
+        head = run_git('rev-parse', 'gh-pages', cwd=self.remote)
+        self.assertIsNone(self.deploy())
+        self.assertEqual(run_git('rev-parse', 'gh-pages', cwd=self.remote), head)
+
+    def deploy_with_failing_commit(self):
+        hook = os.path.join(self.repo, '.git', 'hooks', 'pre-commit')
+        with open(hook, 'w') as f:
+            f.write('#!/bin/sh\nexit 1\n')
+        os.chmod(hook, 0o755)
+        try:
+            with self.assertRaises(subprocess.CalledProcessError):
+                self.deploy()
+        finally:
+            os.remove(hook)
+
+    def test_failed_commit_is_retried(self):
+        self.deploy_with_failing_commit()
+        self.assertEqual(self.deploy(), (['group/index.html', 'index.html', 'static/app.css'], []))
+
+        # Again after a deploy, with no remote branch to reset the worktree to
+        run_git('update-ref', '-d', 'refs/heads/gh-pages', cwd=self.remote)
+        self.write('index.html', 'home v2')
+        self.deploy_with_failing_commit()
+        self.assertEqual(self.deploy(), (['index.html'], []))
+        self.assertEqual(self.last_commit_paths(), [('M', '.build-manifest.json'), ('M', 'index.html')])
+
+    def test_fresh_worktree_picks_up_the_remote_branch(self):
+        self.deploy()
+        run_git('worktree', 'remove', '--force', self.worktree, cwd=self.repo)
+        self.write('static/app.css', 'css v2')
+        self.assertEqual(self.deploy(), (['static/app.css'], []))
+
+
+CONFIG = {
+    'themeGroups': [{'id': 'g1', 'name': 'G1', 'themeIds': ['t1']}, {'id': 'g2', 'name': 'G2', 'themeIds': ['t2']}],
+    'themes': [
+        {'id': 't1', 'name': 'T1', 'subthemes': [{'id': 's1', 'name': 'S1', 'indicators': ['a', 'b']}]},
+        {'id': 't2', 'name': 'T2', 'subthemes': [{'id': 's2', 'name': 'S2', 'indicators': ['c']}]},
+    ],
+    'indicators': {
+        'a': {'title': 'A', 'map1_url': 'https://maps.example.com/a'},
+        'b': {'title': 'B', 'map1_url': 'https://maps.example.com/b'},
+        'c': {'title': 'C', 'map1_url': 'https://maps.example.com/c'},
+    },
+}
+
+
+class CachePolicyTests(SimpleTestCase):
+    """Purge lists from config changes cover exactly the responses that changed."""
+
+    def test_edited_indicator_purges_what_shows_it(self):
+        new = copy.deepcopy(CONFIG)
+        new['indicators']['b']['title'] = 'B2'
+        keys = set(purge_keys(CONFIG, new))
+        fragment = Catalogue(new).fragment('b')
+        for tagged in (page_keys(None, 'a'), page_keys('g1', 'a'), page_keys('g2', 'b'), fragment_keys(fragment)):
+            self.assertTrue(keys & set(tagged), tagged)
+        # Pages of the other theme group showing another indicator are kept
+        self.assertFalse(keys & set(page_keys('g2', 'c')))
+
+    def test_regional_keys_are_prefixed(self):
+        new = copy.deepcopy(CONFIG)
+        new['themes'][1]['name'] = 'T2b'
+        self.assertEqual(purge_keys(CONFIG, new, 'north'),
+                         ['north/all-themes', 'north/catalogue', 'north/group:g2', 'north/theme:t2'])
+
+
+class ChunkTests(SimpleTestCase):
+    """Each page loads the menu data of its theme group once, and nothing else."""
+
+    def test_chunks_follow_theme_group_reach(self):
+        config = copy.deepcopy(CONFIG)
+        config['themeGroups'][1]['themeIds'].append('t1')
+        chunks = ChunkSet(Catalogue(config))
+        self.assertEqual(len(chunks.bodies), 2)
+        shared, = chunks.for_scope('g1')
+        self.assertIn(shared, chunks.for_scope('g2'))
+        self.assertEqual(sorted(chunks.for_scope(None)), sorted(chunks.bodies))
+        self.assertIn(b'"a":{"title":"A"', chunks.bodies[shared])
+        self.assertNotIn(b'"c"', chunks.bodies[shared])
+
+
+class IdRegistryTests(SimpleTestCase):
+    """Framework IDs survive reordering and inserted rows."""
+
+    FRAMEWORK = {'themes': [{'id': '01-land', 'subthemes': [
+        {'id': '01-01-cover', 'indicators': ['01-01-01-forest', '01-01-02-wetland']},
+    ]}]}
+
+    def import_rows(self, registry, rows):
+        registry.expect(registry.indicator_key('land', subtheme, slug) for subtheme, slug in rows)
+        return [registry.indicator_id('land', subtheme, slug) for subtheme, slug in rows]
+
+    def test_existing_ids_are_kept(self):
+        registry = IdRegistry()
+        registry.seed(self.FRAMEWORK)
+        ids = self.import_rows(registry, [('cover', 'grassland'), ('cover', 'wetland'), ('cover', 'forest')])
+        self.assertEqual(ids, ['grassland', '01-01-02-wetland', '01-01-01-forest'])
+
+    def test_moved_indicator_keeps_its_id(self):
+        registry = IdRegistry()
+        registry.seed(self.FRAMEWORK)
+        ids = self.import_rows(registry, [('water', 'wetland'), ('cover', 'forest')])
+        self.assertEqual(ids, ['01-01-02-wetland', '01-01-01-forest'])
+
+
+class AliasTests(SimpleTestCase):
+    """Old IDs from before a renumbering resolve to the current ones."""
+
+    def renumbered(self, config, number):
+        new = copy.deepcopy(config)
+        rename = lambda item_id: f'{number:02d}-{item_id.split("-", 1)[-1]}'
+        for theme in new['themes']:
+            for subtheme in theme['subthemes']:
+                subtheme['indicators'] = [rename(item_id) for item_id in subtheme['indicators']]
+        new['indicators'] = {rename(item_id): record for item_id, record in new['indicators'].items()}
+        return new
+
+    def test_renames_chain_to_the_current_id(self):
+        v1, v2, v3 = (self.renumbered(CONFIG, number) for number in (1, 2, 3))
+        table = AliasTable()
+        table.update(find_renames(v1, v2), config_ids(v2))
+        table.update(find_renames(v2, v3), config_ids(v3))
+        self.assertEqual(table.tables['indicators'], {
+            '01-a': '03-a', '01-b': '03-b', '01-c': '03-c', '02-a': '03-a', '02-b': '03-b', '02-c': '03-c',
+        })
+
+        catalogue = Catalogue(v3)
+        catalogue.cache['aliases'] = table
+        request = RequestFactory().get('/', {'theme': 't1', 'indicator': '01-b'})
+        response = alias_redirect(request, catalogue, 'default')
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response['Location'], '/?theme=t1&indicator=03-b')
+        response = alias_redirect(RequestFactory().get('/02-a/'), catalogue, '02-a')
+        self.assertEqual(response['Location'], '/03-a/')
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertIsNone(alias_redirect(RequestFactory().get('/03-a/'), catalogue, '03-a'))
+
+
+@override_settings(MAP_RESPONSE_CACHE_BYTES=1024 * 1024, MAP_PREWARM_RESPONSES=False)
+class SingleFlightTests(SimpleTestCase):
+    """100 concurrent misses for one key do the work once."""
+
+    def stampede(self, call, count=100):
+        barrier = threading.Barrier(count)
+        results = [None] * count
+
+        def worker(index):
+            barrier.wait()
+            results[index] = call()
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_misses_render_once(self):
+        self.assert_renders_once()
+
+    @override_settings(MAP_RESPONSE_CACHE_BYTES=0)
+    def test_concurrent_requests_render_once_without_the_cache(self):
+        responses = self.assert_renders_once()
+        self.assertEqual(len({id(response) for response in responses}), 100)
+        self.assertEqual({response.content for response in responses}, {b'{"a": 1}'})
+        self.assertEqual({response['Content-Type'] for response in responses}, {'application/json'})
+
+    def assert_renders_once(self):
+        catalogue = Catalogue(CONFIG, version='v1')
+        builds = []
+        before = render_flights.stats()
+
+        def build():
+            builds.append(1)
+            # Hold the render until every other request is waiting on it
+            deadline = time.monotonic() + 5
+            while render_flights.stats()['waits'] - before['waits'] < 99 and time.monotonic() < deadline:
+                time.sleep(0.001)
+            return HttpResponse(b'{"a": 1}', content_type='application/json')
+
+        responses = self.stampede(lambda: cached_response(RequestFactory().get('/'), catalogue, ('json',), build))
+        self.assertEqual(len(builds), 1)
+        self.assertEqual({response.status_code for response in responses}, {200})
+        if response_cache(catalogue) is not None:
+            self.assertEqual(len({response['ETag'] for response in responses}), 1)
+        after = render_flights.stats()
+        self.assertEqual(after['computed'] - before['computed'], 1)
+        self.assertEqual(after['waits'] - before['waits'], 99)
+        return responses
+
+    def test_concurrent_first_requests_load_once(self):
+        loads = []
+
+        def slow_load(path, strict=False, name=None):
+            loads.append(path)
+            time.sleep(0.05)
+            return Catalogue(CONFIG, version='v1', path=path, name=name)
+
+        with override_settings(MAP_CATALOGUES={'north': '/nonexistent/north.json'}), \
+                mock.patch.object(catalogues, 'load_catalogue', slow_load):
+            try:
+                results = self.stampede(lambda: catalogues.get_catalogue('north'))
+            finally:
+                catalogues._catalogues.pop('north', None)
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(len({id(result) for result in results}), 1)
+
+
+@override_settings(MAP_TELEMETRY=True, MAP_TELEMETRY_FLUSH_INTERVAL=0, MAP_PREWARM_RESPONSES=False)
+class TelemetryTests(TestCase):
+    """Beacons are aggregated in memory and flushed as histograms."""
+
+    def test_beacons_are_flushed_as_histograms(self):
+        indicator = next(iter(catalogues.get_catalogue().indicators))
+        events = [{'metric': 'embed', 'indicator': indicator, 'host': 'https://felt.com', 'ms': ms}
+                  for ms in (150, 300, 5000)]
+        events += [{'metric': 'embed', 'indicator': 'no-such-indicator', 'host': 'not a host', 'ms': 10},
+                   {'metric': 'embed', 'host': 'https://junk.example.com', 'ms': 10},
+                   {'metric': 'posts', 'host': 'https://felt.com', 'ms': -1},
+                   {'metric': 'posts', 'host': POSTS_ORIGIN, 'ms': 700}]
+        response = self.client.post('/telemetry/', data=json.dumps({'events': events}), content_type='text/plain')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.post('/telemetry/', data='{', content_type='text/plain').status_code, 400)
+
+        self.assertEqual(collector.flush(), 3)
+        histograms = load_histograms()
+        self.assertEqual(set(histograms), {('embed', 'indicator', indicator), ('embed', 'host', 'https://felt.com'),
+                                           ('posts', 'host', POSTS_ORIGIN)})
+        histogram = histograms['embed', 'host', 'https://felt.com']
+        self.assertEqual((histogram.count, histogram.max_ms), (3, 5000))
+        self.assertEqual(histogram.percentile(0.5), 400)
+
+    def test_old_rows_are_pruned_on_flush(self):
+        old = LatencyHistogram.objects.create(period=timezone.now() - timedelta(days=91), catalogue='default',
+                                              metric='embed', dimension='host', key='https://felt.com', count=1)
+        collector.record('default', 'embed', 'host', 'https://felt.com', 100)
+        self.assertEqual(collector.flush(), 1)
+        self.assertFalse(LatencyHistogram.objects.filter(pk=old.pk).exists())
+        self.assertEqual(LatencyHistogram.objects.count(), 1)
+        with override_settings(MAP_TELEMETRY_RETENTION_DAYS=0):
+            old.save()
+            self.assertEqual(prune_histograms(), 0)
+
+    @override_settings(MAP_TELEMETRY=False)
+    def test_beacons_are_refused_when_turned_off(self):
+        self.assertEqual(self.client.post('/telemetry/', data='{"events": []}', content_type='text/plain').status_code,
+                         404)
+
+
+@override_settings(MAP_CONFIG_WATCH=False, MAP_PREWARM_RESPONSES=False, MAP_RECORD_ALIASES=False)
+class ConfigWatcherTests(SimpleTestCase):
+    """Edits to a config file are picked up; broken edits are not."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'north.json')
+        self.write(CONFIG)
+        settings = override_settings(MAP_CATALOGUES={'north': self.path})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(catalogues._catalogues.pop, 'north', None)
+
+    def write(self, config):
+        # Saved the way editors do: a temporary file renamed over the config
+        text = config if isinstance(config, str) else json.dumps(config)
+        with open(self.path + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(self.path + '.tmp', self.path)
+
+    def retitled(self, title):
+        config = copy.deepcopy(CONFIG)
+        config['indicators']['a']['title'] = title
+        return config
+
+    def test_rewritten_file_is_reloaded(self):
+        for polling in (False, True):
+            with self.subTest(polling=polling):
+                before = catalogues.get_catalogue('north')
+                watcher = catalogues.ConfigWatcher(self.path, interval=0.02,
+                                                   on_change=lambda: catalogues.reload_catalogue('north'))
+                if polling:
+                    watcher._open_inotify = mock.Mock(side_effect=OSError('no inotify'))
+                watcher.start()
+                self.addCleanup(watcher.stop)
+                time.sleep(0.1)
+                self.write(self.retitled(f'A polled={polling}'))
+                deadline = time.monotonic() + 5
+                while catalogues.get_catalogue('north') is before and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                watcher.stop()
+                self.assertEqual(catalogues.get_catalogue('north').indicators['a']['title'], f'A polled={polling}')
+
+    def test_broken_file_keeps_the_previous_snapshot(self):
+        before = catalogues.get_catalogue('north')
+        for broken in ('{"themes": [', {'themes': 'not a list'}):
+            self.write(broken)
+            with self.assertLogs('mapviewer.catalogue', 'ERROR'):
+                self.assertIsNone(catalogues.reload_catalogue('north'))
+            self.assertIs(catalogues.get_catalogue('north'), before)
+        os.remove(self.path)
+        with self.assertLogs('mapviewer.catalogue', 'WARNING'):
+            self.assertIsNone(catalogues.reload_catalogue('north'))
+        self.assertIs(catalogues.get_catalogue('north'), before)
+
+    def test_unindexable_config_falls_back(self):
+        malformed = copy.deepcopy(CONFIG)
+        malformed['themes'][0]['subthemes'].append('oops')
+        before = catalogues.get_catalogue('north')
+        self.write(malformed)
+        with self.assertLogs('mapviewer.catalogue', 'ERROR'):
+            self.assertIsNone(catalogues.reload_catalogue('north'))
+        self.assertIs(catalogues.get_catalogue('north'), before)
+
+        # A first load moves on to the backup, then to an empty catalogue
+        catalogues._catalogues.pop('north')
+        backup = catalogues.backup_path(self.path)
+        with open(backup, 'w') as f:
+            json.dump(CONFIG, f)
+        with self.assertLogs('mapviewer.catalogue', 'ERROR') as logs:
+            self.assertEqual(catalogues.get_catalogue('north').version, before.version)
+        self.assertIn('cannot be indexed', logs.output[-1])
+        catalogues._catalogues.pop('north')
+        os.remove(backup)
+        with self.assertLogs('mapviewer.catalogue', 'ERROR'):
+            self.assertEqual(catalogues.get_catalogue('north').indicators, {})
+
+        # Once something usable is saved, the empty catalogue is replaced
+        self.write(self.retitled('A fixed'))
+        self.assertEqual(catalogues.reload_catalogue('north').indicators['a']['title'], 'A fixed')
+
+    def test_reloads_only_refuse_new_errors(self):
+        def with_errors(title, *bad_groups):
+            config = self.retitled(title)
+            for group_id in bad_groups:
+                config['themeGroups'].append({'id': group_id, 'themeIds': ['no-such-theme']})
+            return config
+
+        self.write(with_errors('A', 'g3'))
+        with self.assertLogs('mapviewer.catalogue', 'ERROR'):
+            self.assertEqual(len(catalogues.get_catalogue('north').problems), 1)
+        self.write(with_errors('A edited', 'g3'))
+        with self.assertLogs('mapviewer.catalogue', 'WARNING'):
+            self.assertEqual(catalogues.reload_catalogue('north').indicators['a']['title'], 'A edited')
+        self.write(with_errors('A edited again', 'g3', 'g4'))
+        with self.assertLogs('mapviewer.catalogue', 'ERROR'):
+            self.assertIsNone(catalogues.reload_catalogue('north'))
+        self.write(with_errors('A fixed'))
+        self.assertEqual(catalogues.reload_catalogue('north').problems, frozenset())
+        self.assertEqual(catalogues.get_catalogue('north').indicators['a']['title'], 'A fixed')
+
+
+class ValidationTests(SimpleTestCase):
+    """Every kind of config error is reported with its location, never raised."""
+
+    def problems(self, edit):
+        config = copy.deepcopy(CONFIG)
+        edit(config)
+        return [(issue.path, issue.message) for issue in errors(validate_config(config))]
+
+    def test_valid_config_has_no_errors(self):
+        self.assertEqual(self.problems(lambda config: None), [])
+
+    def test_each_error_is_reported(self):
+        def set_path(*path, value):
+            def edit(config):
+                target = config
+                for key in path[:-1]:
+                    target = target[key]
+                target[path[-1]] = value
+            return edit
+
+        def delete(*path):
+            def edit(config):
+                target = config
+                for key in path[:-1]:
+                    target = target[key]
+                del target[path[-1]]
+            return edit
+
+        cases = [
+            (set_path('themes', value={}), '$.themes', 'must be a list'),
+            (set_path('indicators', value=[]), '$.indicators', 'must be an object'),
+            (set_path('themeGroups', value={}), '$.themeGroups', 'must be a list'),
+            (set_path('themes', 0, value='t1'), '$.themes[0]', 'must be an object'),
+            (delete('themes', 0, 'id'), '$.themes[0]', 'missing "id"'),
+            (set_path('themes', 0, 'id', value=['t1']), '$.themes[0]', '"id" must be a string'),
+            (set_path('themes', 1, 'id', value='t1'), '$.themes[1]', "duplicate theme id 't1'"),
+            (set_path('themes', 0, 'subthemes', value={}), '$.themes[0].subthemes', 'must be a list'),
+            (set_path('themes', 0, 'subthemes', 0, value=None), '$.themes[0].subthemes[0]', 'must be an object'),
+            (delete('themes', 0, 'subthemes', 0, 'id'), '$.themes[0].subthemes[0]', 'missing "id"'),
+            (set_path('themes', 0, 'subthemes', 0, 'id', value={'id': 's1'}), '$.themes[0].subthemes[0]',
+             '"id" must be a string'),
+            (set_path('themes', 1, 'subthemes', 0, 'id', value='s1'), '$.themes[1].subthemes[0]',
+             "duplicate subtheme id 's1'"),
+            (set_path('themes', 0, 'subthemes', 0, 'indicators', value='a'), '$.themes[0].subthemes[0].indicators',
+             'must be a list'),
+            (set_path('themes', 0, 'subthemes', 0, 'indicators', 0, value='z'),
+             '$.themes[0].subthemes[0].indicators[0]', "unknown indicator 'z'"),
+            (set_path('themes', 0, 'subthemes', 0, 'indicators', 0, value=['a']),
+             '$.themes[0].subthemes[0].indicators[0]', 'must be an indicator id string'),
+            (set_path('themeGroups', 0, value=[]), '$.themeGroups[0]', 'must be an object'),
+            (delete('themeGroups', 0, 'id'), '$.themeGroups[0]', 'missing "id"'),
+            (set_path('themeGroups', 0, 'id', value={'g': 1}), '$.themeGroups[0]', '"id" must be a string'),
+            (set_path('themeGroups', 1, 'id', value='g1'), '$.themeGroups[1]', "duplicate theme group id 'g1'"),
+            (set_path('themeGroups', 0, 'themeIds', value='t1'), '$.themeGroups[0].themeIds', 'must be a list'),
+            (set_path('themeGroups', 0, 'themeIds', value=['t9']), '$.themeGroups[0].themeIds[0]',
+             "unknown theme 't9'"),
+            (set_path('themeGroups', 0, 'themeIds', value=[{'id': 't1'}]), '$.themeGroups[0].themeIds[0]',
+             'must be a theme id string'),
+            (set_path('indicators', 'a', value='A'), '$.indicators.a', 'must be an object'),
+            (set_path('indicators', 'a', 'map1_url', value=3), '$.indicators.a.map1_url', 'must be a string'),
+            (set_path('indicators', 'a', 'map1_url', value='<iframe src="https://x.example">'),
+             '$.indicators.a.map1_url', 'contains HTML (paste the iframe src, not the iframe)'),
+            (set_path('indicators', 'a', 'map1_url', value='https://x.example/a b'), '$.indicators.a.map1_url',
+             'contains whitespace'),
+            (set_path('indicators', 'a', 'map1_url', value='ftp://x.example/'), '$.indicators.a.map1_url',
+             "scheme must be http or https, not 'ftp'"),
+            (set_path('indicators', 'a', 'map1_url', value='https:///path'), '$.indicators.a.map1_url',
+             'has no host'),
+            (lambda config: config['indicators']['a'].update(map1_url='', map2_url='https://x.example/'),
+             '$.indicators.a.map1_url', 'empty but map2_url is set; map2 can never be shown'),
+        ]
+        for edit, path, message in cases:
+            with self.subTest(path=path, message=message):
+                self.assertIn((path, message), self.problems(edit))
+
+    def test_top_level_and_duplicate_keys(self):
+        self.assertEqual([issue.message for issue in validate_config([])], ['top level must be an object'])
+        config, duplicates = parse_config('{"themes": [], "indicators": {"a": {}, "a": {}}}')
+        self.assertIn("duplicate key 'a'", [issue.message for issue in errors(validate_config(config, duplicates))])
+
+
+class IconSubsetTests(SimpleTestCase):
+    """Each page's icon subset has a glyph for every icon the page shows."""
+
+    def setUp(self):
+        self.fonts_dir = Path(settings.STATICFILES_DIRS[0]) / 'fonts'
+        self.css_path = self.fonts_dir / 'custom-icons.css'
+        self.glyphs = parse_icon_css(self.css_path.read_text(encoding='utf-8'))
+        names = sorted(self.glyphs)
+        self.config = copy.deepcopy(CONFIG)
+        self.config['themes'][0]['icon'] = names[0]
+        self.config['themes'][1]['icon'] = None
+        self.config['themes'][0]['subthemes'][0]['icon'] = names[5]
+        self.config['themes'][1]['subthemes'][0]['icon'] = names[1]
+        for indicator_id, name in zip('abc', names[2:]):
+            self.config['indicators'][indicator_id]['icon'] = name
+        self.config['indicators']['c']['icon'] = None
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.out_dir = Path(tmp.name)
+
+    def test_null_icons_are_skipped(self):
+        self.assertEqual(missing_icons(self.config, self.glyphs), [])
+        self.config['indicators']['c']['icon'] = 'icon-no-such-glyph'
+        self.assertEqual(missing_icons(self.config, self.glyphs), [('indicator:c', 'icon-no-such-glyph')])
+
+    def test_every_config_icon_is_in_its_subset(self):
+        try:
+            from fontTools.ttLib import TTFont
+            report = build_subsets([self.config], self.css_path, self.fonts_dir / 'custom-icons.woff2', self.out_dir)
+        except ImportError:
+            self.skipTest('fontTools is not installed')
+        self.assertEqual(report['missing'], [])
+        manifest = json.loads((self.out_dir / MANIFEST_NAME).read_text())
+        self.assertEqual(set(manifest), {'all', 'g1', 'g2'})
+        expected = {
+            'all': {self.config['themes'][0]['icon'], self.config['themes'][0]['subthemes'][0]['icon'],
+                    self.config['themes'][1]['subthemes'][0]['icon'],
+                    self.config['indicators']['a']['icon'], self.config['indicators']['b']['icon']},
+            'g1': {self.config['themes'][0]['icon'], self.config['themes'][0]['subthemes'][0]['icon'],
+                   self.config['indicators']['a']['icon'], self.config['indicators']['b']['icon']},
+            'g2': {self.config['themes'][1]['subthemes'][0]['icon']},
+        }
+        for page, icons in expected.items():
+            with self.subTest(page=page):
+                css = (self.out_dir / manifest[page]).read_text()
+                self.assertEqual(set(parse_icon_css(css)), icons)
+                font_name = css.split('url("', 1)[1].split('"', 1)[0]
+                cmap = TTFont(str(self.out_dir / font_name)).getBestCmap()
+                self.assertTrue({self.glyphs[icon] for icon in icons} <= set(cmap))
+        self.assertEqual(stale_subsets(self.config, self.css_path, self.out_dir), {})
+
+        # A new icon in the config makes the subsets stale until they are rebuilt
+        self.config['indicators']['c']['icon'] = sorted(self.glyphs)[10]
+        self.assertEqual(stale_subsets(self.config, self.css_path, self.out_dir),
+                         {'all': [sorted(self.glyphs)[10]], 'g2': [sorted(self.glyphs)[10]]})
+
+
+class HtmlPostProcessorTests(SimpleTestCase):
+    """Minifying inline scripts keeps the program text of strings, templates and regexes."""
+
+    def test_backticks_outside_templates_leave_later_lines_alone(self):
+        for line in ('// a ` in a comment', 'const s = "a ` in a string";', "const s = 'a ` too';",
+                     'const re = /`/g;', 'const ok = x.match(/[/`]/);', '/* a ` in a block comment */'):
+            with self.subTest(line=line):
+                source = f'{line}\n    const t = `one\n        two`;\n    const u = 1;\n'
+                self.assertEqual(minify_script(source).split('\n')[-3:], ['const t = `one', '        two`;',
+                                                                          'const u = 1;'])
+
+    def test_template_literals_are_kept_verbatim(self):
+        source = ('  const t = `a  \n    ${ {k: `b\n  c`}.k }\n    // not a comment\n  `;\n'
+                  '  const d = a / b / c;\n  // dropped\n')
+        self.assertEqual(minify_script(source),
+                         'const t = `a  \n    ${ {k: `b\n  c`}.k }\n    // not a comment\n  `;\nconst d = a / b / c;')
+
+    def test_pre_and_textarea_are_preserved(self):
+        html = ('<p>\n  x   y\n</p><pre>  a\n\n    b  </pre><textarea>\n  c  </textarea>'
+                '<script>\n  var a = 1;\n</script>')
+        result = HtmlPostProcessor().process(html).html
+        self.assertEqual(result, '<p> x y </p><pre>  a\n\n    b  </pre><textarea>\n  c  </textarea>'
+                                 '<script>var a = 1;</script>')
+
+
+class ExportManifestTests(SimpleTestCase):
+    """The service worker precaches exactly the files the exported pages load."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        files = {
+            'index.html': '<link href="./static/fonts/subsets/icons.1.css"><link href="./static/css/app.css">'
+                          '<script src="chunks/a.js"></script><a href="g1/">G1</a><img src="/static/missing.png">'
+                          '<a href="https://example.com/x.css">x</a>',
+            'g1/index.html': '<link href="./static/fonts/subsets/icons.2.css"><a href="../index.html">all</a>'
+                             '<picture><source srcset="./static/thumbs/t.avif 1x, ./static/thumbs/t@2.avif 2x">'
+                             '</picture>',
+            'static/fonts/subsets/icons.1.css': '@font-face { src: url("icons.1.woff2") format("woff2"), '
+                                                'url(icons.1.woff) format("woff"); }',
+            'static/fonts/subsets/icons.1.woff2': 'w2',
+            'static/fonts/subsets/icons.1.woff': 'w1',
+            'static/css/app.css': '@import "base.css";',
+            'static/css/base.css': '.x { background: url(\'../img/bg.png\'); }',
+            'static/img/bg.png': 'png',
+            'static/fonts/custom-icons.css': 'unused',
+            'chunks/a.js': '{}',
+            'g1/static/fonts/subsets/icons.2.css': 'src: url("icons.2.woff2")',
+            'g1/static/fonts/subsets/icons.2.woff2': 'w2',
+            'g1/static/thumbs/t.avif': 'a',
+            'g1/static/thumbs/t@2.avif': 'a',
+        }
+        for path, text in files.items():
+            (self.root / path).parent.mkdir(parents=True, exist_ok=True)
+            (self.root / path).write_text(text)
+
+    def test_manifest_follows_page_and_stylesheet_references(self):
+        manifest = precache_manifest(self.root, ['index.html', 'g1/index.html'])
+        self.assertEqual([entry['url'] for entry in manifest], [
+            'chunks/a.js', 'g1/index.html', 'g1/static/fonts/subsets/icons.2.css',
+            'g1/static/fonts/subsets/icons.2.woff2', 'g1/static/thumbs/t.avif', 'g1/static/thumbs/t@2.avif',
+            'index.html', 'static/css/app.css', 'static/css/base.css', 'static/fonts/subsets/icons.1.css',
+            'static/fonts/subsets/icons.1.woff', 'static/fonts/subsets/icons.1.woff2', 'static/img/bg.png',
+        ])
+        self.assertEqual(manifest[0]['revision'], hash_file(self.root / 'chunks/a.js'))
+
+
+class PreviewServerTests(SimpleTestCase):
+    """The export preview answers like GitHub Pages and the CDN would."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = Path(tmp.name)
+        for path, text in {
+            'index.html': 'home',
+            'connectivity/index.html': 'group',
+            'static/app.css': 'css',
+            'static/app.0123456789ab.css': 'hashed',
+            '_redirects': '/* /index.html 200\n',
+        }.items():
+            (root / path).parent.mkdir(parents=True, exist_ok=True)
+            (root / path).write_text(text)
+        self.server = PreviewServer(('127.0.0.1', 0), root, verbose=False)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def get(self, path):
+        connection = http.client.HTTPConnection(*self.server.server_address, timeout=5)
+        self.addCleanup(connection.close)
+        connection.request('GET', path)
+        response = connection.getresponse()
+        return response, response.read()
+
+    def test_directory_without_slash_redirects(self):
+        response, _ = self.get('/connectivity?theme=t1')
+        self.assertEqual(response.status, 301)
+        self.assertEqual(response.getheader('Location'), '/connectivity/?theme=t1')
+        response, body = self.get('/connectivity/')
+        self.assertEqual((response.status, body), (200, b'group'))
+        self.assertEqual(response.getheader('Cache-Control'), 'no-cache')
+
+    def test_rewrites_serve_the_target_uncached(self):
+        response, body = self.get('/nope/x')
+        self.assertEqual((response.status, body), (200, b'home'))
+        self.assertEqual(response.getheader('Cache-Control'), 'no-cache')
+
+    def test_cache_headers_follow_the_served_file(self):
+        for path, expected in (('/', 'no-cache'), ('/static/app.css', 'public, max-age=3600'),
+                               ('/static/app.0123456789ab.css', 'public, max-age=31536000, immutable')):
+            with self.subTest(path=path):
+                response, _ = self.get(path)
+                self.assertEqual(response.status, 200)
+                self.assertEqual(response.getheader('Cache-Control'), expected)
+        self.assertEqual((self.server.cache.hits, self.server.cache.misses), (0, 3))
+
+
+class LoadTestTests(SimpleTestCase):
+    """The load test replays a weighted mix of every page shape and reports what came back."""
+
+    def test_url_catalogue_matches_the_config(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('All Possible EcoScapes Map URLs\n\n')
+            for number, entry in enumerate(catalogue_from_config(CONFIG), 1):
+                f.write(f'{number}. https://maps.example.org{entry.url}\n   Theme: {entry.theme_id}\n\n')
+        self.addCleanup(os.unlink, f.name)
+        parsed = parse_url_catalogue(f.name)
+        self.assertEqual([(e.theme_id, e.subtheme_id, e.indicator_id) for e in parsed],
+                         [('t1', 's1', 'a'), ('t1', 's1', 'b'), ('t2', 's2', 'c')])
+
+    def test_traffic_mix_weights(self):
+        paths, weights = build_traffic_mix(catalogue_from_config(CONFIG), CONFIG, {'a': 3, 'g2': 0, '*': 2})
+        mix = dict(zip(paths, weights))
+        self.assertEqual(mix['/a/'], 6)
+        self.assertEqual(mix['/a/?theme_group=g1'], 3)
+        self.assertEqual(mix['/?theme=t1&subtheme=s1&indicator=b&theme_group=g1'], 1)
+        self.assertEqual(mix['/c/'], 2)
+        self.assertNotIn('/c/?theme_group=g2', mix)
+        self.assertEqual(len(paths), 10)
+
+    def test_run_load_sends_the_requested_count(self):
+        seen = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                seen.append(self.path)
+                body = b'ok' if self.path.startswith('/app/a/') else b''
+                self.send_response(200 if body else 404)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        base_url = 'http://%s:%d/app/' % server.server_address
+        samples, elapsed = run_load(base_url, ['/a/', '/b/'], [1, 1], concurrency=3, requests=40, seed=1)
+        self.assertEqual(len(samples), 40)
+        self.assertEqual(sorted(seen), sorted('/app' + sample.path for sample in samples))
+        report = summarize(samples, elapsed)
+        hits = sum(sample.path == '/a/' for sample in samples)
+        self.assertEqual(report['statuses'], {'200': hits, '404': 40 - hits})
+        self.assertEqual(report['error_rate'], round((40 - hits) / 40, 4))
+        self.assertEqual(report['bytes'], 2 * hits)
+        self.assertLessEqual(report['latency_ms']['p50'], report['latency_ms']['max'])
+
+
+class CatalogueStoreTests(TestCase):
+    """The database catalogue gives back the config it was loaded with."""
+
+    def setUp(self):
+        self.config = copy.deepcopy(CONFIG)
+        self.config['themeGroups'][0]['icon'] = 'fa-leaf'
+        self.config['themeGroups'][0]['order'] = 2
+        self.config['themes'][0].update(description='About T1', icon='icon-forest', tags=['x'])
+        self.config['themes'][1]['subthemes'].append({'id': 's3', 'name': 'S3', 'icon': None, 'indicators': []})
+        self.config['indicators']['b'].update(source='Survey', map2_url='https://other.example.com/b',
+                                              legend={'colours': ['#fff']})
+
+    def test_import_export_round_trip(self):
+        counts = store.import_config(self.config)
+        self.assertEqual(counts, {'themeGroups': 2, 'themes': 2, 'subthemes': 3, 'indicators': 3})
+        self.config['themes'][1]['subthemes'][1].pop('icon')
+        self.assertEqual(store.export_config(), self.config)
+
+    def test_real_config_round_trips_exactly(self):
+        with open(settings.MAP_CONFIG_PATH, encoding='utf-8') as f:
+            config = json.load(f)
+        store.import_config(config)
+        # Same keys in the same order, so exporting gives back the same file
+        self.assertEqual(json.dumps(store.export_config()), json.dumps(config))
+
+    def test_load_page_fetches_one_theme_group(self):
+        store.import_config(self.config)
+        page = store.load_page('c', 'g2')
+        self.assertEqual(page['page_id'], 'c')
+        self.assertEqual(page['theme_group'], 'g2')
+        self.assertEqual([theme['id'] for theme in page['themes']], ['t2'])
+        self.assertEqual(set(page['indicators']), {'c'})
+        self.assertEqual(page['current_theme']['id'], 't2')
+
+        with self.assertLogs('mapviewer.store', 'WARNING'):
+            page = store.load_page('default', 'nope')
+        self.assertEqual((page['page_id'], page['theme_group'], page['current_theme']), ('a', None, None))
+        self.assertEqual(page['indicators']['b']['legend'], {'colours': ['#fff']})
+        self.assertIsNone(store.load_page('missing'))
+
+    @override_settings(MAP_CATALOGUE_BACKEND='db', MAP_PREWARM_RESPONSES=False, MAP_RECORD_ALIASES=False,
+                       STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_db_backend_serves_stored_pages(self):
+        store.import_config(self.config)
+        response = self.client.get('/c/', {'theme_group': 'g2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page_name'], 'c')
+        self.assertEqual(response['Surrogate-Key'].split()[:2], ['group:g2', 'indicator:c'])
+        self.assertEqual(self.client.get('/missing/').status_code, 404)
+
+
+@override_settings(MAP_CONFIG_WATCH=False, MAP_PREWARM_RESPONSES=False, MAP_RECORD_ALIASES=False,
+                   STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class RegionalCatalogueTests(SimpleTestCase):
+    """Regional catalogues are served under /catalogues/<name>/ and exported to docs/<name>/."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        self.paths = {}
+        for name in ('north', 'south'):
+            config = copy.deepcopy(CONFIG)
+            config['indicators']['a']['title'] = f'{name.title()} A'
+            self.paths[name] = self.tmp / f'{name}.json'
+            self.paths[name].write_text(json.dumps(config))
+            self.addCleanup(catalogues._catalogues.pop, name, None)
+        overrides = override_settings(MAP_CATALOGUES={name: str(path) for name, path in self.paths.items()},
+                                      MAP_CATALOGUE_CACHE_SIZE=1)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_views_are_scoped_to_their_catalogue(self):
+        response = self.client.get('/catalogues/north/a/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'North A')
+        self.assertNotContains(response, 'South A')
+        self.assertEqual(self.client.get('/catalogues/north/catalogue.json').json()['indicators']['a']['title'],
+                         'North A')
+        self.assertEqual(self.client.get('/catalogues/north/zzz/').status_code, 404)
+        with self.assertLogs('mapviewer.views', 'WARNING') as logs:
+            self.assertContains(self.client.get('/catalogues/north/a/?theme_group=nope'), 'North A')
+        self.assertEqual(logs.output, ['WARNING:mapviewer.views:Theme group nope not found in config'])
+        self.assertEqual(self.client.get('/catalogues/nope/').status_code, 404)
+
+        # Only MAP_CATALOGUE_CACHE_SIZE regional catalogues stay in memory
+        self.assertContains(self.client.get('/catalogues/south/'), 'South A')
+        self.assertIn('south', catalogues.loaded_catalogues())
+        self.assertNotIn('north', catalogues.loaded_catalogues())
+
+    def export_command(self):
+        command = ExportCommand(stdout=StringIO(), stderr=StringIO())
+        command.profiler = None
+        command.service_worker = True
+        command.output_root = self.tmp / 'docs'
+        (command.output_root / 'static').mkdir(parents=True)
+        command.factory = RequestFactory()
+        command.bytes_saved = 0
+        command.alias_stubs = set()
+        return command
+
+    def test_regional_export_shares_the_root_static_files(self):
+        command = self.export_command()
+        self.assertEqual(command.export_catalogue('north', self.paths['north'], command.output_root), [])
+
+        north = command.output_root / 'north'
+        self.assertEqual(sorted(path.name for path in north.iterdir()),
+                         ['fragment', 'g1', 'g2', 'index.html', 'indicators.html', 'themeGroups.html',
+                          'themes.html'])
+        self.assertFalse((north / 'static').exists() or (north / 'g1' / 'static').exists())
+        self.assertEqual(json.loads((north / 'fragment' / 'a.json').read_text())['title'], 'North A')
+        for page, root in (('index.html', '../'), ('g1/index.html', '../../')):
+            with self.subTest(page=page):
+                html = (north / page).read_text()
+                self.assertIn(f'href="{root}static/css/mapviewer.css"', html)
+                self.assertIn(f"'{root}sw.js'", html)
+                for chunk in re.findall(r'src="([^"]*chunks/[^"]+)"', html):
+                    self.assertTrue(chunk.startswith(root))
+                    self.assertTrue((north / page).parent.joinpath(chunk).resolve().is_file(), chunk)
+
+    def test_theme_group_pages_share_the_root_static_files(self):
+        command = self.export_command()
+        command.export_catalogue(catalogues.DEFAULT_CATALOGUE, self.paths['north'], command.output_root)
+
+        docs = command.output_root
+        self.assertEqual([path.relative_to(docs).as_posix() for path in docs.rglob('static')], ['static'])
+        for page, root in (('index.html', './'), ('g1/index.html', '../'), ('g2/themes.html', '../')):
+            with self.subTest(page=page):
+                html = (docs / page).read_text()
+                self.assertIn(f'href="{root}static/css/mapviewer.css"', html)
+                self.assertNotIn('href="static/css', html)
+
+
+class ConfigDiffTests(SimpleTestCase):
+    """A config change maps to exactly the scopes, pages and cache keys that show it."""
+
+    def edited(self, edit):
+        config = copy.deepcopy(CONFIG)
+        edit(config)
+        return config
+
+    def test_edited_indicator_affects_the_scopes_showing_it(self):
+        new = self.edited(lambda config: config['indicators']['b'].update(title='B2'))
+        self.assertEqual(diff_configs(CONFIG, new), [Change('indicator', EDITED, 'b', ['title'])])
+        result = impact(CONFIG, new)
+        self.assertFalse(result['full'])
+        self.assertEqual(result['scopes'], [None, 'g1'])
+        self.assertEqual(result['cache_keys'],
+                         ['all-themes', 'catalogue', 'group:g1', 'indicator:b', 'subtheme:s1', 'theme:t1'])
+        self.assertIn('g1/index.html', result['pages'])
+        self.assertFalse([page for page in result['pages'] if page.startswith('g2/')])
+        # Its own page changes in every theme group; other g2 pages don't
+        self.assertIn('/b/?theme_group=g2', result['responses'])
+        self.assertNotIn('/c/?theme_group=g2', result['responses'])
+
+    def test_moved_indicator_affects_both_themes(self):
+        def move(config):
+            config['themes'][0]['subthemes'][0]['indicators'].remove('b')
+            config['themes'][1]['subthemes'][0]['indicators'].append('b')
+        new = self.edited(move)
+        self.assertIn(Change('indicator', MOVED, 'b', (['s1'], ['s2'])), diff_configs(CONFIG, new))
+        result = impact(CONFIG, new)
+        self.assertEqual(result['scopes'], [None, 'g1', 'g2'])
+        self.assertTrue({'theme:t1', 'theme:t2', 'subtheme:s1', 'subtheme:s2'} <= set(result['cache_keys']))
+
+    def test_new_embed_host_rebuilds_everything(self):
+        new = self.edited(lambda config: config['indicators']['c'].update(map1_url='https://new.example.com/c'))
+        result = impact(CONFIG, new, catalogue='north')
+        self.assertTrue(result['full'])
+        self.assertEqual(result['scopes'], [None, 'g1', 'g2'])
+        self.assertTrue(all(page.startswith('north/') for page in result['pages'] if page != 'sw.js'))
+        self.assertIn('/catalogues/north/a/?theme_group=g1', result['responses'])
+        # Same host, new path: only the scopes showing it
+        new = self.edited(lambda config: config['indicators']['c'].update(map1_url='https://maps.example.com/c2'))
+        self.assertEqual(impact(CONFIG, new)['scopes'], [None, 'g2'])
+
+    def test_unchanged_config_affects_nothing(self):
+        self.assertEqual(impact(CONFIG, copy.deepcopy(CONFIG)),
+                         {'changes': [], 'full': False, 'scopes': [], 'pages': [], 'responses': [], 'cache_keys': []})
+
+
+@override_settings(MAP_RESPONSE_CACHE_BYTES=1024 * 1024, MAP_PREWARM_RESPONSES=False,
+                   STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class EmbedHintTests(SimpleTestCase):
+    """Each page preconnects to the hosts of the map it shows and only prefetches the rest."""
+
+    def setUp(self):
+        self.config = copy.deepcopy(CONFIG)
+        self.config['indicators']['a'].update(map1_url='https://one.example.com/a', map2_url='https://two.example.com/a')
+        self.config['indicators']['b']['map1_url'] = 'https://two.example.com/b'
+        self.config['indicators']['c']['map1_url'] = 'https://three.example.com/c'
+
+    def hints(self, path, page_name, **params):
+        response = catalogue_page(RequestFactory().get(path, params), Catalogue(self.config), page_name)
+        head = response.content.decode().split('</head>', 1)[0]
+        return re.findall(r'<link rel="(preconnect|dns-prefetch)" href="([^"]+)">', head)
+
+    def test_indicator_page_hints_its_own_hosts(self):
+        self.assertEqual(self.hints('/a/', 'a'), [('preconnect', 'https://one.example.com'),
+                                                  ('dns-prefetch', 'https://two.example.com'),
+                                                  ('dns-prefetch', 'https://three.example.com')])
+        with self.settings(MAP_DEFER_SECOND_MAP=False):
+            self.assertEqual(self.hints('/a/', 'a')[1], ('preconnect', 'https://two.example.com'))
+
+    def test_default_page_hints_the_indicator_in_its_query(self):
+        self.assertEqual(self.hints('/', 'default', indicator='c'), [('preconnect', 'https://three.example.com'),
+                                                                     ('dns-prefetch', 'https://two.example.com'),
+                                                                     ('dns-prefetch', 'https://one.example.com')])
+        self.assertEqual(self.hints('/', 'default')[0], ('preconnect', 'https://one.example.com'))
+
+    def test_hints_are_shared_per_host_pair(self):
+        catalogue = Catalogue(self.config)
+        self.config['indicators']['d'] = {'title': 'D', 'map1_url': 'https://three.example.com/d'}
+        with_d = Catalogue(self.config)
+        self.assertIs(with_d.hints_for('c'), with_d.hints_for('d'))
+        self.assertEqual(catalogue.hints_for('nope'), NO_EMBED_HINTS)
+
+
+class ThumbnailTests(SimpleTestCase):
+    """Placeholder images are built once per source, in the formats Pillow can write."""
+
+    def setUp(self):
+        fonts_dir = Path(settings.STATICFILES_DIRS[0]) / 'fonts'
+        self.css_path = fonts_dir / 'custom-icons.css'
+        self.font_path = fonts_dir / 'custom-icons.woff'
+        names = sorted(parse_icon_css(self.css_path.read_text(encoding='utf-8')))
+        self.config = copy.deepcopy(CONFIG)
+        for indicator_id, name in zip('abc', names):
+            self.config['indicators'][indicator_id]['icon'] = name
+        self.config['indicators']['c']['icon'] = names[0]
+        self.config['indicators']['d'] = {'title': 'D'}
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.out_dir = Path(tmp.name)
+
+    def build(self):
+        return build_thumbnails({'default': self.config}, self.css_path, self.font_path, self.out_dir,
+                                size=(64, 36), workers=1)
+
+    def test_images_are_built_once_and_reused(self):
+        report = self.build()
+        # a and c share a glyph but not a theme colour, so there are three images
+        self.assertEqual((report['images'], report['built'], report['missing']), (3, 3, [('default', 'd')]))
+        manifest = json.loads((self.out_dir / THUMBNAIL_MANIFEST).read_text())
+        for key, entry in manifest['images'].items():
+            for fmt in report['formats']:
+                self.assertTrue((self.out_dir / entry[fmt]).is_file())
+            self.assertTrue(entry['preview'].startswith('data:image/webp;base64,'))
+        self.assertEqual(set(manifest['catalogues']['default']), {'a', 'b', 'c'})
+
+        self.assertEqual(self.build()['built'], 0)
+        self.config['indicators']['b']['icon'] = self.config['indicators']['a']['icon']
+        self.config['themes'][0]['subthemes'][0]['indicators'].remove('b')
+        self.config['themes'][1]['subthemes'][0]['indicators'].append('b')
+        report = self.build()
+        # b now draws the same glyph on the same theme colour as c
+        self.assertEqual((report['images'], report['built'], len(report['removed'])),
+                         (2, 0, len(report['formats'])))
+
+    def test_avif_is_skipped_without_pillow_support(self):
+        from PIL import features
+
+        check = features.check
+        with mock.patch.object(features, 'check', side_effect=lambda name: name != 'avif' and check(name)):
+            report = self.build()
+        self.assertEqual(report['formats'], ['webp'])
+        self.assertFalse(list(self.out_dir.glob('*.avif')))
+        entry = next(iter(json.loads((self.out_dir / THUMBNAIL_MANIFEST).read_text())['images'].values()))
+        self.assertNotIn('avif', entry)
+
+
+class CompactConfigTests(SimpleTestCase):
+    """Compact indicator records read exactly like the dicts they replace."""
+
+    def setUp(self):
+        self.config = copy.deepcopy(CONFIG)
+        for indicator in self.config['indicators'].values():
+            indicator['description'] = ''.join(['Shared ', 'description'])
+        self.config['indicators']['b'].update(icon=None, legend={'colours': ['#fff']}, extra_note='x')
+
+    def test_records_match_the_dicts(self):
+        compacted, pool = compact_config(self.config, preencode=True)
+        self.assertEqual(json.dumps(compacted, default=dict), json.dumps(self.config))
+        for indicator_id, data in self.config['indicators'].items():
+            record = compacted['indicators'][indicator_id]
+            with self.subTest(indicator=indicator_id):
+                self.assertIsInstance(record, IndicatorRecord)
+                self.assertEqual(dict(record), data)
+                self.assertEqual(list(record), list(data))
+                self.assertEqual(len(record), len(data))
+                self.assertEqual(record.get('source'), data.get('source'))
+                self.assertNotIn('source', record)
+                with self.assertRaises(KeyError):
+                    record['unknown']
+                self.assertEqual(json.loads(record.payload), data)
+        record = compacted['indicators']['b']
+        self.assertIsNone(record['icon'])
+        self.assertEqual(record['legend'], {'colours': ['#fff']})
+        self.assertEqual(Template('{{ a.title }}|{{ a.source }}|{{ b.extra_note }}').render(
+            Context(compacted['indicators'])), 'A||x')
+
+    def test_strings_and_ids_are_shared(self):
+        compacted, pool = compact_config(self.config)
+        a, b, c = (compacted['indicators'][key] for key in 'abc')
+        self.assertIs(a['description'], c['description'])
+        self.assertIs(a._keys, c._keys)
+        listed = compacted['themes'][0]['subthemes'][0]['indicators'][1]
+        self.assertIs(listed, next(key for key in compacted['indicators'] if key == 'b'))
+        self.assertLess(len(pool), pool.lookups)
+
+    def test_flat_configs_are_left_alone(self):
+        config = {'page': {'map1_url': 'https://maps.example.com/x'}}
+        self.assertIs(compact_config(config)[0], config)
+
+
+class EncodedResponseTests(SimpleTestCase):
+    """Each content coding is its own variant for validation and caching."""
+
+    def setUp(self):
+        self.body = EncodedBody(b'<p>map</p>' * 200, 'text/html; charset=utf-8', headers={'Vary': 'Cookie'})
+
+    def get(self, accept='', if_none_match=None):
+        headers = {'HTTP_ACCEPT_ENCODING': accept}
+        if if_none_match is not None:
+            headers['HTTP_IF_NONE_MATCH'] = if_none_match
+        return encoded_response(RequestFactory().get('/', **headers), self.body)
+
+    def test_codings_have_their_own_etags(self):
+        identity, gzipped = self.get(), self.get('gzip')
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzipped['ETag'], identity['ETag'][:-1] + '-gzip"')
+        self.assertEqual(len(set(self.body.etags.values())), len(self.body.variants))
+        for response in (identity, gzipped):
+            self.assertEqual(response['Vary'], 'Cookie, Accept-Encoding')
+
+    def test_if_none_match_is_parsed_not_searched(self):
+        gzip_etag = self.body.etags['gzip']
+        for header, status in (
+            (f'"other", W/{gzip_etag}', 304),
+            ('*', 304),
+            (self.body.etags['identity'], 200),  # another variant
+            (f'"other" {gzip_etag}', 200),  # not a list of ETags
+            (gzip_etag[:-1] + 'x"', 200),
+        ):
+            with self.subTest(header=header):
+                response = self.get('gzip', header)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response['ETag'], gzip_etag)
+                self.assertEqual(response['Vary'], 'Cookie, Accept-Encoding')
+
+
+class BuildGraphTests(SimpleTestCase):
+    """Nodes rerun only when their inputs, params or outputs changed."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        (self.root / 'src').mkdir()
+        (self.root / 'src' / 'a.txt').write_text('a')
+        self.runs = []
+
+    def copy_node(self, name='copy', **kwargs):
+        def run():
+            self.runs.append(name)
+            (self.root / 'out').mkdir(exist_ok=True)
+            (self.root / 'out' / f'{name}.txt').write_text((self.root / 'src' / 'a.txt').read_text())
+        return build.Node(name, run, inputs=['src'], outputs=[f'out/{name}.txt'], **kwargs)
+
+    def statuses(self, nodes, **kwargs):
+        return {result.name: result.status for result in build.run_graph(nodes, self.root, workers=2, **kwargs)}
+
+    def test_unchanged_nodes_are_cached(self):
+        self.assertEqual(self.statuses([self.copy_node()]), {'copy': build.BUILT})
+        self.assertEqual(self.statuses([self.copy_node()]), {'copy': build.CACHED})
+        self.assertEqual(self.statuses([self.copy_node()], force=['copy']), {'copy': build.BUILT})
+        self.assertEqual(self.statuses([self.copy_node(params={'level': 2})]), {'copy': build.BUILT})
+        self.assertEqual(self.runs, ['copy'] * 3)
+
+    def test_changed_inputs_and_outputs_rebuild(self):
+        self.statuses([self.copy_node()])
+        (self.root / 'src' / 'b.txt').write_text('b')
+        self.assertEqual(self.statuses([self.copy_node()]), {'copy': build.BUILT})
+        (self.root / 'out' / 'copy.txt').write_text('edited')
+        self.assertEqual(self.statuses([self.copy_node()]), {'copy': build.BUILT})
+        (self.root / 'out' / 'copy.txt').unlink()
+        self.assertEqual(self.statuses([self.copy_node()]), {'copy': build.BUILT})
+        self.assertEqual(len(self.runs), 4)
+
+    def test_unverified_outputs_only_rebuild_when_missing(self):
+        self.statuses([self.copy_node(verify_outputs=False)])
+        (self.root / 'out' / 'copy.txt').write_text('edited by hand')
+        self.assertEqual(self.statuses([self.copy_node(verify_outputs=False)]), {'copy': build.CACHED})
+        (self.root / 'out' / 'copy.txt').unlink()
+        self.assertEqual(self.statuses([self.copy_node(verify_outputs=False)]), {'copy': build.BUILT})
+
+    def test_failure_blocks_only_its_dependants(self):
+        def fail():
+            raise ValueError('broken')
+
+        def skip():
+            raise build.Skip('nothing to do')
+
+        nodes = [
+            build.Node('broken', fail, inputs=['src']),
+            self.copy_node('after', deps=['broken']),
+            self.copy_node('sibling'),
+            build.Node('idle', skip, deps=['sibling']),
+        ]
+        self.assertEqual(self.statuses(nodes), {
+            'broken': build.FAILED, 'after': build.BLOCKED, 'sibling': build.BUILT, 'idle': build.SKIPPED,
+        })
+        # Nothing is recorded for a failed node, so it runs again
+        self.assertEqual(self.statuses(nodes)['broken'], build.FAILED)
+        self.assertEqual(self.runs, ['sibling'])
+
+    def test_dry_run_and_select(self):
+        nodes = [self.copy_node('first'), self.copy_node('second', deps=['first']), self.copy_node('other')]
+        self.assertEqual([node.name for node in build.select(nodes, ['second'])], ['first', 'second'])
+        with self.assertRaises(KeyError):
+            build.select(nodes, ['missing'])
+        self.assertEqual(set(self.statuses(nodes, dry_run=True).values()), {build.BUILT})
+        self.assertEqual(self.runs, [])
+        self.assertFalse((self.root / build.CACHE_NAME).exists())
+
+
+class ExportProfileTests(SimpleTestCase):
+    """The export profile charges time to every open stage and bytes to the innermost."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+
+    def test_stages_pages_and_bytes_are_accounted(self):
+        tree = self.tmp / 'static'
+        (tree / 'css').mkdir(parents=True)
+        (tree / 'css' / 'site.css').write_bytes(b'x' * 30)
+        (tree / 'app.js').write_bytes(b'y' * 12)
+        profiler = ExportProfiler()
+        with profiler.stage('pages'):
+            for page in ('index.html', 'a/index.html'):
+                with profiler.stage('render', page=page):
+                    profiler.read(5)
+                profiler.wrote(100, page=page)
+        with profiler.stage('static'):
+            profiler.wrote_tree(tree)
+        profiler.wrote(7)
+
+        report = json.loads(json.dumps(profiler.report()))
+        stages = report['stages']
+        self.assertEqual(stages['render']['calls'], 2)
+        self.assertEqual((stages['render']['bytes_read'], stages['render']['bytes_written']), (10, 0))
+        self.assertEqual((stages['pages']['bytes_written'], stages['pages']['files_written']), (200, 2))
+        self.assertEqual((stages['static']['bytes_read'], stages['static']['files_written']), (42, 2))
+        self.assertEqual(stages['other']['bytes_written'], 7)
+        self.assertGreaterEqual(stages['pages']['wall'], stages['render']['wall'])
+        self.assertEqual((report['bytes_read'], report['bytes_written'], report['files_written']), (52, 249, 5))
+        self.assertEqual(report['pages']['a/index.html']['bytes'], 100)
+        self.assertEqual(list(report['pages']['a/index.html']['stages']), ['render'])
+        self.assertNotIn('hot_functions', report)
+
+        summary = profiler.summary()
+        self.assertTrue(summary[0].startswith('Export took '))
+        self.assertIn('wrote 249 bytes in 5 files', summary[0])
+        rows = {line.split()[0]: line.split()[1:] for line in summary[3:7]}
+        self.assertEqual(set(rows), {'pages', 'render', 'static', 'other'})
+        self.assertEqual(rows['static'][-3:], ['42', '42', '2'])
+        self.assertIn('Slowest pages:', summary)
+
+    def test_profiled_stages_are_written_for_pstats(self):
+        command = ExportCommand(stdout=StringIO())
+        command.profiler = ExportProfiler(['render'])
+        with command.stage('render', page='index.html'):
+            with command.stage('render'):
+                sorted(range(1000), key=lambda n: -n)
+        with command.stage('copy'):
+            sorted(range(1000), key=lambda n: n)
+        report_path, stats_path = self.tmp / 'profile.json', self.tmp / 'render.prof'
+        command.write_profile(report_path, stats_path)
+
+        report = json.loads(report_path.read_text())
+        self.assertEqual(report['profiled_stages'], ['render'])
+        self.assertEqual(report['stages']['render']['calls'], 2)
+        functions = [row['function'] for row in report['hot_functions']]
+        self.assertTrue(any('<lambda>' in function for function in functions))
+        self.assertEqual(pstats.Stats(str(stats_path)).total_calls,
+                         sum(row['calls'] for row in command.profiler.hot_functions(limit=None)))
+        output = command.stdout.getvalue()
+        self.assertIn('Hot functions in render (cumulative):', output)
+        self.assertIn(f'Wrote export profile to {report_path}', output)
+        self.assertIn(f'Wrote render profile to {stats_path}', output)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+                   MAP_PREWARM_RESPONSES=False, MAP_RECORD_ALIASES=False, MAP_CONFIG_WATCH=False)
+class FragmentTests(SimpleTestCase):
+    """Pages fetch each indicator's fragment from the URL they are given, live and exported."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        config = copy.deepcopy(CONFIG)
+        config['indicators']['b'].update(description='Ünïcode', posts='tag-b', legend='not sent')
+        self.path = self.tmp / 'north.json'
+        self.path.write_text(json.dumps(config))
+        self.addCleanup(catalogues._catalogues.pop, 'north', None)
+        overrides = override_settings(MAP_CATALOGUES={'north': str(self.path)})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def page_fragment_url(self, html):
+        return re.search(r"const FRAGMENT_URL = '([^']*)'", html).group(1).replace(FRAGMENT_PLACEHOLDER, 'b')
+
+    def test_fragment_holds_what_changes_per_indicator(self):
+        fragment = Catalogue(CONFIG).fragment('c')
+        self.assertEqual(fragment, {
+            'id': 'c', 'title': 'C', 'map1_url': 'https://maps.example.com/c', 'theme': 't2', 'subtheme': 's2',
+            'breadcrumb': [{'id': 't2', 'name': 'T2'}, {'id': 's2', 'name': 'S2'}, {'id': 'c', 'name': 'C'}],
+        })
+        self.assertIsNone(Catalogue(CONFIG).fragment('zzz'))
+        self.assertEqual(fragment_url(), f'/fragment/{FRAGMENT_PLACEHOLDER}/')
+        self.assertEqual(fragment_url('north'), f'/catalogues/north/fragment/{FRAGMENT_PLACEHOLDER}/')
+
+    def test_page_fetches_fragments_from_the_view(self):
+        url = self.page_fragment_url(self.client.get('/catalogues/north/a/').content.decode())
+        self.assertEqual(url, '/catalogues/north/fragment/b/')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='identity')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        fragment = json.loads(response.content)
+        self.assertEqual((fragment['description'], fragment['posts'], fragment['subtheme']),
+                         ('Ünïcode', 'tag-b', 's1'))
+        self.assertNotIn('legend', fragment)
+        self.assertIn('north/indicator:b', response['Surrogate-Key'].split())
+
+        # The ETag is a hash of the encoded body, so an unchanged fragment revalidates
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/catalogues/north/fragment/zzz/').status_code, 404)
+        self.assertEqual(self.client.get('/catalogues/nope/fragment/b/').status_code, 404)
+
+        config = json.loads(self.path.read_text())
+        config['indicators']['b']['title'] = 'B, renamed'
+        self.path.write_text(json.dumps(config))
+        catalogues._catalogues.pop('north')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='identity')
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['breadcrumb'][-1]['name'], 'B, renamed')
+
+    def test_exported_pages_point_at_the_exported_fragments(self):
+        live = self.client.get('/catalogues/north/fragment/b/', HTTP_ACCEPT_ENCODING='identity').content
+        command = ExportCommand(stdout=StringIO(), stderr=StringIO())
+        command.profiler = None
+        command.service_worker = True
+        command.output_root = self.tmp / 'docs'
+        (command.output_root / 'static').mkdir(parents=True)
+        command.factory = RequestFactory()
+        command.bytes_saved = 0
+        command.alias_stubs = set()
+        command.export_catalogue('north', self.path, command.output_root)
+
+        north = command.output_root / 'north'
+        self.assertEqual(sorted(path.name for path in (north / 'fragment').iterdir()), ['a.json', 'b.json', 'c.json'])
+        for page in ('index.html', 'g1/index.html', 'themes.html'):
+            with self.subTest(page=page):
+                url = self.page_fragment_url((north / page).read_text())
+                self.assertEqual((north / page).parent.joinpath(url).resolve().read_bytes(), live)
+
+
+class PreloadTests(SimpleTestCase):
+    """gunicorn's master loads the catalogues and freezes them before it forks."""
+
+    SCRIPT = '\n'.join([
+        'import gc, json, runpy, sys, threading',
+        # gunicorn reads its config file, then imports the preloaded app
+        'if sys.argv[1:]: runpy.run_path(sys.argv[1])',
+        'import ecomaps.wsgi',
+        'from mapviewer.catalogue import loaded_catalogues',
+        'print(json.dumps([sorted(loaded_catalogues()), gc.get_freeze_count(), threading.active_count()]))',
+    ])
+
+    def master(self, *args):
+        env = {key: value for key, value in os.environ.items() if key != 'MAP_PRELOAD'}
+        env.update(DJANGO_SETTINGS_MODULE='ecomaps.settings', PYTHONPATH=str(settings.BASE_DIR))
+        output = subprocess.run([sys.executable, '-c', self.SCRIPT, *args], cwd=settings.BASE_DIR, env=env,
+                                check=True, text=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+        return json.loads(output.splitlines()[-1])
+
+    def test_gunicorn_config_preloads_on_first_boot(self):
+        catalogue_names, frozen, threads = self.master(str(Path(settings.BASE_DIR) / 'gunicorn.conf.py'))
+        self.assertIn(catalogues.DEFAULT_CATALOGUE, catalogue_names)
+        self.assertGreater(frozen, 0)
+        # Threads don't survive the fork, so preloading must not leave any running
+        self.assertEqual(threads, 1)
+        self.assertEqual(self.master(), [[], 0, 1])
@@ -0,0 +1,258 @@
+"""
+Placeholder images for the map embeds.
+
+Each indicator gets a 16:9 placeholder shown in the map area while its
+third-party map loads, and as a thumbnail in the indicator menu. The image
+comes from a screenshot in ``MAP_SCREENSHOTS_DIR`` named after the
+indicator (``<indicator id>.png``, ``.jpg`` or ``.webp``) when there is one,
+otherwise it is drawn from the indicator's glyph in the custom icon font on
+a background tinted per theme. Nothing is fetched from the embed hosts.
+
+Every image is written as WebP and, when Pillow can encode it (11.3 and
+later), AVIF under a name made from a hash of its source and the encoding
+settings, so indicators with the same source share files, and a tiny
+blurred WebP preview is kept in the manifest for inlining as a data URI. A
+rebuild only encodes images whose source changed; the rest are taken from
+the previous manifest. Encoding runs in a process pool.
+"""
+import base64
+import colorsys
+import hashlib
+import io
+import json
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .icons import parse_icon_css
+
+MANIFEST_NAME = 'thumbnails.json'
+SCREENSHOT_SUFFIXES = ('.png', '.jpg', '.jpeg', '.webp')
+
+SIZE = (640, 360)
+PREVIEW_SIZE = (16, 9)
+FORMATS = ('avif', 'webp')
+ENCODE_OPTIONS = {
+    'webp': {'quality': 60, 'method': 6},
+    'avif': {'quality': 45, 'speed': 6},
+}
+# Bump when the drawing or encoding changes so every image is rebuilt
+PIPELINE_VERSION = 1
+
+
+def supported_formats(formats=FORMATS):
+    """``formats`` without the ones the installed Pillow can't encode."""
+    from PIL import features
+
+    with warnings.catch_warnings():
+        # Pillow before 11.3 warns about the unknown 'avif' feature
+        warnings.simplefilter('ignore')
+        return tuple(fmt for fmt in formats if features.check(fmt))
+
+
+def find_screenshot(screenshots_dir, indicator_id):
+    """Path of the screenshot for an indicator, or None."""
+    if not screenshots_dir:
+        return None
+    for suffix in SCREENSHOT_SUFFIXES:
+        path = Path(screenshots_dir) / f'{indicator_id}{suffix}'
+        if path.is_file():
+            return path
+    return None
+
+
+def theme_colour(theme_id):
+    """A muted background colour derived from a theme ID."""
+    hue = int(hashlib.md5((theme_id or '').encode('utf-8')).hexdigest()[:4], 16) / 0xffff
+    return tuple(round(c * 255) for c in colorsys.hsv_to_rgb(hue, 0.35, 0.55))
+
+
+def home_themes(config):
+    """Return ``{indicator id: theme id}`` for the first theme listing each indicator."""
+    homes = {}
+    for theme in config.get('themes', []):
+        for subtheme in theme.get('subthemes', []):
+            for indicator_id in subtheme.get('indicators', []):
+                homes.setdefault(indicator_id, theme.get('id'))
+    return homes
+
+
+def indicator_sources(config, glyphs, screenshots_dir=None):
+    """
+    Yield ``(indicator id, source)`` for every indicator that can have an image.
+
+    A source is ``{'screenshot': path}`` or ``{'glyph': codepoint, 'colour':
+    [r, g, b]}``; indicators with neither a screenshot nor a known glyph are
+    skipped.
+    """
+    homes = home_themes(config)
+    for indicator_id, indicator in config.get('indicators', {}).items():
+        screenshot = find_screenshot(screenshots_dir, indicator_id)
+        if screenshot:
+            yield indicator_id, {'screenshot': str(screenshot)}
+            continue
+        icon = indicator.get('icon', '') if isinstance(indicator, dict) else ''
+        if icon in glyphs:
+            yield indicator_id, {'glyph': glyphs[icon], 'colour': list(theme_colour(homes.get(indicator_id)))}
+
+
+def source_key(source, font_hash, size=SIZE, formats=FORMATS):
+    """Content hash naming the images built from ``source``."""
+    digest = hashlib.md5()
+    params = {'version': PIPELINE_VERSION, 'size': list(size), 'formats': list(formats),
+              'options': {fmt: ENCODE_OPTIONS[fmt] for fmt in formats}}
+    if 'screenshot' in source:
+        digest.update(Path(source['screenshot']).read_bytes())
+    else:
+        params.update(glyph=source['glyph'], colour=source['colour'], font=font_hash)
+    digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+def render_source(source, font_path, size=SIZE):
+    """Return the full-size RGB placeholder image for a source."""
+    from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+    if 'screenshot' in source:
+        with Image.open(source['screenshot']) as image:
+            return ImageOps.fit(image.convert('RGB'), size, Image.LANCZOS)
+
+    width, height = size
+    r, g, b = source['colour']
+    image = Image.new('RGB', size)
+    draw = ImageDraw.Draw(image)
+    # Vertical gradient, darkening towards the bottom
+    for y in range(height):
+        shade = 1 - 0.35 * y / height
+        draw.line([(0, y), (width, y)], fill=(round(r * shade), round(g * shade), round(b * shade)))
+
+    overlay = Image.new('RGBA', size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    # A faint graticule so the placeholder reads as a map
+    step = height // 6
+    for x in range(step // 2, width, step):
+        draw.line([(x, 0), (x, height)], fill=(255, 255, 255, 28))
+    for y in range(step // 2, height, step):
+        draw.line([(0, y), (width, y)], fill=(255, 255, 255, 28))
+    font = ImageFont.truetype(str(font_path), height // 2)
+    draw.text((width / 2, height / 2), chr(source['glyph']), font=font, anchor='mm',
+              fill=(255, 255, 255, 210))
+    image.paste(overlay, (0, 0), overlay)
+    return image
+
+
+def encode_images(key, source, font_path, out_dir, size=SIZE, formats=FORMATS):
+    """
+    Render one source and write ``<key>.<format>`` files to ``out_dir``.
+
+    Returns the manifest entry: the file names, their byte sizes and the
+    blurred preview as a data URI. Runs in a worker process.
+    """
+    from PIL import Image, ImageFilter
+
+    image = render_source(source, font_path, size)
+    entry = {'width': size[0], 'height': size[1], 'bytes': {}}
+    for fmt in formats:
+        out = io.BytesIO()
+        image.save(out, fmt.upper(), **ENCODE_OPTIONS[fmt])
+        name = f'{key}.{fmt}'
+        (Path(out_dir) / name).write_bytes(out.getvalue())
+        entry[fmt] = name
+        entry['bytes'][fmt] = out.tell()
+
+    preview = image.resize(PREVIEW_SIZE, Image.BICUBIC).filter(ImageFilter.GaussianBlur(0.6))
+    out = io.BytesIO()
+    preview.save(out, 'WEBP', quality=40)
+    entry['preview'] = 'data:image/webp;base64,' + base64.b64encode(out.getvalue()).decode('ascii')
+    return entry
+
+
+def load_manifest(out_dir):
+    path = Path(out_dir) / MANIFEST_NAME
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def build_thumbnails(configs, css_path, font_path, out_dir, screenshots_dir=None,
+                     size=SIZE, formats=FORMATS, workers=None, force=False):
+    """
+    Write the placeholder images for some configs and their manifest.
+
+    ``configs`` maps catalogue names to configs. The manifest maps each
+    catalogue's indicators to image keys under ``catalogues`` and the keys to
+    their files and previews under ``images``. Returns a report dict with the
+    number of images ``built`` and ``reused``, the ``removed`` stale files,
+    byte totals, the ``formats`` written and the ``(catalogue, indicator)``
+    pairs that got no image. Formats Pillow can't encode are left out.
+    """
+    formats = supported_formats(formats)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    glyphs = parse_icon_css(Path(css_path).read_text(encoding='utf-8'))
+    font_hash = hashlib.md5(Path(font_path).read_bytes()).hexdigest()
+
+    catalogues = {}
+    jobs = {}
+    missing = []
+    for name, config in configs.items():
+        indicators = catalogues[name] = {}
+        for indicator_id, source in indicator_sources(config, glyphs, screenshots_dir):
+            key = source_key(source, font_hash, size, formats)
+            indicators[indicator_id] = key
+            jobs.setdefault(key, source)
+        missing.extend((name, key) for key in config.get('indicators', {}) if key not in indicators)
+
+    previous = {} if force else load_manifest(out_dir).get('images', {})
+    images = {}
+    todo = []
+    for key, source in jobs.items():
+        entry = previous.get(key)
+        if entry and all((out_dir / entry.get(fmt, '')).is_file() for fmt in formats):
+            images[key] = entry
+        else:
+            todo.append((key, source))
+
+    if len(todo) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                (key, pool.submit(encode_images, key, source, str(font_path), str(out_dir), size, formats))
+                for key, source in todo
+            ]
+            for key, future in futures:
+                images[key] = future.result()
+    else:
+        for key, source in todo:
+            images[key] = encode_images(key, source, font_path, out_dir, size, formats)
+
+    # Drop images nothing uses any more
+    keep = {entry[fmt] for entry in images.values() for fmt in formats}
+    removed = []
+    for path in out_dir.iterdir():
+        if path.suffix.lstrip('.') in ('webp', 'avif') and path.name not in keep:
+            path.unlink()
+            removed.append(path.name)
+
+    manifest = {
+        'catalogues': catalogues,
+        'images': {key: images[key] for key in sorted(images)},
+    }
+    tmp_path = out_dir / (MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, out_dir / MANIFEST_NAME)
+
+    return {
+        'images': len(images),
+        'built': len(todo),
+        'reused': len(images) - len(todo),
+        'removed': sorted(removed),
+        'formats': list(formats),
+        'screenshots': sum(1 for source in jobs.values() if 'screenshot' in source),
+        'bytes': {fmt: sum(entry['bytes'][fmt] for entry in images.values()) for fmt in formats},
+        'preview_bytes': sum(len(entry['preview']) for entry in images.values()),
+        'missing': missing,
+    }
@@ -3,5 +3,19 @@ from . import views
 
 urlpatterns = [
     path('', views.map_view, {'page_name': 'default'}, name='map_view'),
+    path('catalogue.json', views.catalogue_json, name='catalogue_json'),
+    path('indicators/<str:indicator_id>.json', views.indicator_json, name='indicator_json'),
+    path('fragment/<str:indicator_id>/', views.indicator_fragment, name='indicator_fragment'),
+    path('chunks/<str:chunk>.js', views.indicator_chunk, name='indicator_chunk'),
+    path('telemetry/', views.telemetry_beacon, name='telemetry_beacon'),
+    path('catalogues/<slug:catalogue>/catalogue.json', views.catalogue_json, name='regional_catalogue_json'),
+    path('catalogues/<slug:catalogue>/indicators/<str:indicator_id>.json', views.indicator_json,
+         name='regional_indicator_json'),
+    path('catalogues/<slug:catalogue>/fragment/<str:indicator_id>/', views.indicator_fragment,
+         name='regional_indicator_fragment'),
+    path('catalogues/<slug:catalogue>/chunks/<str:chunk>.js', views.indicator_chunk, name='regional_indicator_chunk'),
+    path('catalogues/<slug:catalogue>/telemetry/', views.telemetry_beacon, name='regional_telemetry_beacon'),
+    path('catalogues/<slug:catalogue>/', views.map_view, {'page_name': 'default'}, name='catalogue_map_view'),
+    path('catalogues/<slug:catalogue>/<str:page_name>/', views.map_view, name='catalogue_map_view_with_page'),
     path('<str:page_name>/', views.map_view, name='map_view_with_page'),
 ]
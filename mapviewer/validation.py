@@ -0,0 +1,226 @@
+"""
+Validation of map_config.json.
+
+``validate_config`` walks the config once, collecting theme, subtheme and
+indicator IDs into sets as it goes, and reports every problem it finds as an
+``Issue`` with a JSON-path style location. It has no Django dependencies so it
+can be used from scripts as well as the ``validate_config`` command.
+"""
+import json
+import re
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+ERROR = 'error'
+WARNING = 'warning'
+
+_BAD_URL_CHARS = re.compile(r'[\s<>]')
+
+
+class Issue(namedtuple('Issue', 'level path message')):
+    __slots__ = ()
+
+    def __str__(self):
+        return f'{self.level}: {self.path}: {self.message}'
+
+
+def parse_config(raw):
+    """
+    Parse config JSON, returning ``(config, duplicate_keys)``.
+
+    ``json.loads`` silently keeps the last of several identical keys, which
+    hides duplicated indicator IDs, so they are collected here instead.
+    """
+    duplicates = []
+
+    def pairs_hook(pairs):
+        obj = {}
+        for key, value in pairs:
+            if key in obj:
+                duplicates.append(key)
+            obj[key] = value
+        return obj
+
+    return json.loads(raw, object_pairs_hook=pairs_hook), duplicates
+
+
+def check_url(value):
+    """Return a description of what is wrong with an embed URL, or None."""
+    # Fast path for the common case; substring tests are much cheaper than a
+    # regex scan over long dashboard URLs
+    if (value.startswith(('https://', 'http://')) and value.isascii()
+            and ' ' not in value and '<' not in value and '>' not in value
+            and '\n' not in value and '\t' not in value and '\r' not in value):
+        rest = value.partition('://')[2]
+        if rest and rest[0] not in '/?#':
+            return None
+    bad = _BAD_URL_CHARS.search(value)
+    if bad:
+        if bad.group() in '<>':
+            return 'contains HTML (paste the iframe src, not the iframe)'
+        return 'contains whitespace'
+    parts = urlsplit(value)
+    if parts.scheme not in ('http', 'https'):
+        return f'scheme must be http or https, not {parts.scheme or "missing"!r}'
+    if not parts.netloc:
+        return 'has no host'
+    return None
+
+
+def validate_config(config, duplicate_keys=()):
+    """Return a list of Issues found in a parsed config."""
+    issues = []
+    error = lambda path, message: issues.append(Issue(ERROR, path, message))
+    warning = lambda path, message: issues.append(Issue(WARNING, path, message))
+
+    if not isinstance(config, dict):
+        error('$', 'top level must be an object')
+        return issues
+
+    for key in duplicate_keys:
+        error('$', f'duplicate key {key!r}')
+
+    if 'themes' not in config:
+        # Old format: a flat mapping of page name -> map urls
+        for page_name, page in config.items():
+            _check_embeds(page, f'$.{page_name}', error, warning)
+        return issues
+
+    themes = config.get('themes')
+    indicators = config.get('indicators', {})
+    groups = config.get('themeGroups', [])
+    if not isinstance(themes, list):
+        error('$.themes', 'must be a list')
+        themes = []
+    if not isinstance(indicators, dict):
+        error('$.indicators', 'must be an object')
+        indicators = {}
+    if not isinstance(groups, list):
+        error('$.themeGroups', 'must be a list')
+        groups = []
+
+    theme_ids = set()
+    subtheme_ids = set()
+    referenced = set()
+
+    for ti, theme in enumerate(themes):
+        path = f'$.themes[{ti}]'
+        if not isinstance(theme, dict):
+            error(path, 'must be an object')
+            continue
+        theme_id = theme.get('id')
+        if not theme_id:
+            error(path, 'missing "id"')
+        elif not isinstance(theme_id, str):
+            error(path, '"id" must be a string')
+        elif theme_id in theme_ids:
+            error(path, f'duplicate theme id {theme_id!r}')
+        else:
+            theme_ids.add(theme_id)
+        if not theme.get('name'):
+            warning(path, 'missing "name"')
+
+        subthemes = theme.get('subthemes', [])
+        if not isinstance(subthemes, list):
+            error(f'{path}.subthemes', 'must be a list')
+            continue
+        if not subthemes:
+            warning(path, f'theme {theme_id!r} has no subthemes')
+        for si, subtheme in enumerate(subthemes):
+            sub_path = f'{path}.subthemes[{si}]'
+            if not isinstance(subtheme, dict):
+                error(sub_path, 'must be an object')
+                continue
+            subtheme_id = subtheme.get('id')
+            if not subtheme_id:
+                error(sub_path, 'missing "id"')
+            elif not isinstance(subtheme_id, str):
+                error(sub_path, '"id" must be a string')
+            elif subtheme_id in subtheme_ids:
+                error(sub_path, f'duplicate subtheme id {subtheme_id!r}')
+            else:
+                subtheme_ids.add(subtheme_id)
+
+            indicator_ids = subtheme.get('indicators', [])
+            if not isinstance(indicator_ids, list):
+                error(f'{sub_path}.indicators', 'must be a list')
+                continue
+            seen = set()
+            for ii, indicator_id in enumerate(indicator_ids):
+                if not isinstance(indicator_id, str):
+                    error(f'{sub_path}.indicators[{ii}]', 'must be an indicator id string')
+                    continue
+                if indicator_id not in indicators:
+                    error(f'{sub_path}.indicators[{ii}]', f'unknown indicator {indicator_id!r}')
+                if indicator_id in seen:
+                    warning(f'{sub_path}.indicators[{ii}]', f'indicator {indicator_id!r} listed twice')
+                seen.add(indicator_id)
+            referenced.update(seen)
+
+    group_ids = set()
+    for gi, group in enumerate(groups):
+        path = f'$.themeGroups[{gi}]'
+        if not isinstance(group, dict):
+            error(path, 'must be an object')
+            continue
+        group_id = group.get('id')
+        if not group_id:
+            error(path, 'missing "id"')
+        elif not isinstance(group_id, str):
+            error(path, '"id" must be a string')
+        elif group_id in group_ids:
+            error(path, f'duplicate theme group id {group_id!r}')
+        else:
+            group_ids.add(group_id)
+        group_theme_ids = group.get('themeIds', [])
+        if not isinstance(group_theme_ids, list):
+            error(f'{path}.themeIds', 'must be a list')
+            continue
+        if not group_theme_ids:
+            warning(path, f'theme group {group_id!r} has no themes')
+        for ri, theme_id in enumerate(group_theme_ids):
+            if not isinstance(theme_id, str):
+                error(f'{path}.themeIds[{ri}]', 'must be a theme id string')
+            elif theme_id not in theme_ids:
+                error(f'{path}.themeIds[{ri}]', f'unknown theme {theme_id!r}')
+
+    for indicator_id, indicator in indicators.items():
+        path = f'$.indicators.{indicator_id}'
+        if not isinstance(indicator, dict):
+            error(path, 'must be an object')
+            continue
+        if indicator_id not in referenced:
+            warning(path, 'orphan indicator: not listed in any subtheme')
+        if not indicator.get('title'):
+            warning(path, 'missing "title"')
+        icon = indicator.get('icon', '')
+        if icon in ('', 'icon-'):
+            warning(path, 'missing "icon"')
+        _check_embeds(indicator, path, error, warning)
+
+    return issues
+
+
+def _check_embeds(page, path, error, warning):
+    if not isinstance(page, dict):
+        error(path, 'must be an object')
+        return
+    map1_url = page.get('map1_url', '')
+    map2_url = page.get('map2_url', '')
+    for key, value in (('map1_url', map1_url), ('map2_url', map2_url)):
+        if not isinstance(value, str):
+            error(f'{path}.{key}', 'must be a string')
+        elif value:
+            problem = check_url(value)
+            if problem:
+                error(f'{path}.{key}', problem)
+    if not map1_url:
+        if map2_url:
+            # The viewer only loads map2 once map1 has a URL
+            error(f'{path}.map1_url', 'empty but map2_url is set; map2 can never be shown')
+        else:
+            warning(f'{path}.map1_url', 'empty; the page will show the placeholder')
+
+
+def errors(issues):
+    return [issue for issue in issues if issue.level == ERROR]
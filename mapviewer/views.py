@@ -1,16 +1,33 @@
 import json
+import logging
 import os
+import threading
+import time
 from django.conf import settings
-from django.http import JsonResponse, Http404
+from django.http import HttpRequest, HttpResponse, HttpResponsePermanentRedirect, JsonResponse, Http404
 from django.shortcuts import render
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
-def load_map_config():
-    config_path = os.path.join(settings.BASE_DIR, 'map_config.json')
-    try:
-        with open(config_path, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+from . import store
+from .aliases import catalogue_aliases
+from .cache_policy import cache_headers, fragment_keys, page_keys
+from .catalogue import DEFAULT_CATALOGUE, NO_EMBED_HINTS, EmbedHints, embed_origin, get_catalogue
+from .chunks import chunk_set
+from .encoded import EncodedBody, ResponseCache, encoded_response
+from .middleware import get_processor
+from .singleflight import SingleFlight
+from .telemetry import collector, parse_beacon
+
+logger = logging.getLogger(__name__)
+
+# Stands in for the indicator ID in the fragment URL handed to the page
+FRAGMENT_PLACEHOLDER = '__indicator__'
+
+def load_map_config(catalogue=None):
+    """Return the parsed map config from the current catalogue snapshot."""
+    return get_catalogue(catalogue).config
 
 def get_flattened_indicators(config):
     """Convert the hierarchical structure to a flat dictionary for backward compatibility."""
@@ -30,95 +47,344 @@ def get_indicator_details(config, indicator_id):
         return config['indicators'][indicator_id]
     return config.get(indicator_id)  # For old config format
 
-def map_view(request, page_name='default'):
-    config = load_map_config()
-    
+def map_view(request, page_name='default', catalogue=None):
     # Get theme group from query string if provided
     theme_group_id = request.GET.get('theme_group')
-    theme_ids_to_include = None
-    
-    # If theme group is specified, get the list of theme IDs to include
-    if theme_group_id and 'themeGroups' in config:
-        for group in config['themeGroups']:
-            if group['id'] == theme_group_id:
-                theme_ids_to_include = set(group['themeIds'])
-                print(f"Theme group '{theme_group_id}' found. Including themes: {theme_ids_to_include}")
-                break
-        else:
-            print(f"Theme group '{theme_group_id}' not found in config")
+
+    # The database store only holds the default catalogue. The ID aliases
+    # and the other embed hosts to prefetch still come from the JSON
+    # snapshot, so db mode needs MAP_CONFIG_PATH too
+    if getattr(settings, 'MAP_CATALOGUE_BACKEND', 'json') == 'db' and not catalogue:
+        redirect = alias_redirect(request, get_catalogue(), page_name)
+        if redirect is not None:
+            return redirect
+        page = store.load_page(page_name, theme_group_id)
+        if page is None:
+            raise Http404("Indicator not found")
+        page_config = page['page_config']
+        embed_hints = EmbedHints(embed_origin(page_config.get('map1_url')), embed_origin(page_config.get('map2_url')))
+        response = render_map(request, page_name, page['theme_group'], page_config,
+                              page['themes'], page['indicators'], page['current_theme'], embed_hints,
+                              get_catalogue().other_hosts(embed_hints))
+        return with_headers(response, cache_headers('page', page_keys(page['theme_group'], page['page_id'])))
+
+    try:
+        catalogue = get_catalogue(catalogue)
+    except KeyError:
+        raise Http404("Catalogue not found")
+    redirect = alias_redirect(request, catalogue, page_name)
+    if redirect is not None:
+        return redirect
+    return catalogue_page(request, catalogue, page_name, theme_group_id)
+
+# Query parameters of deep links that hold IDs, and the kind of ID
+ID_PARAMS = (('theme', 'themes'), ('subtheme', 'subthemes'), ('indicator', 'indicators'))
+
+def alias_redirect(request, catalogue, page_name):
+    """A cacheable 301 from a link with old (renamed) IDs to the current ones, or None."""
+    aliases = catalogue_aliases(catalogue)
+    if not aliases:
+        return None
+    keys = []
+    new_page = None
+    if page_name not in catalogue.indicators:
+        new_page = aliases.resolve('indicators', page_name)
+        if new_page is not None:
+            keys.append(f'indicator:{page_name}')
+    query = request.GET.copy()
+    for param, kind in ID_PARAMS:
+        value = query.get(param)
+        new_value = value and aliases.resolve(kind, value)
+        if new_value and not (kind == 'indicators' and value in catalogue.indicators) and not (
+                kind == 'themes' and value in catalogue.themes_by_id):
+            query[param] = new_value
+            keys.append(f'{kind[:-1]}:{value}')
+    if not keys:
+        return None
+    if new_page is None:
+        url = request.path
+    elif catalogue.name != DEFAULT_CATALOGUE:
+        url = reverse('catalogue_map_view_with_page', args=[catalogue.name, new_page])
+    else:
+        url = reverse('map_view_with_page', args=[new_page])
+    if query:
+        url = f'{url}?{query.urlencode()}'
+    return with_headers(HttpResponsePermanentRedirect(url), cache_headers('redirect', keys, catalogue.name))
+
+def catalogue_page(request, catalogue, page_name, theme_group_id=None, best=False):
+    """A map page from a catalogue snapshot, served from its response cache when possible."""
+    if theme_group_id and catalogue.has_themes and theme_group_id not in catalogue.theme_groups:
+        logger.warning('Theme group %s not found in config', theme_group_id)
+        theme_group_id = None
     
     # Handle both old and new config formats
-    if 'themes' in config:  # New format with themes
-        indicators = config.get('indicators', {})
+    if catalogue.has_themes:  # New format with themes
+        indicators = catalogue.indicators
         
         # If no specific page is requested, use the first available indicator
         if page_name == 'default' and indicators:
-            first_indicator = next(iter(indicators.values()))
-            page_config = first_indicator
+            page_config = indicators[catalogue.default_indicator_id]
         else:
             page_config = indicators.get(page_name)
             if not page_config:
                 raise Http404("Indicator not found")
         
-        # Pre-process themes to include indicator data
-        themes = []
-        for theme in config.get('themes', []):
-            # Skip themes not in the selected theme group (if a group was specified)
-            if theme_ids_to_include is not None and theme['id'] not in theme_ids_to_include:
-                print(f"Skipping theme {theme['id']} as it's not in the selected group")
-                continue
-                
-            theme_data = theme.copy()
-            theme_data['subthemes'] = []
-            
-            for subtheme in theme.get('subthemes', []):
-                subtheme_data = subtheme.copy()
-                subtheme_data['indicator_items'] = []
-                
-                for indicator_id in subtheme.get('indicators', []):
-                    if indicator_id in indicators:
-                        indicator_data = indicators[indicator_id].copy()
-                        indicator_data['id'] = indicator_id
-                        subtheme_data['indicator_items'].append(indicator_data)
-                
-                theme_data['subthemes'].append(subtheme_data)
-            
-            themes.append(theme_data)
+        # Themes come pre-processed with their indicator data
+        themes = catalogue.themes_for_group(theme_group_id)
     else:  # Old format
-        if page_name not in config:
+        if page_name not in catalogue.indicators:
             raise Http404("Page not found")
-        page_config = config[page_name]
+        page_config = catalogue.indicators[page_name]
         themes = []
-        indicators = config
+        indicators = catalogue.indicators
     
     if not page_config:
         raise Http404("Indicator not found")
     
     # Find the current theme for the indicator
-    current_theme = None
-    for theme in themes:
-        for subtheme in theme.get('subthemes', []):
-            if page_name in subtheme.get('indicators', []):
-                current_theme = theme
-                break
-        if current_theme:
-            break
+    current_theme = catalogue.theme_for_indicator(page_name, theme_group_id)
+    
+    # Hint the embed hosts of the map the page will actually show
+    shown = request.GET.get('indicator') or (catalogue.default_indicator_id if page_name == 'default' else page_name)
+    embed_hints = catalogue.hints_for(shown)
     
-    # Update page config with theme info
+    # The page only depends on the shown indicator through its hints
+    page_id = catalogue.default_indicator_id if page_name == 'default' else page_name
+    return cached_response(
+        request, catalogue, ('page', page_name, theme_group_id, embed_hints),
+        lambda: render_map(request, page_name, theme_group_id, page_config, themes, indicators, current_theme,
+                           embed_hints, catalogue.other_hosts(embed_hints), catalogue.name,
+                           chunk_urls(catalogue, theme_group_id) if catalogue.has_themes else None),
+        best=best,
+        policy=('page', page_keys(theme_group_id, page_id)),
+    )
+
+def render_map(request, page_name, theme_group_id, page_config, themes, indicators, current_theme,
+               embed_hints=NO_EMBED_HINTS, prefetch_hosts=(), catalogue_name=None, chunk_urls=None):
+    # Update page config with theme info (without touching the shared snapshot)
     if current_theme:
-        page_config['theme'] = current_theme['id']
+        page_config = dict(page_config, theme=current_theme['id'])
     
     context = {
         'map1_url': page_config.get('map1_url', ''),
         'map2_url': page_config.get('map2_url', ''),
         'page_name': page_name,
+        'theme_group': theme_group_id,
         'themes': themes,
         'current_theme': current_theme,  # Add current theme to context
         'indicators': {
             'all': indicators,  # All indicators for the dropdown (flattened)
             'page_name': page_config  # Current page configuration
         },
-        'page_config': page_config  # For backward compatibility
+        'page_config': page_config,  # For backward compatibility
+        'embed_hints': embed_hints,
+        'prefetch_hosts': prefetch_hosts,
+        'defer_map2': getattr(settings, 'MAP_DEFER_SECOND_MAP', True),
+        'catalogue_name': catalogue_name,
+        'fragment_url': fragment_url(catalogue_name),
+        # Without chunks the menu data of every indicator is inlined
+        'chunk_urls': chunk_urls,
+        'telemetry_url': telemetry_url(catalogue_name),
     }
     
     return render(request, 'mapviewer/map.html', context)
+
+def fragment_url(catalogue_name=None):
+    """URL of the indicator fragments of a catalogue, with FRAGMENT_PLACEHOLDER for the ID."""
+    if catalogue_name and catalogue_name != DEFAULT_CATALOGUE:
+        return reverse('regional_indicator_fragment', args=[catalogue_name, FRAGMENT_PLACEHOLDER])
+    return reverse('indicator_fragment', args=[FRAGMENT_PLACEHOLDER])
+
+def chunk_urls(catalogue, theme_group_id=None):
+    """URLs of the indicator chunks a page of a theme group loads."""
+    if catalogue.name and catalogue.name != DEFAULT_CATALOGUE:
+        return [reverse('regional_indicator_chunk', args=[catalogue.name, chunk])
+                for chunk in chunk_set(catalogue).for_scope(theme_group_id)]
+    return [reverse('indicator_chunk', args=[chunk]) for chunk in chunk_set(catalogue).for_scope(theme_group_id)]
+
+def telemetry_url(catalogue_name=None):
+    """Where a page sends its timing beacons, or None with telemetry turned off."""
+    if not getattr(settings, 'MAP_TELEMETRY', False):
+        return None
+    if catalogue_name and catalogue_name != DEFAULT_CATALOGUE:
+        return reverse('regional_telemetry_beacon', args=[catalogue_name])
+    return reverse('telemetry_beacon')
+
+def fragment_payload(fragment):
+    return json.dumps(fragment, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def catalogue_json(request, catalogue=None):
+    """The whole catalogue config as JSON."""
+    try:
+        catalogue = get_catalogue(catalogue)
+    except KeyError:
+        raise Http404("Catalogue not found")
+    return cached_response(request, catalogue, ('json',), lambda: HttpResponse(
+        json.dumps(catalogue.config, default=dict, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+        content_type='application/json',
+    ), policy=('catalogue', ['catalogue']))
+
+def indicator_json(request, indicator_id, catalogue=None):
+    """One indicator's config as JSON."""
+    try:
+        catalogue = get_catalogue(catalogue)
+    except KeyError:
+        raise Http404("Catalogue not found")
+    indicator = catalogue.indicators.get(indicator_id) if catalogue.has_themes else None
+    if indicator is None:
+        raise Http404("Indicator not found")
+    return cached_response(request, catalogue, ('indicator', indicator_id), lambda: HttpResponse(
+        indicator.payload, content_type='application/json',
+    ), policy=('indicator', [f'indicator:{indicator_id}']))
+
+def indicator_fragment(request, indicator_id, catalogue=None):
+    """The parts of a map page that change with the indicator, as JSON."""
+    try:
+        catalogue = get_catalogue(catalogue)
+    except KeyError:
+        raise Http404("Catalogue not found")
+    fragment = catalogue.fragment(indicator_id)
+    if fragment is None:
+        raise Http404("Indicator not found")
+    return cached_response(request, catalogue, ('fragment', indicator_id), lambda: HttpResponse(
+        fragment_payload(fragment), content_type='application/json',
+    ), policy=('fragment', fragment_keys(fragment)))
+
+# Renders of the same response, one at a time; concurrent misses share it
+render_flights = SingleFlight()
+
+def indicator_chunk(request, chunk, catalogue=None):
+    """A content-hashed script with the menu data of a group of indicators."""
+    try:
+        catalogue = get_catalogue(catalogue)
+    except KeyError:
+        raise Http404("Catalogue not found")
+    body = chunk_set(catalogue).bodies.get(chunk)
+    if body is None:
+        raise Http404("Chunk not found")
+    return cached_response(request, catalogue, ('chunk', chunk), lambda: HttpResponse(
+        body, content_type='text/javascript; charset=utf-8',
+    ), policy=('chunk', []))
+
+@csrf_exempt
+@require_POST
+def telemetry_beacon(request, catalogue=None):
+    """Collect a batch of client timings sent with navigator.sendBeacon."""
+    if not getattr(settings, 'MAP_TELEMETRY', False):
+        raise Http404("Telemetry is turned off")
+    try:
+        catalogue = get_catalogue(catalogue)
+    except KeyError:
+        raise Http404("Catalogue not found")
+    if len(request.body) > getattr(settings, 'MAP_TELEMETRY_MAX_BYTES', 16 * 1024):
+        return HttpResponse(status=413)
+    # Beacons of strings come as text/plain, so the content type isn't checked
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return HttpResponse(status=400)
+    for metric, dimension, key, ms in parse_beacon(payload, catalogue):
+        collector.record(catalogue.name or DEFAULT_CATALOGUE, metric, dimension, key, ms)
+    return HttpResponse(status=204)
+
+def response_cache(catalogue):
+    """The catalogue snapshot's cache of encoded responses, or None if it is turned off."""
+    max_bytes = getattr(settings, 'MAP_RESPONSE_CACHE_BYTES', 0)
+    if not max_bytes:
+        return None
+    # Kept on the snapshot, so a reload starts with an empty cache
+    cache = catalogue.cache.get('responses')
+    if cache is None:
+        cache = catalogue.cache.setdefault('responses', ResponseCache(max_bytes))
+    return cache
+
+def with_headers(response, headers):
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+def cached_response(request, catalogue, key, build, best=False, policy=None):
+    """
+    Serve ``key`` from the catalogue's response cache, calling ``build`` on a miss.
+
+    A successful response from ``build`` is post-processed (HTML) and
+    encoded once; after that every request for the key just picks the
+    stored bytes for its Accept-Encoding. Concurrent misses for a key wait
+    for one build (``render_flights``), or with ``MAP_SERVE_STALE`` get the
+    previous snapshot's copy meanwhile. With the cache off, concurrent
+    requests still share one build, each getting its own response. ``policy`` is a ``(kind, surrogate
+    keys)`` pair for the cache headers (see ``cache_policy``).
+    """
+    cache = response_cache(catalogue)
+    if cache is None:
+        # Nothing is kept, but concurrent requests still share one build
+        built = []
+
+        def build_once():
+            response = build()
+            built.append(response)
+            return response.status_code, response.content, dict(response.items())
+
+        status, content, headers = render_flights.do((catalogue.name, catalogue.version, key), build_once)
+        if built:
+            response = built[0]
+        elif status == 200:
+            response = HttpResponse(content, status=status, headers=headers)
+        else:
+            response = build()
+        if policy and response.status_code == 200:
+            with_headers(response, cache_headers(*policy, catalogue.name))
+        return response
+    body = cache.get(key)
+    if body is None:
+        built = []
+
+        def miss():
+            response = build()
+            built.append(response)
+            if response.status_code != 200:
+                return None
+            content_type = response['Content-Type']
+            data = response.content
+            if content_type.startswith('text/html') and getattr(settings, 'HTML_POSTPROCESS', True):
+                data = get_processor(catalogue).process(data.decode(response.charset)).html.encode(response.charset)
+            headers = cache_headers(*policy, catalogue.name) if policy else None
+            return cache.put(key, EncodedBody(data, content_type, best=best, headers=headers))
+
+        stale = catalogue.cache.get('stale_responses')
+        if stale is not None and time.monotonic() > stale[1]:
+            catalogue.cache.pop('stale_responses', None)
+            stale = None
+        body = render_flights.do(
+            (catalogue.name, catalogue.version, key), miss,
+            stale=(lambda: stale[0].get(key)) if stale is not None else None,
+        )
+        if body is None:
+            # Error responses aren't shared; a caller that waited builds its own
+            return built[0] if built else build()
+    return encoded_response(request, body)
+
+def prewarm_responses(catalogue):
+    """Render and encode the landing page of every theme group of a catalogue."""
+    if response_cache(catalogue) is None or not catalogue.has_themes:
+        return
+    for group_id in [None] + list(catalogue.theme_groups):
+        request = HttpRequest()
+        request.method = 'GET'
+        try:
+            catalogue_page(request, catalogue, 'default', group_id, best=True)
+        except Exception:
+            logger.exception('Could not prewarm %s page for theme group %s', catalogue.name, group_id)
+    logger.info('Prewarmed %d responses for catalogue %s', len(response_cache(catalogue)), catalogue.name)
+
+def keep_stale_responses(sender, catalogue, previous=None, **kwargs):
+    """Let a new snapshot serve its predecessor's responses for a while as it renders its own."""
+    seconds = getattr(settings, 'MAP_SERVE_STALE', 0)
+    stale = previous.cache.get('responses') if previous is not None and seconds else None
+    if stale is not None:
+        catalogue.cache['stale_responses'] = (stale, time.monotonic() + seconds)
+
+def prewarm_on_publish(sender, catalogue, **kwargs):
+    """Prewarm a newly published catalogue in the background."""
+    if getattr(settings, 'MAP_PREWARM_RESPONSES', False):
+        threading.Thread(target=prewarm_responses, args=(catalogue,), name='prewarm', daemon=True).start()
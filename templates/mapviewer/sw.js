@@ -0,0 +1,99 @@
+// Service worker generated by `manage.py export_to_gh_pages`. Do not edit.
+//
+// The page shell, styles, fonts and catalogue are precached and served
+// cache-first; the cache name carries a hash of the precache manifest, so a
+// new export installs a fresh cache and the old one is deleted on activate.
+// WordPress REST responses are served stale-while-revalidate.
+const VERSION = '{{ version }}';
+const PRECACHE = 'ecoscapes-precache-' + VERSION;
+const RUNTIME = 'ecoscapes-wp-' + VERSION;
+const CACHE_PREFIX = 'ecoscapes-';
+const PRECACHE_MANIFEST = {{ manifest|safe }};
+
+const scopeUrl = new URL(self.registration.scope);
+const precacheUrls = new Set(
+    PRECACHE_MANIFEST.map(entry => new URL(entry.url, scopeUrl).href)
+);
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(PRECACHE)
+            .then(cache => cache.addAll(
+                // Bypass the HTTP cache so we never precache a stale file
+                PRECACHE_MANIFEST.map(entry => new Request(new URL(entry.url, scopeUrl).href, {cache: 'reload'}))
+            ))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(
+                keys
+                    .filter(key => key.startsWith(CACHE_PREFIX) && key !== PRECACHE && key !== RUNTIME)
+                    .map(key => caches.delete(key))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+function pageShellUrl(url) {
+    // Indicator deep links are the same shell with a query string
+    const shell = new URL(url.href);
+    shell.search = '';
+    shell.hash = '';
+    if (shell.pathname.endsWith('/')) shell.pathname += 'index.html';
+    return shell.href;
+}
+
+function cacheFirst(request, key) {
+    return caches.open(PRECACHE).then(cache =>
+        cache.match(key).then(cached => cached || fetch(request))
+    );
+}
+
+function staleWhileRevalidate(request) {
+    return caches.open(RUNTIME).then(cache =>
+        cache.match(request).then(cached => {
+            const network = fetch(request).then(response => {
+                if (response.ok) cache.put(request, response.clone());
+                return response;
+            });
+            if (cached) {
+                network.catch(() => {});
+                return cached;
+            }
+            return network;
+        })
+    );
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+
+    if (url.pathname.includes('/wp-json/')) {
+        event.respondWith(staleWhileRevalidate(request));
+        return;
+    }
+    if (url.origin !== scopeUrl.origin) return;
+
+    // Indicator fragments: instant on revisits, refreshed in the background
+    if (url.pathname.includes('/fragment/')) {
+        event.respondWith(staleWhileRevalidate(request));
+        return;
+    }
+
+    if (request.mode === 'navigate') {
+        const shell = pageShellUrl(url);
+        if (precacheUrls.has(shell)) {
+            event.respondWith(cacheFirst(request, shell));
+        }
+        return;
+    }
+    if (precacheUrls.has(url.href)) {
+        event.respondWith(cacheFirst(request, url.href));
+    }
+});